@@ -0,0 +1,72 @@
+import argparse
+import sqlite3
+import sys
+from collections import Counter, defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from weibo_hot.endpoints import endpoint_kind  # noqa: E402
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(conn: sqlite3.Connection, session: str) -> None:
+    rows = conn.execute(
+        "SELECT writer, url, sent_at, latency, status, error, raw_length FROM archive_events WHERE session=?",
+        (session,),
+    ).fetchall()
+    writers = {row[0] for row in rows}
+    duration = max((row[2] + row[3] for row in rows), default=0.0)
+    outcomes = Counter(row[5] or str(row[4]) for row in rows)
+    print(f"session {session}: {len(rows)} events, {len(writers)} writer(s), {duration:.1f}s")
+    print("  outcomes: " + ", ".join(f"{k}={v}" for k, v in sorted(outcomes.items())))
+    by_kind = defaultdict(list)
+    for row in rows:
+        by_kind[endpoint_kind(row[1]) or "other"].append(row)
+    print(f"  {'endpoint':<10} {'events':>7} {'lat p50':>8} {'lat p95':>8} {'KB p50':>8} {'KB p95':>8} {'KB max':>8}")
+    for kind, kind_rows in sorted(by_kind.items()):
+        latency = [row[3] for row in kind_rows]
+        size = [row[6] / 1024 for row in kind_rows]
+        print(
+            f"  {kind:<10} {len(kind_rows):>7} {percentile(latency, 0.5):>8.3f} {percentile(latency, 0.95):>8.3f} "
+            f"{percentile(size, 0.5):>8.1f} {percentile(size, 0.95):>8.1f} {max(size):>8.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List recorded sessions in a response archive")
+    parser.add_argument("--archive", default="archive", help="ARCHIVE_DIR of the recording")
+    parser.add_argument("--session", action="append", help="Only these sessions (repeatable)")
+    parser.add_argument("--delete", action="store_true", help="Delete the given sessions' event logs instead")
+    args = parser.parse_args()
+
+    index = Path(args.archive) / "index.sqlite"
+    if not index.exists():
+        raise SystemExit(f"no archive index at {index}")
+    conn = sqlite3.connect(str(index))
+    try:
+        sessions = args.session or [row[0] for row in conn.execute("SELECT DISTINCT session FROM archive_events")]
+        if args.delete:
+            if not args.session:
+                raise SystemExit("--delete needs --session")
+            with conn:
+                for session in sessions:
+                    n = conn.execute("DELETE FROM archive_events WHERE session=?", (session,)).rowcount
+                    print(f"deleted {n} events of session {session}")
+            return
+        if not sessions:
+            print("no recorded sessions")
+        for session in sessions:
+            summarize(conn, session)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -17,11 +17,7 @@ def load_trends(path: Path):
             key = obj.get("keyword")
             if not key:
                 continue
-            trends[key] = {
-                "trend_first_time": obj.get("trend_first_time"),
-                "trend_last_time": obj.get("trend_last_time"),
-                "trend_duration_days": obj.get("trend_duration_days"),
-            }
+            trends[key] = {k: v for k, v in obj.items() if k.startswith("trend_")}
     return trends
 
 
@@ -50,13 +46,9 @@ def main():
                 continue
             key = obj.get("keyword")
             if key in trends:
-                t = trends[key]
-                if obj.get("trend_first_time") in (None, ""):
-                    obj["trend_first_time"] = t.get("trend_first_time")
-                if obj.get("trend_last_time") in (None, ""):
-                    obj["trend_last_time"] = t.get("trend_last_time")
-                if obj.get("trend_duration_days") in (None, ""):
-                    obj["trend_duration_days"] = t.get("trend_duration_days")
+                for field, value in trends[key].items():
+                    if obj.get(field) in (None, ""):
+                        obj[field] = value
             fout.write(json.dumps(obj, ensure_ascii=False) + "\n")
 
 
@@ -0,0 +1,154 @@
+import argparse
+import base64
+import json
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad, unpad
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from weibo_hot.codec import AES_KEY, PayloadCodec, decode  # noqa: E402
+from weibo_hot.codec import loads as decode_plain  # noqa: E402
+
+
+def make_body(points: int) -> bytes:
+    start = datetime(2024, 1, 1)
+    data = [
+        {"name": "话题", "value": [(start + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"), i % 50 + 1]}
+        for i in range(points)
+    ]
+    raw = json.dumps({"code": 1, "data": data}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    ct = AES.new(AES_KEY, AES.MODE_ECB).encrypt(pad(raw, 16))
+    return b'"' + base64.b64encode(ct) + b'"'
+
+
+def legacy_decode(body: bytes):
+    # What the spiders did before weibo_hot.codec: str round trip + json.
+    text = body.decode("utf-8").strip()
+    if text.startswith('"') and text.endswith('"'):
+        text = text[1:-1]
+    pt = unpad(AES.new(AES_KEY, AES.MODE_ECB).decrypt(base64.b64decode(text)), 16)
+    return json.loads(pt.decode("utf-8", "ignore"))
+
+
+def count_points(plaintext) -> int:
+    # Stand-in for a reducer that summarises the payload inside the worker.
+    return len(decode_plain(plaintext)["data"])
+
+
+def throughput(fn, body: bytes, min_seconds: float) -> float:
+    n = 0
+    t0 = time.perf_counter()
+    while True:
+        fn(body)
+        n += 1
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_seconds:
+            return n * len(body) / elapsed
+
+
+def reactor_stall(pool: str, bodies, tick: float) -> dict:
+    """Decode bodies while a heartbeat runs; report the worst heartbeat delay."""
+    from twisted.internet import defer, reactor, task
+
+    pool, _, reduce = pool.partition("+")
+    reduce = count_points if reduce else None
+    codec = PayloadCodec(pool=pool, offload_bytes=0)
+    lateness = []
+    last = [time.perf_counter()]
+
+    def beat():
+        now = time.perf_counter()
+        lateness.append(now - last[0] - tick)
+        last[0] = now
+
+    loop = task.LoopingCall(beat)
+    result = {}
+
+    @defer.inlineCallbacks
+    def run():
+        loop.start(tick, now=True)
+        t0 = time.perf_counter()
+        # Arrive one by one, as responses do, instead of all at once.
+        pending = []
+        for body in bodies:
+            d = codec.decode_deferred(body, reduce)
+            # Drop results as they arrive, like a callback would.
+            d.addCallback(lambda _: None)
+            pending.append(d)
+            yield task.deferLater(reactor, tick, lambda: None)
+        yield defer.gatherResults(pending, consumeErrors=True)
+        result["seconds"] = time.perf_counter() - t0
+        loop.stop()
+        codec.close()
+
+    def stop(_):
+        reactor.stop()
+        return _
+
+    reactor.callWhenRunning(lambda: run().addBoth(stop))
+    reactor.run()
+    lateness.sort()
+    result["max_stall_ms"] = round(max(lateness) * 1000, 1)
+    result["p99_stall_ms"] = round(lateness[int(len(lateness) * 0.99)] * 1000, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark of payload decoding and reactor stall")
+    parser.add_argument("--points", default="1000,20000,100000", help="Minute points per synthetic superInfo payload")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Min time per throughput measurement")
+    parser.add_argument("--stall-payloads", type=int, default=20, help="Large payloads decoded during the stall test")
+    parser.add_argument("--pool", default="off,process,process+reduce",
+        help="Pools to compare in the stall test; +reduce summarises inside the worker",)
+    parser.add_argument("--tick", type=float, default=0.005, help="Heartbeat interval (seconds)")
+    parser.add_argument("--stall-child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stall_child:
+        body = make_body(int(args.points))
+        print(json.dumps(reactor_stall(args.stall_child, [body] * args.stall_payloads, args.tick)))
+        return
+
+    sizes = [int(p) for p in args.points.split(",") if p]
+    bodies = {points: make_body(points) for points in sizes}
+    print(f"{'points':>8} {'body KB':>9} {'legacy MB/s':>12} {'codec MB/s':>11} {'speedup':>8}")
+    for points, body in bodies.items():
+        assert decode(body) == legacy_decode(body)
+        old = throughput(legacy_decode, body, args.seconds)
+        new = throughput(decode, body, args.seconds)
+        print(f"{points:>8} {len(body) / 1024:>9.0f} {old / 1e6:>12.1f} {new / 1e6:>11.1f} {new / old:>7.2f}x")
+
+    # The reactor can only run once per process, so each pool gets a child.
+    largest = max(sizes)
+    print(f"\nreactor stall while decoding {args.stall_payloads} x {largest}-point payloads")
+    print(f"{'pool':>15} {'max ms':>8} {'p99 ms':>8} {'total s':>8}")
+    for pool in [p for p in args.pool.split(",") if p]:
+        out = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--stall-child",
+                pool,
+                "--points",
+                str(largest),
+                "--stall-payloads",
+                str(args.stall_payloads),
+                "--tick",
+                str(args.tick),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        r = json.loads(out)
+        print(f"{pool:>15} {r['max_stall_ms']:>8} {r['p99_stall_ms']:>8} {r['seconds']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
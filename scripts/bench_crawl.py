@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+SPIDERS = ["weibo_total", "weibo_list", "weibo_trend"]
+
+# Higher is better for these; everything else is lower-is-better.
+HIGHER_IS_BETTER = {"items_per_sec", "requests_per_sec"}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 15.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except Exception:
+            time.sleep(0.1)
+    raise SystemExit(f"mock server did not come up at {url}")
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_child(args) -> None:
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    os.chdir(ROOT)
+    settings = get_project_settings()
+    settings.set("HOTENGINE_BASE_URL", args.base_url)
+    settings.set("FEEDS", {args.output: {"format": "jsonlines", "encoding": "utf8", "overwrite": True}})
+    # Every piece of crawl state lives in the workdir, so runs start cold and
+    # never touch the real cache, ledger or spill files.
+    state = {
+        "TREND_CACHE_PATH": "trend_cache.sqlite",
+        "RETRY_QUEUE_PATH": "retry_queue.sqlite",
+        "LEDGER_PATH": "crawl_ledger.sqlite",
+        "PENDING_SPILL_PATH": "pending_spill.jsonl",
+        "FAILED_URLS_PATH": "failed_urls.txt",
+        "ARCHIVE_DIR": "archive",
+        "RATE_LIMIT_DIR": "ratelimit",
+    }
+    for key, name in state.items():
+        settings.set(key, os.path.join(args.workdir, name))
+    settings.set("WORK_QUEUE_PATH", "")
+    settings.set("JOBDIR", None)
+    # Measure the crawler, not the politeness delays; --set can put them back.
+    for key in ("DOWNLOAD_DELAY", "LIST_DELAY", "TREND_DELAY"):
+        settings.set(key, 0)
+    settings.set("AUTOTHROTTLE_ENABLED", False)
+    settings.set("LOG_LEVEL", "WARNING")
+    settings.set("TELNETCONSOLE_ENABLED", False)
+    for kv in args.set or []:
+        key, _, value = kv.partition("=")
+        settings.set(key, value)
+
+    kwargs = {}
+    if args.child in ("weibo_total", "weibo_list"):
+        kwargs = {"start_date": args.start, "end_date": args.end}
+    elif args.child == "weibo_trend":
+        kwargs = {"keywords_file": args.keywords}
+
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(args.child)
+    process.crawl(crawler, **kwargs)
+    process.start()
+
+    stats = crawler.stats.get_stats()
+    result = {
+        "elapsed": float(stats.get("elapsed_time_seconds") or 0.0),
+        "items": int(stats.get("item_scraped_count", 0)),
+        "requests": int(stats.get("downloader/request_count", 0)),
+        "finish_reason": stats.get("finish_reason"),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "backoff_pauses": int(stats.get("backoff/pauses", 0)),
+    }
+    Path(args.result).write_text(json.dumps(result), encoding="utf-8")
+
+
+def bench_spider(spider: str, args, base_url: str, workdir: Path, keywords: Path) -> dict:
+    result_path = workdir / f"{spider}.result.json"
+    cmd = [
+        sys.executable,
+        __file__,
+        "--child",
+        spider,
+        "--base-url",
+        base_url,
+        "--workdir",
+        str(workdir),
+        "--output",
+        str(workdir / f"{spider}.jsonl"),
+        "--result",
+        str(result_path),
+        "--start",
+        args.start,
+        "--end",
+        args.end,
+        "--keywords",
+        str(keywords),
+    ]
+    for kv in args.set or []:
+        cmd += ["--set", kv]
+    subprocess.run(cmd, check=True, cwd=ROOT)
+    result = json.loads(result_path.read_text(encoding="utf-8"))
+    elapsed = result["elapsed"] or 1e-9
+    result["items_per_sec"] = round(result["items"] / elapsed, 1)
+    result["requests_per_sec"] = round(result["requests"] / elapsed, 1)
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> int:
+    regressions = 0
+    for spider, cur in results.items():
+        base = baseline.get(spider)
+        if not base:
+            continue
+        for metric in ("items_per_sec", "requests_per_sec", "peak_rss_mb", "max_recovery_seconds"):
+            if metric not in cur or metric not in base or not base[metric]:
+                continue
+            change = (cur[metric] - base[metric]) / base[metric]
+            worse = change < -tolerance if metric in HIGHER_IS_BETTER else change > tolerance
+            if worse:
+                regressions += 1
+                print(f"REGRESSION {spider} {metric}: {base[metric]} -> {cur[metric]} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end crawl benchmark against the mock hotEngineApi")
+    parser.add_argument("--spiders", default=",".join(SPIDERS))
+    parser.add_argument("--start", default="2024-01-01")
+    parser.add_argument("--end", default="2024-01-14")
+    parser.add_argument("--set", action="append", help="Extra scrapy setting KEY=VALUE (repeatable)")
+    parser.add_argument(
+        "--mock-arg",
+        action="append",
+        default=[],
+        help="Extra mock_hotengine_server.py argument, e.g. --mock-arg=--refuse-after=200",
+    )
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a previous --json result")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative regression")
+    # child mode
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    parser.add_argument("--keywords", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    port = free_port()
+    control_port = free_port()
+    api_url = f"http://127.0.0.1:{port}/hotEngineApi"
+    root_url = f"http://127.0.0.1:{control_port}"
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            str(ROOT / "scripts" / "mock_hotengine_server.py"),
+            "--port",
+            str(port),
+            "--control-port",
+            str(control_port),
+        ]
+        + args.mock_arg,
+        stdout=subprocess.DEVNULL,
+    )
+    results = {}
+    try:
+        wait_for(f"{root_url}/__stats")
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp_path = Path(tmp)
+            keywords = tmp_path / "keywords.txt"
+            url = f"{root_url}/__keywords?startDate={args.start}&endDate={args.end}"
+            keywords.write_bytes(urllib.request.urlopen(url).read())
+            for spider in [s.strip() for s in args.spiders.split(",") if s.strip()]:
+                before = json.loads(urllib.request.urlopen(f"{root_url}/__stats").read())
+                workdir = tmp_path / spider
+                workdir.mkdir()
+                result = bench_spider(spider, args, api_url, workdir, keywords)
+                after = json.loads(urllib.request.urlopen(f"{root_url}/__stats").read())
+                recoveries = after["recovery_seconds"][len(before["recovery_seconds"]):]
+                result["throttle_events"] = after["refusal_windows"] - before["refusal_windows"]
+                result["max_recovery_seconds"] = max(recoveries) if recoveries else 0.0
+                results[spider] = result
+    finally:
+        server.terminate()
+        server.wait()
+
+    header = f"{'spider':<12} {'items':>8} {'items/s':>9} {'reqs':>7} {'reqs/s':>8} {'rss MB':>7} {'throttle':>8} {'pauses':>6} {'recover s':>9}"
+    print(header)
+    for spider, r in results.items():
+        print(
+            f"{spider:<12} {r['items']:>8} {r['items_per_sec']:>9} {r['requests']:>7} {r['requests_per_sec']:>8} "
+            f"{r['peak_rss_mb']:>7} {r['throttle_events']:>8} {r['backoff_pauses']:>6} {r['max_recovery_seconds']:>9}"
+        )
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if compare(results, baseline, args.tolerance):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
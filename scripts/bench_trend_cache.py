@@ -0,0 +1,93 @@
+import argparse
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from weibo_hot.trend_cache import TrendCache  # noqa: E402
+
+
+UPSERT = """
+    INSERT INTO trend_cache_minute (topic, first_date, last_date, duration_minutes, points, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(topic) DO UPDATE SET
+        first_date=excluded.first_date,
+        last_date=excluded.last_date,
+        duration_minutes=excluded.duration_minutes,
+        points=excluded.points,
+        updated_at=excluded.updated_at
+"""
+
+
+def make_rows(n: int):
+    for i in range(n):
+        yield (f"topic_{i}", "2024-01-01 00:00", "2024-01-01 06:00", 360, 360)
+
+
+def bench_per_row(path: Path, n: int):
+    # Mirrors the old spider code: default journal, one commit per upsert.
+    conn = sqlite3.connect(str(path))
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS trend_cache_minute (
+            topic TEXT PRIMARY KEY,
+            first_date TEXT,
+            last_date TEXT,
+            duration_minutes INTEGER,
+            points INTEGER,
+            updated_at TEXT
+        )
+        """
+    )
+    conn.commit()
+    commits = 0
+    t0 = time.perf_counter()
+    for row in make_rows(n):
+        conn.execute(UPSERT, row + (datetime.utcnow().isoformat(),))
+        conn.commit()
+        commits += 1
+    elapsed = time.perf_counter() - t0
+    conn.close()
+    return elapsed, commits
+
+
+def bench_batched(path: Path, n: int, batch_size: int):
+    cache = TrendCache(str(path), batch_size=batch_size)
+    t0 = time.perf_counter()
+    for row in make_rows(n):
+        cache.set(*row)
+    cache.close()
+    elapsed = time.perf_counter() - t0
+    return elapsed, cache.commits
+
+
+def report(name: str, n: int, elapsed: float, commits: int) -> None:
+    print(
+        f"{name:<14} rows={n:<8} commits={commits:<8} "
+        f"elapsed={elapsed:8.3f}s rows/s={n / elapsed:12.1f} commits/s={commits / elapsed:10.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-row commits vs batched trend cache")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--dir", default=None, help="Directory for the temp sqlite files (use the crawl disk)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        tmp_path = Path(tmp)
+        elapsed, commits = bench_per_row(tmp_path / "per_row.sqlite", args.rows)
+        report("per-row", args.rows, elapsed, commits)
+        base = elapsed
+        elapsed, commits = bench_batched(tmp_path / "batched.sqlite", args.rows, args.batch_size)
+        report(f"batched/{args.batch_size}", args.rows, elapsed, commits)
+        print(f"speedup: {base / elapsed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
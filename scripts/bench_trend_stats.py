@@ -0,0 +1,96 @@
+import argparse
+import base64
+import json
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from weibo_hot.codec import AES_KEY, decode, decrypt  # noqa: E402
+from weibo_hot.trend_stats import summarize_superinfo  # noqa: E402
+
+
+def make_body(points: int, seed: int, shuffle: bool) -> bytes:
+    rnd = random.Random(seed)
+    t = datetime(2024, 1, 1)
+    data = []
+    for _ in range(points):
+        data.append({"name": "话题", "value": [t.strftime("%Y-%m-%d %H:%M:%S"), rnd.randint(1, 50)]})
+        # Mostly one point per minute, with repeats and off-board gaps.
+        r = rnd.random()
+        t += timedelta(minutes=0 if r < 0.02 else 1 if r < 0.99 else rnd.randint(30, 600))
+    if shuffle:
+        rnd.shuffle(data)
+    raw = json.dumps({"code": 1, "data": data}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    ct = AES.new(AES_KEY, AES.MODE_ECB).encrypt(pad(raw, 16))
+    return b'"' + base64.b64encode(ct) + b'"'
+
+
+def legacy(body: bytes):
+    # The loop parse_trend_superinfo ran on the fully decoded payload.
+    payload = decode(body)
+    seen = set()
+    first_time = last_time = None
+    for d in payload.get("data", []) or []:
+        if not isinstance(d, dict):
+            continue
+        value = d.get("value")
+        if not isinstance(value, list) or not value:
+            continue
+        t = str(value[0])
+        seen.add(t)
+        if first_time is None or t < first_time:
+            first_time = t
+        if last_time is None or t > last_time:
+            last_time = t
+    return first_time, last_time, len(seen)
+
+
+def streaming(body: bytes):
+    s = summarize_superinfo(decrypt(body))
+    return s.first, s.last, s.distinct
+
+
+def measure(fn, body: bytes, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(body)
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    fn(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming superInfo aggregation vs full decode")
+    parser.add_argument("--points", default="1000,20000,100000,300000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'points':>8} {'order':>8} {'legacy ms':>10} {'stream ms':>10} {'speedup':>8} {'legacy MB':>10} {'stream MB':>10}")
+    for points in [int(p) for p in args.points.split(",") if p]:
+        for shuffle in (False, True):
+            body = make_body(points, args.seed, shuffle)
+            old, old_t, old_mem = measure(legacy, body, args.repeat)
+            new, new_t, new_mem = measure(streaming, body, args.repeat)
+            if old != new:
+                raise SystemExit(f"mismatch at {points} points: {old} != {new}")
+            print(
+                f"{points:>8} {'shuffled' if shuffle else 'sorted':>8} {old_t * 1000:>10.1f} {new_t * 1000:>10.1f} "
+                f"{old_t / new_t:>7.1f}x {old_mem / 1e6:>10.1f} {new_mem / 1e6:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -17,11 +17,9 @@ def load_trends(path: Path):
             key = obj.get("keyword")
             if not key:
                 continue
-            trends[key] = {
-                "trend_first_time": obj.get("trend_first_time"),
-                "trend_last_time": obj.get("trend_last_time"),
-                "trend_duration_days": obj.get("trend_duration_days"),
-            }
+            # trend_first_time / trend_last_time / trend_duration_days plus
+            # the interval and peak fields when the trend spider computed them.
+            trends[key] = {k: v for k, v in obj.items() if k.startswith("trend_")}
     return trends
 
 
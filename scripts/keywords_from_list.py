@@ -7,11 +7,16 @@ def main():
     parser = argparse.ArgumentParser(description="Extract unique keywords from list JSONL")
     parser.add_argument("--list", default="output/list.jsonl", help="List JSONL file")
     parser.add_argument("--out", default="output/keywords.txt", help="Output keyword file")
+    parser.add_argument(
+        "--last-seen",
+        action="store_true",
+        help="Add a tab-separated latest last_exists_time per keyword (lets weibo_trend refresh changed topics)",
+    )
     args = parser.parse_args()
 
     list_path = Path(args.list)
     out_path = Path(args.out)
-    seen = set()
+    seen = {}
 
     with list_path.open("r", encoding="utf-8") as f:
         for line in f:
@@ -23,14 +28,19 @@ def main():
             except Exception:
                 continue
             key = obj.get("keyword")
-            if not key or key in seen:
+            if not key:
                 continue
-            seen.add(key)
+            last = obj.get("last_exists_time") or ""
+            if key not in seen or str(last) > seen[key]:
+                seen[key] = str(last)
 
     out_path.parent.mkdir(parents=True, exist_ok=True)
     with out_path.open("w", encoding="utf-8") as f:
         for key in sorted(seen):
-            f.write(key + "\n")
+            if args.last_seen and seen[key]:
+                f.write(f"{key}\t{seen[key]}\n")
+            else:
+                f.write(key + "\n")
 
 
 if __name__ == "__main__":
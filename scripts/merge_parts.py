@@ -0,0 +1,188 @@
+import argparse
+import glob
+import heapq
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except Exception:
+    _loads = json.loads
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+# A run line is "<json sort key>\t<original row>": JSON escapes tabs inside
+# strings, so the first tab always ends the key.
+Record = Tuple[list, bytes]
+
+
+def completeness(obj: dict) -> int:
+    return sum(1 for k, v in obj.items() if k.startswith("trend_") and v not in (None, "", [], {}))
+
+
+def text(value) -> str:
+    return "" if value is None else str(value)
+
+
+def list_key(obj: dict, seq: int) -> list:
+    # Date first so the merged stream is already in output order; the best
+    # copy of each (keyword, last_exists_time) sorts first within its group.
+    return [text(obj.get("last_exists_time")), text(obj.get("keyword")), -completeness(obj), -seq]
+
+
+def trend_key(obj: dict, seq: int) -> list:
+    return [text(obj.get("keyword")), -completeness(obj), -seq]
+
+
+def trend_order_key(obj: dict, seq: int) -> list:
+    return [text(obj.get("trend_first_time")), text(obj.get("keyword"))]
+
+
+def read_rows(paths: Iterable[str], stats: dict) -> Iterator[Tuple[dict, bytes]]:
+    for path in paths:
+        with open(path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    obj = _loads(line)
+                except Exception:
+                    stats["invalid"] += 1
+                    continue
+                if not isinstance(obj, dict) or not obj.get("keyword"):
+                    stats["invalid"] += 1
+                    continue
+                stats["read"] += 1
+                yield obj, line
+
+
+def detect_kind(paths: List[str]) -> str:
+    for obj, _ in read_rows(paths, {"read": 0, "invalid": 0}):
+        return "list" if "last_exists_time" in obj else "trend"
+    return "list"
+
+
+def write_run(records: List[Record], tmp_dir: str) -> str:
+    records.sort(key=lambda r: r[0])
+    fd, path = tempfile.mkstemp(suffix=".run", dir=tmp_dir)
+    with os.fdopen(fd, "wb") as f:
+        for key, line in records:
+            f.write(_dumps(key) + b"\t" + line + b"\n")
+    return path
+
+
+def sorted_runs(rows: Iterable[Tuple[dict, bytes]], key_fn, tmp_dir: str, chunk_bytes: int) -> List[str]:
+    """Cut ``rows`` into sorted run files of about ``chunk_bytes`` each."""
+    runs = []
+    records: List[Record] = []
+    size = 0
+    for seq, (obj, line) in enumerate(rows):
+        records.append((key_fn(obj, seq), line))
+        size += len(line)
+        if size >= chunk_bytes:
+            runs.append(write_run(records, tmp_dir))
+            records, size = [], 0
+    if records:
+        runs.append(write_run(records, tmp_dir))
+    return runs
+
+
+def read_run(path: str) -> Iterator[Record]:
+    with open(path, "rb") as f:
+        for line in f:
+            key, _, row = line.rstrip(b"\n").partition(b"\t")
+            yield _loads(key), row
+
+
+def merge_runs(runs: List[str], tmp_dir: str, fan_in: int) -> Iterator[Record]:
+    """Merge sorted runs, first in rounds of ``fan_in`` so few files are open at once."""
+    while len(runs) > fan_in:
+        merged = []
+        for i in range(0, len(runs), fan_in):
+            group = runs[i : i + fan_in]
+            fd, path = tempfile.mkstemp(suffix=".run", dir=tmp_dir)
+            with os.fdopen(fd, "wb") as f:
+                for key, row in heapq.merge(*(read_run(p) for p in group), key=lambda r: r[0]):
+                    f.write(_dumps(key) + b"\t" + row + b"\n")
+            for p in group:
+                os.remove(p)
+            merged.append(path)
+        runs = merged
+    yield from heapq.merge(*(read_run(p) for p in runs), key=lambda r: r[0])
+
+
+def dedup(records: Iterable[Record], width: int, stats: dict) -> Iterator[Record]:
+    """Keep the first record of each run of equal ``key[:width]``."""
+    last: Optional[list] = None
+    for key, row in records:
+        group = key[:width]
+        if group == last:
+            stats["duplicates"] += 1
+            continue
+        last = group
+        yield key, row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge shard JSONL outputs, dropping duplicate rows, ordered by date")
+    parser.add_argument("--parts", action="append", required=True, help='Glob of part files, e.g. "output/part*.jsonl"')
+    parser.add_argument("--out", required=True, help="Merged JSONL file")
+    parser.add_argument(
+        "--kind",
+        choices=["auto", "list", "trend"],
+        default="auto",
+        help="list: dedup on (keyword, last_exists_time), order by last_exists_time; "
+        "trend: dedup on keyword, order by trend_first_time",
+    )
+    parser.add_argument("--chunk-mb", type=int, default=128, help="Rows sorted in memory at a time (MB of JSON)")
+    parser.add_argument("--fan-in", type=int, default=128, help="Max run files merged at once")
+    parser.add_argument("--tmp-dir", help="Directory for sorted runs (default: next to --out)")
+    args = parser.parse_args()
+
+    paths = sorted({p for pattern in args.parts for p in glob.glob(pattern)})
+    out = Path(args.out)
+    paths = [p for p in paths if Path(p).resolve() != out.resolve()]
+    if not paths:
+        raise SystemExit("no part files matched")
+    kind = detect_kind(paths) if args.kind == "auto" else args.kind
+    out.parent.mkdir(parents=True, exist_ok=True)
+    chunk_bytes = max(1, args.chunk_mb) * 1024 * 1024
+    fan_in = max(2, args.fan_in)
+    stats = {"read": 0, "invalid": 0, "duplicates": 0, "written": 0}
+
+    with tempfile.TemporaryDirectory(prefix="merge_parts_", dir=args.tmp_dir or str(out.parent)) as tmp_dir:
+        if kind == "list":
+            runs = sorted_runs(read_rows(paths, stats), list_key, tmp_dir, chunk_bytes)
+            merged = dedup(merge_runs(runs, tmp_dir, fan_in), 2, stats)
+        else:
+            # Copies of a keyword can carry different trend dates, so dedup
+            # in keyword order first, then sort the survivors by date.
+            runs = sorted_runs(read_rows(paths, stats), trend_key, tmp_dir, chunk_bytes)
+            unique = ((_loads(row), row) for _, row in dedup(merge_runs(runs, tmp_dir, fan_in), 1, stats))
+            runs = sorted_runs(unique, trend_order_key, tmp_dir, chunk_bytes)
+            merged = merge_runs(runs, tmp_dir, fan_in)
+
+        partial = out.with_name(out.name + ".partial")
+        with partial.open("wb") as f:
+            for _, row in merged:
+                f.write(row + b"\n")
+                stats["written"] += 1
+        os.replace(partial, out)
+
+    print(
+        f"{kind}: {len(paths)} files, {stats['read']} rows read, {stats['duplicates']} duplicates dropped, "
+        f"{stats['invalid']} invalid lines skipped, {stats['written']} rows -> {out}"
+    )
+
+
+if __name__ == "__main__":
+    main()
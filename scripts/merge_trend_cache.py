@@ -0,0 +1,128 @@
+import argparse
+import glob
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from weibo_hot.trend_cache import TrendCache  # noqa: E402
+
+
+def part_columns(conn: sqlite3.Connection) -> set:
+    return {row[1] for row in conn.execute("PRAGMA part.table_info(trend_cache_minute)")}
+
+
+# Old rows kept updated_at as isoformat() ("T"), newer ones with a space;
+# datetime() brings both to one format so they compare and store alike.
+UPDATED_AT = "COALESCE(datetime(updated_at), updated_at)"
+
+
+def newer(table: str) -> str:
+    return f"COALESCE(datetime(excluded.updated_at), '') > COALESCE(datetime({table}.updated_at), '')"
+
+
+def merge_part(conn: sqlite3.Connection, part: Path) -> int:
+    conn.execute("ATTACH DATABASE ? AS part", (str(part),))
+    try:
+        cols = part_columns(conn)
+        if not cols:
+            return 0
+        # Rows keep the SHARD_ID that fetched them; parts from before rows
+        # were tagged have no writer, which never counts as another shard.
+        writer_expr = "NULLIF(writer, '')" if "writer" in cols else "NULL"
+        before = conn.total_changes
+        # A successful row always beats an empty one; between two rows of the
+        # same kind the most recently fetched wins.
+        conn.execute(
+            f"""
+            INSERT INTO trend_cache_minute
+                (topic, first_date, last_date, duration_minutes, points, updated_at, writer)
+            SELECT topic, first_date, last_date, duration_minutes, points, {UPDATED_AT}, {writer_expr}
+            FROM part.trend_cache_minute WHERE topic IS NOT NULL
+            ON CONFLICT(topic) DO UPDATE SET
+                first_date=excluded.first_date,
+                last_date=excluded.last_date,
+                duration_minutes=excluded.duration_minutes,
+                points=excluded.points,
+                updated_at=excluded.updated_at,
+                writer=excluded.writer
+            WHERE (COALESCE(excluded.first_date, '') != '' AND COALESCE(excluded.last_date, '') != '')
+              AND (
+                COALESCE(trend_cache_minute.first_date, '') = ''
+                OR COALESCE(trend_cache_minute.last_date, '') = ''
+                OR {newer("trend_cache_minute")}
+              )
+            """
+        )
+        if conn.execute("SELECT 1 FROM part.sqlite_master WHERE name='trend_series'").fetchone():
+            conn.execute(
+                f"""
+                INSERT INTO trend_series (topic, points, series, updated_at, writer)
+                SELECT topic, points, series, {UPDATED_AT}, NULLIF(writer, '')
+                FROM part.trend_series WHERE topic IS NOT NULL
+                ON CONFLICT(topic) DO UPDATE SET
+                    points=excluded.points,
+                    series=excluded.series,
+                    updated_at=excluded.updated_at,
+                    writer=excluded.writer
+                WHERE {newer("trend_series")}
+                """
+            )
+        if conn.execute("SELECT 1 FROM part.sqlite_master WHERE name='trend_cache_day'").fetchone():
+            conn.execute(
+                f"""
+                INSERT INTO trend_cache_day (topic, first_date, last_date, days, points, updated_at, writer)
+                SELECT topic, first_date, last_date, days, points, {UPDATED_AT}, NULLIF(writer, '')
+                FROM part.trend_cache_day WHERE topic IS NOT NULL
+                ON CONFLICT(topic) DO UPDATE SET
+                    first_date=excluded.first_date,
+                    last_date=excluded.last_date,
+                    days=excluded.days,
+                    points=excluded.points,
+                    updated_at=excluded.updated_at,
+                    writer=excluded.writer
+                WHERE {newer("trend_cache_day")}
+                """
+            )
+        conn.commit()
+        return conn.total_changes - before
+    finally:
+        conn.execute("DETACH DATABASE part")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fold per-shard trend caches into one shared cache")
+    parser.add_argument("--out", default="trend_cache.sqlite", help="Shared trend cache sqlite")
+    parser.add_argument("--parts", default="trend_cache_part*.sqlite", help="Glob of part caches to merge")
+    parser.add_argument("--no-vacuum", action="store_true", help="Skip checkpoint + VACUUM after merging")
+    args = parser.parse_args()
+
+    out = Path(args.out).resolve()
+    parts = [Path(p) for p in sorted(glob.glob(args.parts)) if Path(p).resolve() != out]
+    if not parts:
+        print(f"no part caches match {args.parts}")
+
+    # Create / migrate the target schema the same way the spiders do.
+    TrendCache(str(out)).close()
+
+    conn = sqlite3.connect(str(out), timeout=30.0)
+    try:
+        for part in parts:
+            changed = merge_part(conn, part)
+            print(f"{part}: {changed} rows merged")
+        total = conn.execute("SELECT COUNT(*) FROM trend_cache_minute").fetchone()[0]
+        success = conn.execute(
+            "SELECT COUNT(*) FROM trend_cache_minute "
+            "WHERE COALESCE(first_date, '') != '' AND COALESCE(last_date, '') != ''"
+        ).fetchone()[0]
+        if not args.no_vacuum:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("VACUUM")
+        print(f"{out}: {total} topics, {success} with trend")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
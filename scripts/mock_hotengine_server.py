@@ -0,0 +1,335 @@
+import argparse
+import base64
+import json
+import random
+import socket
+import sys
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from weibo_hot.codec import AES_KEY  # noqa: E402
+
+API_PREFIX = "/hotEngineApi"
+CATEGORIES = ["娱乐", "社会", "体育", "科技", "财经", "综艺", "电影", "游戏"]
+
+
+def _seed(*parts) -> int:
+    return zlib.crc32("|".join(str(p) for p in parts).encode("utf-8"))
+
+
+class Dataset:
+    """Deterministic synthetic hot-search board.
+
+    Every day has a varying number of topics; some topics stay on the board
+    for several days so trend caching and cross-window duplicates behave like
+    production.
+    """
+
+    def __init__(self, base_per_day: int, busy_every: int, carry_over: float, max_series_minutes: int) -> None:
+        self.base_per_day = base_per_day
+        self.busy_every = busy_every
+        self.carry_over = carry_over
+        self.max_series_minutes = max_series_minutes
+        self._day_cache = {}
+        self._lock = threading.Lock()
+
+    def day_topics(self, d: date):
+        with self._lock:
+            cached = self._day_cache.get(d)
+        if cached is not None:
+            return cached
+        rnd = random.Random(_seed("day", d))
+        n = int(self.base_per_day * rnd.uniform(0.5, 1.5))
+        if self.busy_every and d.toordinal() % self.busy_every == 0:
+            n *= 5
+        topics = []
+        prev = d - timedelta(days=1)
+        prev_rnd = random.Random(_seed("day", prev))
+        prev_n = int(self.base_per_day * prev_rnd.uniform(0.5, 1.5))
+        carried = int(min(prev_n, n) * self.carry_over)
+        for i in range(carried):
+            topics.append(f"话题-{prev.isoformat()}-{i}")
+        for i in range(n - carried):
+            topics.append(f"话题-{d.isoformat()}-{i}")
+        with self._lock:
+            self._day_cache[d] = topics
+        return topics
+
+    def rows(self, start: date, end: date):
+        rows = []
+        d = start
+        while d <= end:
+            for rank, topic in enumerate(self.day_topics(d), start=1):
+                rnd = random.Random(_seed("row", topic, d))
+                rows.append(
+                    {
+                        "topic": topic,
+                        "pm": min(rank, 50),
+                        "hotNumber": rnd.randint(10_000, 5_000_000),
+                        "updateTime": f"{d.isoformat()} {rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:00",
+                        "durations": rnd.randint(1, 1440),
+                        "screenName": f"host{rnd.randint(1, 999)}",
+                        "fenlei": rnd.choice(CATEGORIES),
+                        "location": rnd.choice(["北京", "上海", "广东", ""]),
+                        "icon": rnd.choice(["新", "热", "沸", ""]),
+                    }
+                )
+            d += timedelta(days=1)
+        return rows
+
+    def _topic_start(self, topic: str) -> datetime:
+        day = topic.split("-", 1)[1][:10]
+        rnd = random.Random(_seed("start", topic))
+        return datetime.fromisoformat(day) + timedelta(minutes=rnd.randint(0, 1200))
+
+    def series(self, topic: str):
+        rnd = random.Random(_seed("series", topic))
+        start = self._topic_start(topic)
+        minutes = rnd.randint(10, max(10, self.max_series_minutes))
+        points = []
+        t = start
+        for _ in range(minutes):
+            points.append({"name": topic, "value": [t.strftime("%Y-%m-%d %H:%M:%S"), rnd.randint(1, 50)]})
+            # Occasional gaps: the topic drops off the board and comes back.
+            t += timedelta(minutes=1 if rnd.random() > 0.01 else rnd.randint(30, 600))
+        return points
+
+    def lifting(self, topic: str):
+        days = sorted({p["value"][0][:10] for p in self.series(topic)})
+        return [{"date": d, "hotNumber": 0} for d in days]
+
+
+class MockState:
+    def __init__(self, args) -> None:
+        self.args = args
+        self.key = AES_KEY
+        self.dataset = Dataset(args.topics_per_day, args.busy_every, args.carry_over, args.series_minutes)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.served_since_refusal = 0
+        self.refusals = []  # [started, ended, first_success_after]
+        self.refusing = False
+        self.connections = set()
+        self.rng = random.Random(args.seed)
+
+    def encrypt(self, obj) -> bytes:
+        raw = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        ct = AES.new(self.key, AES.MODE_ECB).encrypt(pad(raw, 16))
+        return b'"' + base64.b64encode(ct) + b'"'
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def note_success(self) -> None:
+        with self.lock:
+            self.served_since_refusal += 1
+            if self.refusals and self.refusals[-1][1] and self.refusals[-1][2] is None:
+                self.refusals[-1][2] = time.time()
+
+    def drop_connections(self) -> None:
+        # Keep-alive connections outlive the listening socket; cut them so
+        # clients see the refusal too.
+        with self.lock:
+            self.refusing = True
+            connections = list(self.connections)
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def should_refuse(self) -> bool:
+        if not self.args.refuse_after:
+            return False
+        with self.lock:
+            return self.served_since_refusal >= self.args.refuse_after
+
+    def snapshot(self):
+        with self.lock:
+            recoveries = [
+                round(first - ended, 3) for _, ended, first in self.refusals if ended and first is not None
+            ]
+            return {
+                "counts": dict(self.counts),
+                "refusal_windows": len(self.refusals),
+                "recovery_seconds": recoveries,
+            }
+
+
+def make_handler(state: MockState, api: bool = True):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            if state.args.verbose:
+                super().log_message(fmt, *args)
+
+        def setup(self):
+            super().setup()
+            if api:
+                with state.lock:
+                    state.connections.add(self.connection)
+
+        def finish(self):
+            with state.lock:
+                state.connections.discard(self.connection)
+            try:
+                super().finish()
+            except OSError:
+                pass
+
+        def _refusing(self) -> bool:
+            if api and state.refusing:
+                # Drop the connection without an answer, like a reset.
+                self.close_connection = True
+                return True
+            return False
+
+        def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            qs = {k: v[0] for k, v in parse_qs(parts.query).items()}
+            path = parts.path
+
+            if path == "/__stats":
+                self._send(200, json.dumps(state.snapshot()).encode("utf-8"))
+                return
+            if path == "/__keywords":
+                start = date.fromisoformat(qs["startDate"])
+                end = date.fromisoformat(qs["endDate"])
+                topics = dict.fromkeys(r["topic"] for r in state.dataset.rows(start, end))
+                self._send(200, "\n".join(topics).encode("utf-8") + b"\n", "text/plain; charset=utf-8")
+                return
+            if not path.startswith(API_PREFIX):
+                self._send(404, b"not found", "text/plain")
+                return
+            if self._refusing():
+                return
+            endpoint = path[len(API_PREFIX):]
+            state.count(endpoint)
+
+            args = state.args
+            if args.latency:
+                time.sleep(max(0.0, state.rng.gauss(args.latency, args.latency * args.latency_jitter)))
+            if self._refusing():
+                return
+            roll = state.rng.random()
+            if roll < args.timeout_rate:
+                state.count("injected/timeout")
+                time.sleep(args.timeout_sleep)
+            elif roll < args.timeout_rate + args.error_rate:
+                state.count("injected/http500")
+                self._send(500, b"internal error", "text/plain")
+                return
+            if self._refusing():
+                return
+
+            if endpoint == "/data/list":
+                payload = self._list(qs)
+            elif endpoint == "/data/superInfo":
+                payload = {"code": 1, "data": state.dataset.series(qs.get("keyword", ""))}
+            elif endpoint == "/data/liftingDiagram":
+                payload = {"code": 1, "data": state.dataset.lifting(qs.get("keyword", ""))}
+            else:
+                self._send(404, b"not found", "text/plain")
+                return
+            self._send(200, state.encrypt(payload))
+            state.note_success()
+
+        def _list(self, qs):
+            start = date.fromisoformat(qs["startDate"])
+            end = date.fromisoformat(qs["endDate"])
+            page_no = int(qs.get("pageNo", 1))
+            page_size = int(qs.get("pageSize", 100))
+            rows = state.dataset.rows(start, end)
+            lo = (page_no - 1) * page_size
+            hi = lo + page_size
+            if state.args.list_cap:
+                # Server keeps reporting the true total but stops serving rows.
+                hi = min(hi, state.args.list_cap)
+            return {
+                "code": 1,
+                "data": {"data": {"total": len(rows), "pageNo": page_no, "data": rows[lo:hi] if lo < hi else []}},
+            }
+
+    return Handler
+
+
+def serve(args) -> None:
+    state = MockState(args)
+    handler = make_handler(state)
+
+    if args.control_port:
+        # /__stats and /__keywords stay reachable while the API port refuses.
+        control = ThreadingHTTPServer((args.host, args.control_port), make_handler(state, api=False))
+        control.daemon_threads = True
+        threading.Thread(target=control.serve_forever, daemon=True).start()
+
+    while True:
+        server = ThreadingHTTPServer((args.host, args.port), handler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        print(f"mock hotEngineApi listening on http://{args.host}:{server.server_address[1]}{API_PREFIX}", flush=True)
+        while not state.should_refuse():
+            time.sleep(0.05)
+        # Throttle event: stop listening so clients get ECONNREFUSED.
+        server.shutdown()
+        server.server_close()
+        state.drop_connections()
+        started = time.time()
+        with state.lock:
+            state.refusals.append([started, None, None])
+        print(f"refusing connections for {args.refuse_seconds}s", flush=True)
+        time.sleep(args.refuse_seconds)
+        with state.lock:
+            state.refusals[-1][1] = time.time()
+            state.served_since_refusal = 0
+            state.refusing = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline stand-in for hotengineapi.zhaoyizhe.com")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--control-port", type=int, default=0, help="Always-on port for /__stats and /__keywords")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--topics-per-day", type=int, default=60)
+    parser.add_argument("--busy-every", type=int, default=7, help="Every Nth day has 5x the topics (0=off)")
+    parser.add_argument("--carry-over", type=float, default=0.3, help="Share of topics that stay from the day before")
+    parser.add_argument("--series-minutes", type=int, default=2000, help="Max minute points per superInfo series")
+    parser.add_argument("--list-cap", type=int, default=0, help="Serve at most N rows per window (0=no cap)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean response latency (seconds)")
+    parser.add_argument("--latency-jitter", type=float, default=0.3, help="Latency stddev as a share of the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Share of requests that hang")
+    parser.add_argument("--timeout-sleep", type=float, default=90.0, help="How long a hanging request sleeps")
+    parser.add_argument("--refuse-after", type=int, default=0, help="Refuse connections after N served (0=never)")
+    parser.add_argument("--refuse-seconds", type=float, default=10.0, help="Length of each refusal window")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    try:
+        serve(args)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
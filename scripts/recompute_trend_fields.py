@@ -0,0 +1,77 @@
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from weibo_hot.series import decode_series, decode_series_raw, minute_to_str  # noqa: E402
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+
+def summarize(blob: bytes):
+    if np is not None:
+        n, raw = decode_series_raw(blob)
+        minutes = np.cumsum(np.frombuffer(raw, dtype="<i4", count=n), dtype=np.int64)
+        if not n:
+            return None, None, 0
+        return int(minutes.min()), int(minutes.max()), int(np.unique(minutes).size)
+    minutes, _ = decode_series(blob)
+    if not minutes:
+        return None, None, 0
+    return min(minutes), max(minutes), len(set(minutes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute trend fields offline from stored minute series")
+    parser.add_argument("--cache", default="trend_cache.sqlite", help="Trend cache sqlite with trend_series")
+    parser.add_argument("--out", help="Write keyword + trend fields as JSONL")
+    parser.add_argument("--update-cache", action="store_true", help="Write the fields back to trend_cache_minute")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.cache, timeout=30.0)
+    out = open(args.out, "w", encoding="utf-8") if args.out else None
+    updates = []
+    n = 0
+    t0 = time.perf_counter()
+    try:
+        for topic, blob in conn.execute("SELECT topic, series FROM trend_series"):
+            first, last, distinct = summarize(blob)
+            if first is None:
+                continue
+            first_s, last_s = minute_to_str(first), minute_to_str(last)
+            n += 1
+            if out is not None:
+                row = {
+                    "keyword": topic,
+                    "trend_first_time": first_s,
+                    "trend_last_time": last_s,
+                    "trend_duration_days": distinct,
+                }
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            if args.update_cache:
+                updates.append((first_s, last_s, distinct, distinct, topic))
+        elapsed = time.perf_counter() - t0
+        if updates:
+            with conn:
+                conn.executemany(
+                    "UPDATE trend_cache_minute SET first_date=?, last_date=?, duration_minutes=?, points=? "
+                    "WHERE topic=?",
+                    updates,
+                )
+    finally:
+        if out is not None:
+            out.close()
+        conn.close()
+    rate = n / elapsed if elapsed else 0.0
+    print(f"recomputed {n} topics in {elapsed:.2f}s ({rate:,.0f} topics/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,13 @@
 import argparse
 import os
 import subprocess
+import sys
 import shutil
 from datetime import datetime, timedelta
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
 try:
     from dotenv import load_dotenv
 
@@ -12,6 +15,9 @@ try:
 except Exception:
     pass
 
+from weibo_hot.ledger import CrawlLedger, finish_reason  # noqa: E402
+from weibo_hot.work_queue import fill_window_queue  # noqa: E402
+
 
 def parse_date(s: str) -> datetime:
     return datetime.strptime(s, "%Y-%m-%d")
@@ -36,49 +42,121 @@ def main():
     parser = argparse.ArgumentParser(description="Run scrapy in parallel shards")
     parser.add_argument("--shards", type=int, default=int(os.getenv("PARALLEL_SHARDS", "5")))
     parser.add_argument("--start", default=os.getenv("START_DATE", "2019-10-25"))
-    parser.add_argument("--end", default=os.getenv("END_DATE", "2025-12-31"))
+    parser.add_argument("--end", default=os.getenv("END_DATE", ""))
+    parser.add_argument(
+        "--trend-cache",
+        default=os.getenv("TREND_CACHE_PATH", "trend_cache.sqlite"),
+        help="Trend cache sqlite shared by all shards",
+    )
+    parser.add_argument(
+        "--work-stealing",
+        action="store_true",
+        help="Workers lease small date windows from a shared queue instead of fixed date ranges",
+    )
+    parser.add_argument("--window-days", type=int, default=int(os.getenv("DATE_STEP_DAYS", "1")))
+    parser.add_argument("--queue", default=os.getenv("WORK_QUEUE_PATH", "output/window_queue.sqlite"))
     parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        default=os.getenv("INCREMENTAL", "0") in {"1", "true", "yes", "y", "on"},
+        help="Only crawl dates after the ledger watermark (end defaults to today)",
+    )
+    parser.add_argument(
+        "--ledger",
+        default=os.getenv("LEDGER_PATH", "crawl_ledger.sqlite"),
+        help="Checkpoint ledger shared by all shards; empty falls back to per-shard JOBDIRs",
+    )
+    parser.add_argument("--recheck-days", type=int, default=int(os.getenv("LEDGER_RECHECK_DAYS", "2")))
     parser.add_argument(
         "--reset-failed",
         action="store_true",
         default=os.getenv("PARALLEL_RESET_FAILED", "0") in {"1", "true", "yes", "y", "on"},
-        help="Remove jobdir and output for failed shards to allow clean retry",
+        help="Remove jobdir/ledger progress and output for failed shards to allow clean retry",
     )
     args = parser.parse_args()
 
     start = parse_date(args.start)
-    end = parse_date(args.end)
+    if args.end:
+        end = parse_date(args.end)
+    elif args.incremental:
+        end = datetime.combine(datetime.now().date(), datetime.min.time())
+    else:
+        end = parse_date("2025-12-31")
     if start > end:
         raise SystemExit("START_DATE must be <= END_DATE")
 
+    scope = os.getenv("LEDGER_SCOPE") or "weibo_total"
+    if args.incremental:
+        if not args.ledger:
+            raise SystemExit("--incremental needs a ledger (LEDGER_PATH)")
+        ledger = CrawlLedger(args.ledger, scope=scope)
+        planned = ledger.incremental_range(start.date(), end.date(), args.recheck_days, reopen=not args.dry_run)
+        ledger.close()
+        if planned is None:
+            print(f"ledger {args.ledger}: {start.date()} -> {end.date()} already done")
+            return
+        print(f"ledger {args.ledger}: crawling {planned[0]} -> {planned[1]}")
+        start = datetime.combine(planned[0], datetime.min.time())
+        end = datetime.combine(planned[1], datetime.min.time())
+
+    queue = None
+    if args.work_stealing:
+        queue, added = fill_window_queue(args.queue, start.date(), end.date(), args.window_days)
+        print(f"window queue {args.queue}: {added} new windows, {queue.counts()}")
+        shards = [(i, start, end) for i in range(1, args.shards + 1)]
+    else:
+        shards = list(split_ranges(start, end, args.shards))
+
     procs = []
     shard_meta = []
-    for idx, s, e in split_ranges(start, end, args.shards):
+    for idx, s, e in shards:
         env = os.environ.copy()
         env["START_DATE"] = s.strftime("%Y-%m-%d")
         env["END_DATE"] = e.strftime("%Y-%m-%d")
         env["OUTPUT_JSONL"] = f"output/part{idx}.jsonl"
-        env["TREND_CACHE_PATH"] = f"trend_cache_part{idx}.sqlite"
-        jobdir = f"jobdir_{idx}"
+        env["TREND_CACHE_PATH"] = args.trend_cache
+        env["TREND_CACHE_SHARED"] = "1"
+        env["SHARD_ID"] = str(idx)
+        env["PENDING_SPILL_PATH"] = f"output/pending_part{idx}.jsonl"
+        env["RETRY_QUEUE_PATH"] = f"output/retry_part{idx}.sqlite"
+        env["LEDGER_PATH"] = args.ledger
+        env["LEDGER_RUN_ID"] = str(idx)
+        # The range is planned here; shards must not narrow it again.
+        env["INCREMENTAL"] = "0"
 
         cmd = [
             "scrapy",
             "crawl",
             "weibo_total",
-            "-s",
-            f"JOBDIR={jobdir}",
         ]
-
-        print(f"[shard {idx}] {env['START_DATE']} -> {env['END_DATE']}")
+        if queue is not None:
+            # The queue is the resume state; a JOBDIR would replay windows
+            # that were handed back to other workers.
+            env["WORK_QUEUE_PATH"] = args.queue
+            env["WORKER_ID"] = f"worker{idx}"
+            jobdir = ""
+        elif args.ledger:
+            # The ledger is the resume state: a persisted dupefilter would
+            # skip the pages it re-schedules.
+            jobdir = ""
+        else:
+            jobdir = f"jobdir_{idx}"
+            cmd += ["-s", f"JOBDIR={jobdir}"]
+
+        if queue is not None:
+            print(f"[worker {idx}] leasing from {args.queue}")
+        else:
+            print(f"[shard {idx}] {env['START_DATE']} -> {env['END_DATE']}")
         print(f"  output: {env['OUTPUT_JSONL']}")
-        print(f"  jobdir: {jobdir}")
+        print(f"  jobdir: {jobdir or '-'}")
 
         if args.dry_run:
             continue
 
         proc = subprocess.Popen(cmd, env=env)
         procs.append(proc)
-        shard_meta.append((idx, jobdir, env["OUTPUT_JSONL"]))
+        shard_meta.append((idx, jobdir, env["OUTPUT_JSONL"], s, e))
 
     if args.dry_run:
         return
@@ -86,25 +164,42 @@ def main():
     failed = []
     for p, meta in zip(procs, shard_meta):
         p.wait()
-        if p.returncode != 0:
+        # A backoff stop exits 0; the ledger knows how the run really ended.
+        reason = finish_reason(args.ledger, scope, str(meta[0])) if args.ledger else ""
+        if p.returncode != 0 or (args.ledger and reason != "finished"):
+            print(f"[shard {meta[0]}] exit {p.returncode}, finish reason {reason or '-'}")
             failed.append(meta)
 
+    if queue is not None:
+        print(f"window queue {args.queue}: {queue.counts()}")
+
     if failed:
         Path("output").mkdir(parents=True, exist_ok=True)
         with open("output/failed_shards.txt", "w", encoding="utf-8") as f:
-            for idx, jobdir, output in failed:
+            for idx, jobdir, output, _, _ in failed:
                 f.write(f"{idx}\t{jobdir}\t{output}\n")
 
         if args.reset_failed:
-            for idx, jobdir, output in failed:
+            ledger = CrawlLedger(args.ledger, scope=scope) if args.ledger and queue is None else None
+            for idx, jobdir, output, s, e in failed:
+                if ledger is not None:
+                    # The output goes away, so must the progress it stands for.
+                    ledger.reopen(s.date(), e.date())
                 try:
-                    shutil.rmtree(jobdir)
+                    if jobdir:
+                        shutil.rmtree(jobdir)
                 except Exception:
                     pass
                 try:
                     Path(output).unlink()
                 except Exception:
                     pass
+                try:
+                    Path(f"output/pending_part{idx}.jsonl").unlink()
+                except Exception:
+                    pass
+            if ledger is not None:
+                ledger.close()
 
 
 if __name__ == "__main__":
@@ -1,10 +1,13 @@
 import argparse
 import os
 import subprocess
+import sys
 import time
 from datetime import datetime, timedelta
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
 try:
     from dotenv import load_dotenv
 
@@ -12,6 +15,9 @@ try:
 except Exception:
     pass
 
+from weibo_hot.ledger import finish_reason  # noqa: E402
+from weibo_hot.work_queue import fill_window_queue  # noqa: E402
+
 
 def parse_date(s: str) -> datetime:
     return datetime.strptime(s, "%Y-%m-%d")
@@ -52,6 +58,23 @@ def main():
     parser.add_argument("--shards", type=int, default=int(os.getenv("PARALLEL_SHARDS", "5")))
     parser.add_argument("--start", default=os.getenv("START_DATE", "2019-10-25"))
     parser.add_argument("--end", default=os.getenv("END_DATE", "2025-12-31"))
+    parser.add_argument(
+        "--trend-cache",
+        default=os.getenv("TREND_CACHE_PATH", "trend_cache.sqlite"),
+        help="Trend cache sqlite shared by all shards",
+    )
+    parser.add_argument(
+        "--work-stealing",
+        action="store_true",
+        help="Workers lease small date windows from a shared queue instead of fixed date ranges",
+    )
+    parser.add_argument("--window-days", type=int, default=int(os.getenv("DATE_STEP_DAYS", "1")))
+    parser.add_argument("--queue", default=os.getenv("WORK_QUEUE_PATH", "output/window_queue.sqlite"))
+    parser.add_argument(
+        "--ledger",
+        default=os.getenv("LEDGER_PATH", "crawl_ledger.sqlite"),
+        help="Checkpoint ledger shared by all shards; empty falls back to per-shard JOBDIRs",
+    )
     parser.add_argument("--dry-run", action="store_true")
     args = parser.parse_args()
 
@@ -60,7 +83,13 @@ def main():
     if start > end:
         raise SystemExit("START_DATE must be <= END_DATE")
 
-    shards = list(split_ranges(start, end, args.shards))
+    queue = None
+    if args.work_stealing:
+        queue, added = fill_window_queue(args.queue, start.date(), end.date(), args.window_days)
+        print(f"window queue {args.queue}: {added} new windows, {queue.counts()}")
+        shards = [(i, start, end) for i in range(1, args.shards + 1)]
+    else:
+        shards = list(split_ranges(start, end, args.shards))
     backoff_schedule = [15 * 60, 30 * 60]
     attempt = 0
 
@@ -72,21 +101,34 @@ def main():
             env["START_DATE"] = s.strftime("%Y-%m-%d")
             env["END_DATE"] = e.strftime("%Y-%m-%d")
             env["OUTPUT_JSONL"] = f"output/part{idx}.jsonl"
-            env["TREND_CACHE_PATH"] = f"trend_cache_part{idx}.sqlite"
+            env["TREND_CACHE_PATH"] = args.trend_cache
+            env["TREND_CACHE_SHARED"] = "1"
+            env["SHARD_ID"] = str(idx)
             env["FAILED_URLS_PATH"] = f"output/failed_urls_part{idx}.txt"
-            jobdir = f"jobdir_{idx}"
+            env["RETRY_QUEUE_PATH"] = f"output/retry_part{idx}.sqlite"
+            env["PENDING_SPILL_PATH"] = f"output/pending_part{idx}.jsonl"
+            env["LEDGER_PATH"] = args.ledger
+            env["LEDGER_RUN_ID"] = str(idx)
 
             cmd = [
                 "scrapy",
                 "crawl",
                 "weibo_total",
-                "-s",
-                f"JOBDIR={jobdir}",
             ]
-
-            print(f"[shard {idx}] {env['START_DATE']} -> {env['END_DATE']}")
+            if queue is not None:
+                env["WORK_QUEUE_PATH"] = args.queue
+                env["WORKER_ID"] = f"worker{idx}"
+                jobdir = ""
+                print(f"[worker {idx}] leasing from {args.queue}")
+            elif args.ledger:
+                jobdir = ""
+                print(f"[shard {idx}] {env['START_DATE']} -> {env['END_DATE']} (resume from {args.ledger})")
+            else:
+                jobdir = f"jobdir_{idx}"
+                cmd += ["-s", f"JOBDIR={jobdir}"]
+                print(f"[shard {idx}] {env['START_DATE']} -> {env['END_DATE']}")
             print(f"  output: {env['OUTPUT_JSONL']}")
-            print(f"  jobdir: {jobdir}")
+            print(f"  jobdir: {jobdir or '-'}")
 
             if args.dry_run:
                 continue
@@ -103,9 +145,19 @@ def main():
 
         # detect timeout_backoff finish
         timed_out = False
+        if queue is not None:
+            # Windows released by workers that stopped on backoff are still open.
+            counts = queue.counts()
+            print(f"window queue {args.queue}: {counts}")
+            timed_out = any(status != "done" and n for status, n in counts.items())
+        scope = os.getenv("LEDGER_SCOPE") or "weibo_total"
         for idx, jobdir in shard_meta:
-            reason = read_finish_reason(jobdir)
-            if "timeout_backoff" in reason:
+            if args.ledger:
+                reason = finish_reason(args.ledger, scope, str(idx))
+            else:
+                reason = read_finish_reason(jobdir) if jobdir else ""
+            # A finished run that left list pages failed needs another pass too.
+            if "timeout_backoff" in reason or reason == "failed_pages":
                 timed_out = True
                 break
 
@@ -117,7 +169,7 @@ def main():
 
         wait_seconds = backoff_schedule[attempt]
         attempt += 1
-        print(f"timeout detected, sleeping {wait_seconds} seconds before retry...")
+        print(f"timeout or failed pages detected, sleeping {wait_seconds} seconds before retry...")
         time.sleep(wait_seconds)
 
 
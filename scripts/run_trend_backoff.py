@@ -1,9 +1,12 @@
 import argparse
 import os
 import subprocess
+import sys
 import time
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
 try:
     from dotenv import load_dotenv
 
@@ -11,12 +14,19 @@ try:
 except Exception:
     pass
 
+from weibo_hot.ledger import finish_reason  # noqa: E402
+
 
 def main():
     parser = argparse.ArgumentParser(description="Run weibo_trend with backoff on timeout")
     parser.add_argument("--keywords", default=os.getenv("KEYWORDS_FILE", "output/keywords.txt"))
     parser.add_argument("--out", default=os.getenv("OUTPUT_JSONL", "output/trend.jsonl"))
     parser.add_argument("--jobdir", default=os.getenv("TREND_JOBDIR", "jobdir_trend"))
+    parser.add_argument(
+        "--ledger",
+        default=os.getenv("LEDGER_PATH", "crawl_ledger.sqlite"),
+        help="Ledger the run records how it ended in",
+    )
     args = parser.parse_args()
 
     backoff_schedule = [15 * 60, 30 * 60]
@@ -25,6 +35,8 @@ def main():
     while True:
         env = os.environ.copy()
         env["OUTPUT_JSONL"] = args.out
+        env["LEDGER_PATH"] = args.ledger
+        env["LEDGER_RUN_ID"] = "trend"
 
         cmd = [
             "scrapy",
@@ -41,8 +53,8 @@ def main():
 
         # detect timeout_backoff finish
         state = Path(args.jobdir) / "spider.state"
-        reason = ""
-        if state.exists():
+        reason = finish_reason(args.ledger, os.getenv("LEDGER_SCOPE") or "weibo_trend", "trend") if args.ledger else ""
+        if not args.ledger and state.exists():
             try:
                 txt = state.read_text(encoding="utf-8", errors="ignore")
                 for line in txt.splitlines():
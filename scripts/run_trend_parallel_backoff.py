@@ -1,8 +1,12 @@
 import argparse
 import os
 import subprocess
+import sys
 import time
 from pathlib import Path
+from typing import Dict, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
 try:
     from dotenv import load_dotenv
@@ -11,9 +15,57 @@ try:
 except Exception:
     pass
 
+from scrapy.utils.project import get_project_settings  # noqa: E402
+
+from weibo_hot.freshness import RefreshPolicy  # noqa: E402
+from weibo_hot.ledger import finish_reason  # noqa: E402
+from weibo_hot.trend_cache import TrendCache  # noqa: E402
+from weibo_hot.work_queue import WorkQueue  # noqa: E402
+
+
+def read_keywords(path: Path) -> Dict[str, str]:
+    """Keyword -> latest last-seen time ("" without the optional second column)."""
+    keywords: Dict[str, str] = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        keyword, _, last_seen = line.strip().partition("\t")
+        keyword, last_seen = keyword.strip(), last_seen.strip()
+        if keyword and (keyword not in keywords or last_seen > keywords[keyword]):
+            keywords[keyword] = last_seen
+    return keywords
 
-def chunk_keywords(path: Path, shards: int):
-    keywords = [line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+def load_pending_keywords(path: Path, cache_path: str, refresh: Optional[RefreshPolicy] = None):
+    """Keywords still to fetch, as ``keyword`` or ``keyword\tlast_seen`` lines for the spider."""
+    keywords = read_keywords(path)
+    lines = [f"{k}\t{seen}" if seen else k for k, seen in keywords.items()]
+    if not Path(cache_path).exists():
+        return len(keywords), lines
+    cache = TrendCache(cache_path)
+    try:
+        success = cache.load_success_index(refresh=refresh)
+        pending = []
+        for keyword, seen in keywords.items():
+            if keyword in success:
+                # Cached and settled, unless the list saw it after the cached series ends.
+                cached = cache.get(keyword) if refresh is not None and seen else None
+                if not cached or not refresh.needs_refresh(cached, seen):
+                    continue
+            pending.append(f"{keyword}\t{seen}" if seen else keyword)
+    finally:
+        cache.close()
+    return len(keywords), pending
+
+
+def refresh_policy() -> Optional[RefreshPolicy]:
+    settings = get_project_settings()
+    if not settings.getbool("TREND_SKIP_SUCCESS", True):
+        return None
+    return RefreshPolicy.from_settings(settings)
+
+
+def chunk_keywords(keywords, shards: int):
+    # Keywords are already filtered to the ones still missing a trend, so
+    # every keyword costs one request and round-robin balances real work.
     chunks = [[] for _ in range(shards)]
     for i, k in enumerate(keywords):
         chunks[i % shards].append(k)
@@ -49,65 +101,125 @@ def main():
     parser.add_argument("--jobdir-prefix", default=os.getenv("TREND_JOBDIR_PREFIX", "jobdir_trend"))
     parser.add_argument("--output-prefix", default=os.getenv("TREND_OUTPUT_PREFIX", "output/trend_part"))
     parser.add_argument("--keywords-prefix", default=os.getenv("TREND_KEYWORDS_PREFIX", "output/keywords_part"))
+    parser.add_argument(
+        "--trend-cache",
+        default=os.getenv("TREND_CACHE_PATH", "trend_cache.sqlite"),
+        help="Trend cache sqlite shared by all shards",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["queue", "static"],
+        default=os.getenv("TREND_SHARD_MODE", "queue"),
+        help="queue: workers lease keywords from a shared queue; static: fixed keywords_part files",
+    )
+    parser.add_argument("--queue", default=os.getenv("WORK_QUEUE_PATH", "output/keyword_queue.sqlite"))
+    parser.add_argument("--lease-batch", type=int, default=int(os.getenv("TREND_LEASE_BATCH", "50")))
+    parser.add_argument(
+        "--ledger",
+        default=os.getenv("LEDGER_PATH", "crawl_ledger.sqlite"),
+        help="Ledger the shards record how their runs ended in",
+    )
+    parser.add_argument(
+        "--max-rounds",
+        type=int,
+        default=int(os.getenv("TREND_MAX_ROUNDS", "10")),
+        help="Give up after this many backoff/re-spawn rounds",
+    )
     parser.add_argument("--dry-run", action="store_true")
     args = parser.parse_args()
 
     keywords_path = Path(args.keywords)
     shards = args.shards
-    chunks = chunk_keywords(keywords_path, shards)
+    total, pending = load_pending_keywords(keywords_path, args.trend_cache, refresh_policy())
+    print(f"{total} keywords, {total - len(pending)} already cached, {len(pending)} pending")
+
+    queue = None
+    if args.mode == "queue":
+        queue = WorkQueue(args.queue, name="keywords")
+        queue.reset()
+        queue.add(pending)
+        chunks = [None] * shards if pending else []
+    else:
+        chunks = chunk_keywords(pending, shards)
 
     backoff_seconds = 60
 
-    while True:
+    for round_no in range(1, args.max_rounds + 1):
         procs = []
         shard_meta = []
         for i, words in enumerate(chunks, start=1):
-            if not words:
+            if queue is None and not words:
                 continue
-            chunk_file = Path(f"{args.keywords_prefix}{i}.txt")
-            write_chunk(chunk_file, words)
 
             env = os.environ.copy()
             env["OUTPUT_JSONL"] = f"{args.output_prefix}{i}.jsonl"
-            env["TREND_CACHE_PATH"] = f"trend_cache_part{i}.sqlite"
+            env["TREND_CACHE_PATH"] = args.trend_cache
+            env["TREND_CACHE_SHARED"] = "1"
+            env["SHARD_ID"] = str(i)
             env["FAILED_URLS_PATH"] = f"output/failed_urls_trend_part{i}.txt"
+            env["LEDGER_PATH"] = args.ledger
+            env["LEDGER_RUN_ID"] = f"trend{i}"
 
             cmd = [
                 "scrapy",
                 "crawl",
                 "weibo_trend",
-                "-a",
-                f"keywords_file={chunk_file}",
-                "-s",
-                f"JOBDIR={args.jobdir_prefix}_{i}",
             ]
-
-            print(f"[trend shard {i}] keywords: {chunk_file}")
+            if queue is not None:
+                env["WORK_QUEUE_PATH"] = args.queue
+                env["WORK_QUEUE_NAME"] = "keywords"
+                env["WORK_LEASE_BATCH"] = str(args.lease_batch)
+                env["WORKER_ID"] = f"trend{i}"
+                jobdir = ""
+                print(f"[trend worker {i}] leasing from {args.queue}")
+            else:
+                chunk_file = Path(f"{args.keywords_prefix}{i}.txt")
+                write_chunk(chunk_file, words)
+                jobdir = f"{args.jobdir_prefix}_{i}"
+                cmd += ["-a", f"keywords_file={chunk_file}", "-s", f"JOBDIR={jobdir}"]
+                print(f"[trend shard {i}] keywords: {chunk_file} ({len(words)})")
             print(f"  output: {args.output_prefix}{i}.jsonl")
-            print(f"  jobdir: {args.jobdir_prefix}_{i}")
+            print(f"  jobdir: {jobdir or '-'}")
 
             if args.dry_run:
                 continue
 
             proc = subprocess.Popen(cmd, env=env)
             procs.append(proc)
-            shard_meta.append((i, f"{args.jobdir_prefix}_{i}"))
+            shard_meta.append((i, jobdir))
 
         if args.dry_run:
             return
 
         for p in procs:
             p.wait()
-
-        timed_out = False
+        crashed = [i for (i, _), p in zip(shard_meta, procs) if p.returncode != 0]
+        if crashed:
+            print(f"shards {crashed} exited with a non-zero code")
+            if len(crashed) == len(procs):
+                # Nothing ran; another round would fail the same way.
+                raise SystemExit(1)
+
+        timed_out = bool(crashed)
+        if queue is not None:
+            counts = queue.counts()
+            print(f"keyword queue {args.queue}: {counts}")
+            timed_out = any(status != "done" and n for status, n in counts.items())
+        scope = os.getenv("LEDGER_SCOPE") or "weibo_trend"
         for i, jobdir in shard_meta:
-            reason = read_finish_reason(jobdir)
+            if args.ledger:
+                reason = finish_reason(args.ledger, scope, f"trend{i}")
+            else:
+                reason = read_finish_reason(jobdir) if jobdir else ""
             if "timeout_backoff" in reason or "conn_refused_backoff" in reason:
                 timed_out = True
                 break
 
         if not timed_out:
             break
+        if round_no == args.max_rounds:
+            print(f"still unfinished after {args.max_rounds} rounds, giving up")
+            raise SystemExit(1)
 
         print(f"timeout detected, sleeping {backoff_seconds} seconds before retry...")
         time.sleep(backoff_seconds)
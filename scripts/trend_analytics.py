@@ -0,0 +1,94 @@
+import argparse
+import json
+import random
+import sqlite3
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from weibo_hot.analytics import analyze_batch, batch_fields, load_blobs  # noqa: E402
+from weibo_hot.series import encode_series  # noqa: E402
+
+
+def analyze_chunk(args):
+    topics, blobs, gap = args
+    minutes, ranks, offsets = load_blobs(blobs)
+    result = analyze_batch(minutes, ranks, offsets, gap)
+    return [(topic, batch_fields(result, i)) for i, topic in enumerate(topics)]
+
+
+def iter_chunks(cache: str, chunk: int, gap: int):
+    conn = sqlite3.connect(cache, timeout=30.0)
+    try:
+        cur = conn.execute("SELECT topic, series FROM trend_series")
+        while True:
+            rows = cur.fetchmany(chunk)
+            if not rows:
+                break
+            yield [r[0] for r in rows], [r[1] for r in rows], gap
+    finally:
+        conn.close()
+
+
+def synthetic_chunks(topics: int, chunk: int, gap: int, seed: int):
+    rnd = random.Random(seed)
+    # A handful of distinct series reused across topics keeps generation
+    # cheap; the analytics pass does not care.
+    pool = []
+    for _ in range(64):
+        m = rnd.randint(25_000_000, 28_000_000)
+        minutes, ranks = array("i"), array("h")
+        for _ in range(rnd.randint(10, 2000)):
+            minutes.append(m)
+            ranks.append(rnd.randint(1, 50))
+            m += 1 if rnd.random() > 0.01 else rnd.randint(30, 600)
+        pool.append(encode_series(minutes, ranks))
+    for start in range(0, topics, chunk):
+        n = min(chunk, topics - start)
+        yield [f"t{start + i}" for i in range(n)], [pool[(start + i) % len(pool)] for i in range(n)], gap
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Interval and peak analytics over stored trend series")
+    parser.add_argument("--cache", default="trend_cache.sqlite", help="Trend cache sqlite with trend_series")
+    parser.add_argument("--out", default="output/trend_analytics.jsonl", help="Output JSONL (keyword + fields)")
+    parser.add_argument("--gap", type=int, default=10, help="Max minutes between points of one on-board interval")
+    parser.add_argument("--chunk", type=int, default=20000, help="Topics per vectorized batch")
+    parser.add_argument("--workers", type=int, default=1, help="Processes (batches run in parallel)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Benchmark on N generated topics instead of --cache")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        chunks = synthetic_chunks(args.synthetic, args.chunk, args.gap, seed=1)
+        out = None
+    else:
+        chunks = iter_chunks(args.cache, args.chunk, args.gap)
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        out = open(args.out, "w", encoding="utf-8")
+
+    n = 0
+    t0 = time.perf_counter()
+    executor = ProcessPoolExecutor(args.workers) if args.workers > 1 else None
+    try:
+        results = executor.map(analyze_chunk, chunks) if executor else map(analyze_chunk, chunks)
+        for rows in results:
+            n += len(rows)
+            if out is None:
+                continue
+            for topic, fields in rows:
+                out.write(json.dumps({"keyword": topic, **fields}, ensure_ascii=False) + "\n")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if out is not None:
+            out.close()
+    elapsed = time.perf_counter() - t0
+    print(f"analyzed {n} topics in {elapsed:.2f}s ({n / elapsed if elapsed else 0:,.0f} topics/s)")
+
+
+if __name__ == "__main__":
+    main()
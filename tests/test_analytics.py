@@ -0,0 +1,78 @@
+import random
+from array import array
+
+import pytest
+
+from weibo_hot.analytics import FIELDS, analyze_batch, batch_fields, load_blobs, series_fields
+from weibo_hot.series import encode_series, minute_to_str
+
+
+def reference(minutes, ranks, gap):
+    """Plain-Python version of the on-board fields of one topic."""
+    if not minutes:
+        return dict.fromkeys(FIELDS)
+    points = sorted(zip(minutes, ranks), key=lambda p: p[0])
+    stints, start, prev = [], points[0][0], points[0][0]
+    for minute, _ in points[1:]:
+        if minute - prev > gap:
+            stints.append(prev - start + 1)
+            start = minute
+        prev = minute
+    stints.append(prev - start + 1)
+    ranked = [(rank, minute) for minute, rank in points if rank > 0]
+    best = min(ranked, key=lambda p: p[0]) if ranked else None
+    best_time = min(m for r, m in ranked if r == best[0]) if best else None
+    return {
+        "trend_intervals": len(stints),
+        "trend_reentries": len(stints) - 1,
+        "trend_longest_stint_minutes": max(stints),
+        "trend_best_rank": best[0] if best else None,
+        "trend_best_rank_time": minute_to_str(best_time) if best else None,
+    }
+
+
+def random_series(rnd):
+    minute, minutes, ranks = 28_000_000 + rnd.randint(0, 10_000), [], []
+    for _ in range(rnd.randint(1, 60)):
+        minute += 1 if rnd.random() > 0.1 else rnd.randint(2, 120)
+        minutes.append(minute)
+        ranks.append(rnd.choice([0, rnd.randint(1, 50)]))
+    if rnd.random() < 0.3:
+        order = list(range(len(minutes)))
+        rnd.shuffle(order)
+        minutes, ranks = [minutes[i] for i in order], [ranks[i] for i in order]
+    return minutes, ranks
+
+
+def test_batch_matches_the_per_topic_reference():
+    rnd = random.Random(7)
+    series = [random_series(rnd) for _ in range(40)]
+    blobs = [encode_series(array("i", m), array("h", r)) for m, r in series]
+    minutes, ranks, offsets = load_blobs(blobs)
+    for gap in (1, 10):
+        result = analyze_batch(minutes, ranks, offsets, gap)
+        for i, (m, r) in enumerate(series):
+            assert batch_fields(result, i) == reference(m, r, gap)
+
+
+def test_load_blobs_concatenates_absolute_minutes():
+    blobs = [encode_series(array("i", [100, 105]), array("h", [1, 2])), encode_series(array("i", [50]), array("h", [3]))]
+    minutes, ranks, offsets = load_blobs(blobs)
+    assert (minutes.tolist(), ranks.tolist(), offsets.tolist()) == ([100, 105, 50], [1, 2, 3], [0, 2, 3])
+
+
+def test_empty_and_unranked_topics():
+    blobs = [
+        encode_series(array("i"), array("h")),
+        encode_series(array("i", [10, 11, 30]), array("h", [0, 0, 0])),
+    ]
+    result = analyze_batch(*load_blobs(blobs), gap=10)
+    assert batch_fields(result, 0) == dict.fromkeys(FIELDS)
+    fields = batch_fields(result, 1)
+    assert (fields["trend_intervals"], fields["trend_longest_stint_minutes"]) == (2, 2)
+    assert fields["trend_best_rank"] is None and fields["trend_best_rank_time"] is None
+
+
+@pytest.mark.parametrize("blob", [None, b""])
+def test_series_fields_without_a_series(blob):
+    assert series_fields(blob) == dict.fromkeys(FIELDS)
@@ -0,0 +1,131 @@
+import asyncio
+import os
+
+import pytest
+from scrapy import Request, signals
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+from twisted.internet.error import TimeoutError
+
+from weibo_hot.archive import ResponseArchive
+from weibo_hot.middlewares import WeiboHotArchiveMiddleware
+
+LIST_URL = "http://127.0.0.1:1/hotEngineApi/data/list?page=1"
+
+
+def test_bodies_round_trip_and_misses_are_counted(tmp_path):
+    archive = ResponseArchive(str(tmp_path), writer="w")
+    location = archive.put("fp1", "http://x/1", 200, b"body one" * 50)
+    assert location[0] == "seg-w-00001.z"
+    assert location[3] == 400 and location[2] < 400
+    archive.flush()
+    assert archive.get("fp1") == ("http://x/1", 200, b"body one" * 50)
+    assert archive.get("fp2") is None
+    assert (archive.hits, archive.misses) == (1, 1)
+    archive.close()
+
+
+def test_newest_copy_wins_unless_not_indexed(tmp_path):
+    archive = ResponseArchive(str(tmp_path), writer="w")
+    archive.put("fp", "http://x", 200, b"old")
+    archive.put("fp", "http://x", 200, b"new")
+    archive.put("fp", "http://x", 500, b"error page", index=False)
+    archive.flush()
+    assert archive.get("fp").body == b"new"
+    assert archive.stats()["archive/stored"] == 3
+    archive.close()
+
+
+def test_segments_roll_over_and_survive_a_reopen(tmp_path):
+    archive = ResponseArchive(str(tmp_path), writer="w", segment_bytes=64, batch_size=2)
+    bodies = {f"fp{i}": os.urandom(100) for i in range(3)}
+    for fp, body in bodies.items():
+        archive.put(fp, "http://x", 200, body)
+    archive.close()
+    assert sorted(p.name for p in tmp_path.glob("seg-*")) == ["seg-w-00001.z", "seg-w-00002.z", "seg-w-00003.z"]
+    archive = ResponseArchive(str(tmp_path), writer="w", segment_bytes=64)
+    assert archive.put("fp3", "http://x", 200, b"more")[0] == "seg-w-00004.z"
+    assert {fp: archive.get(fp).body for fp in bodies} == bodies
+    archive.close()
+
+
+def test_reparse_serves_archived_bodies_and_drops_the_rest(tmp_path):
+    settings = {"ARCHIVE_ENABLED": True, "ARCHIVE_DIR": str(tmp_path)}
+    crawler = get_crawler(settings_dict=settings)
+    middleware = WeiboHotArchiveMiddleware.from_crawler(crawler)
+    request = Request(LIST_URL)
+    assert asyncio.run(middleware.process_request(request)) is None
+    middleware.process_response(request, Response(LIST_URL, status=200, body=b"cipher"))
+    middleware.process_response(Request(LIST_URL + "2"), Response(LIST_URL + "2", status=502, body=b"bad"))
+    crawler.signals.send_catch_log(signals.spider_closed, spider=None, reason="finished")
+    assert crawler.stats.get_value("archive/stored") == 1
+
+    crawler = get_crawler(settings_dict=dict(settings, REPARSE_ONLY=True))
+    middleware = WeiboHotArchiveMiddleware.from_crawler(crawler)
+    response = asyncio.run(middleware.process_request(Request(LIST_URL)))
+    assert (response.status, response.body, response.flags) == (200, b"cipher", ["archived"])
+    with pytest.raises(IgnoreRequest):
+        asyncio.run(middleware.process_request(Request(LIST_URL + "2")))
+    assert asyncio.run(middleware.process_request(Request("http://127.0.0.1:1/other"))) is None
+    middleware.spider_closed()
+
+
+def test_session_events_keep_their_order_across_a_reopen(tmp_path):
+    archive = ResponseArchive(str(tmp_path), writer="w")
+    location = archive.put("fp", "http://x", 200, b"ok", index=False)
+    archive.record("s", "fp", "http://x", 0.0, 0.5, 0, "TimeoutError")
+    archive.record("s", "fp", "http://x", 1.0, 0.2, 200, location=location)
+    archive.record("other", "fp", "http://x", 0.0, 0.1, 200, location=location)
+    archive.close()
+    archive = ResponseArchive(str(tmp_path), writer="w")
+    archive.record("s", "fp2", "http://y", 2.0, 0.1, 404)
+    archive.flush()
+    events = archive.session("s")
+    assert [(e.status, e.error) for e in events["fp"]] == [(0, "TimeoutError"), (200, "")]
+    assert archive.read(*events["fp"][1][6:]) == b"ok"
+    assert [e.status for e in events["fp2"]] == [404]
+    assert archive.conn.execute("SELECT MAX(seq) FROM archive_events WHERE session='s'").fetchone()[0] == 3
+    assert archive.get("fp") is None
+    archive.close()
+
+
+def _record_session(tmp_path):
+    crawler = get_crawler(settings_dict={"RECORD_SESSION": "s", "ARCHIVE_DIR": str(tmp_path)})
+    middleware = WeiboHotArchiveMiddleware.from_crawler(crawler)
+    outcomes = [TimeoutError(), (503, b"busy"), (200, b"page")]
+    for outcome in outcomes:
+        request = Request(LIST_URL)
+        asyncio.run(middleware.process_request(request))
+        assert "archive_sent_at" in request.meta
+        if isinstance(outcome, Exception):
+            middleware.process_exception(request, outcome)
+        else:
+            status, body = outcome
+            middleware.process_response(request, Response(LIST_URL, status=status, body=body))
+    crawler.signals.send_catch_log(signals.spider_closed, spider=None, reason="finished")
+    assert crawler.stats.get_value("archive/events") == 3
+
+
+def test_replay_serves_the_recorded_outcomes_in_order(tmp_path):
+    _record_session(tmp_path)
+    crawler = get_crawler(settings_dict={"REPLAY_SESSION": "s", "ARCHIVE_DIR": str(tmp_path)})
+    crawler.stats.open_spider(None)
+    middleware = WeiboHotArchiveMiddleware.from_crawler(crawler)
+    with pytest.raises(TimeoutError):
+        asyncio.run(middleware.process_request(Request(LIST_URL)))
+    replies = [asyncio.run(middleware.process_request(Request(LIST_URL))) for _ in range(3)]
+    assert [(r.status, r.body) for r in replies] == [(503, b"busy"), (200, b"page"), (200, b"page")]
+    assert replies[0].request.meta["dont_retry"]
+    with pytest.raises(IgnoreRequest):
+        asyncio.run(middleware.process_request(Request(LIST_URL + "2")))
+    stats = crawler.stats.get_stats()
+    assert [stats.get(f"replay/{k}") for k in ("errors", "served", "reused", "misses")] == [1, 3, 1, 1]
+    middleware.spider_closed()
+
+
+def test_replay_of_an_unknown_session_fails(tmp_path):
+    _record_session(tmp_path)
+    crawler = get_crawler(settings_dict={"REPLAY_SESSION": "nope", "ARCHIVE_DIR": str(tmp_path)})
+    with pytest.raises(ValueError):
+        WeiboHotArchiveMiddleware.from_crawler(crawler)
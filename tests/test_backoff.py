@@ -0,0 +1,108 @@
+import logging
+import time
+
+import pytest
+from scrapy.http import Request, Response
+from scrapy.utils.test import get_crawler
+from twisted.internet import reactor
+from twisted.internet.error import ConnectionRefusedError, DNSLookupError, TimeoutError
+
+from weibo_hot.middlewares import WeiboHotDownloaderMiddleware
+
+
+class FakeEngine:
+    def __init__(self):
+        self.paused = False
+
+    def pause(self):
+        self.paused = True
+
+    def unpause(self):
+        self.paused = False
+
+
+class FakeSpider:
+    logger = logging.getLogger("test_backoff")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def later(monkeypatch):
+    calls = []
+
+    class Call:
+        def __init__(self, delay, fn):
+            self.delay, self.fn, self.cancelled = delay, fn, False
+            calls.append(self)
+
+        def active(self):
+            return not self.cancelled
+
+        def cancel(self):
+            self.cancelled = True
+
+    monkeypatch.setattr(reactor, "callLater", Call, raising=False)
+    return calls
+
+
+@pytest.fixture
+def mw(clock, later):
+    crawler = get_crawler(settings_dict={"BACKOFF_BASE_DELAY": 4.0, "BACKOFF_MAX_DELAY": 10.0, "BACKOFF_MAX_RETRIES": 2})
+    crawler.stats.open_spider(None)
+    crawler.engine = FakeEngine()
+    crawler.spider = FakeSpider()
+    return WeiboHotDownloaderMiddleware.from_crawler(crawler)
+
+
+def test_timeout_pauses_the_engine_and_reschedules(mw, later):
+    request = Request("https://h/data/list?pageNo=2")
+    retry = mw.process_exception(request, TimeoutError(), None)
+    assert retry.url == request.url and retry.dont_filter
+    assert retry.meta["backoff_retries"] == 1
+    assert mw.crawler.engine.paused
+    assert 2.0 <= later[0].delay <= 4.0
+    later[0].fn()
+    assert not mw.crawler.engine.paused
+    stats = mw.crawler.stats
+    assert (stats.get_value("backoff/pauses"), stats.get_value("backoff/retried")) == (1, 1)
+
+
+def test_a_burst_of_failures_is_one_pause(mw, later):
+    mw.process_exception(Request("https://h/a"), TimeoutError(), None)
+    assert mw.process_exception(Request("https://h/b"), ConnectionRefusedError(), None) is not None
+    assert len(later) == 1
+    assert mw.level == 1
+
+
+def test_delay_grows_up_to_the_cap(mw, later, clock):
+    for _ in range(4):
+        mw.process_exception(Request("https://h/a"), TimeoutError(), None)
+        clock[0] += 100
+    assert mw.level == 4
+    assert [call.cancelled for call in later] == [True, True, True, False]
+    assert 5.0 <= later[-1].delay <= 10.0
+
+
+def test_other_errors_and_exhausted_requests_fall_through(mw):
+    assert mw.process_exception(Request("https://h/a"), DNSLookupError(), None) is None
+    assert mw.process_exception(Request("https://h/a", meta={"dont_retry": True}), TimeoutError(), None) is None
+    tired = Request("https://h/a", meta={"backoff_retries": 2})
+    assert mw.process_exception(tired, TimeoutError(), None) is None
+    assert mw.crawler.stats.get_value("backoff/gave_up") == 1
+
+
+def test_first_success_after_the_pause_resets_the_level(mw, clock):
+    request = Request("https://h/a")
+    mw.process_exception(request, TimeoutError(), None)
+    mw.process_response(request, Response(request.url, status=200), None)
+    assert mw.level == 1
+    clock[0] += 30
+    mw.process_response(request, Response(request.url, status=200), None)
+    assert mw.level == 0
+    assert mw.crawler.stats.get_value("backoff/max_recovery_seconds") == 30
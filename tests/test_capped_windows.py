@@ -0,0 +1,92 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import date
+
+import pytest
+
+import mock_hotengine_server
+from conftest import ROOT
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def capped_mock():
+    # No day has more rows than the cap, so splitting can reach every row.
+    port = free_port()
+    mock = subprocess.Popen(
+        [
+            sys.executable,
+            str(ROOT / "scripts" / "mock_hotengine_server.py"),
+            "--port",
+            str(port),
+            "--list-cap",
+            "60",
+            "--topics-per-day",
+            "20",
+            "--busy-every",
+            "0",
+            "--series-minutes",
+            "30",
+            "--latency",
+            "0",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if time.time() > deadline:
+                mock.kill()
+                raise
+            time.sleep(0.1)
+    yield f"http://127.0.0.1:{port}/hotEngineApi"
+    mock.terminate()
+    mock.wait()
+
+
+@pytest.mark.parametrize("spider", ["weibo_total", "weibo_list"])
+@pytest.mark.parametrize("fanout", ["1", "4"])
+def test_capped_windows_yield_each_row_once(tmp_path, capped_mock, spider, fanout):
+    out = tmp_path / "items.jsonl"
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(ROOT),
+        SCRAPY_SETTINGS_MODULE="weibo_hot.settings",
+        HOTENGINE_BASE_URL=capped_mock,
+        START_DATE="2024-01-01",
+        END_DATE="2024-01-12",
+        DATE_PLAN="adaptive",
+        LIST_WINDOW_CAP="0",
+        LIST_PAGE_FANOUT=fanout,
+        PAGE_SIZE="10",
+        OUTPUT_JSONL=str(out),
+        DOWNLOAD_DELAY="0",
+        AUTOTHROTTLE_ENABLED="0",
+    )
+    # Run from tmp_path so the ledger, caches and queues land there.
+    subprocess.run(
+        [sys.executable, "-m", "scrapy", "crawl", spider, "-s", "LOG_LEVEL=WARNING"],
+        cwd=str(tmp_path),
+        env=env,
+        check=True,
+        timeout=300,
+    )
+    rows = [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()]
+    keys = [(row["keyword"], row["last_exists_time"]) for row in rows]
+    dataset = mock_hotengine_server.Dataset(20, 0, 0.3, 30)
+    expected = {(row["topic"], row["updateTime"]) for row in dataset.rows(date(2024, 1, 1), date(2024, 1, 12))}
+    assert len(keys) == len(expected)
+    assert set(keys) == expected
@@ -0,0 +1,37 @@
+import base64
+import json
+
+import pytest
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+from weibo_hot.codec import AES_KEY, PayloadCodec, decode, decrypt
+
+
+def encrypt(obj):
+    raw = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    return b'"' + base64.b64encode(AES.new(AES_KEY, AES.MODE_ECB).encrypt(pad(raw, 16))) + b'"'
+
+
+def test_decode_round_trip():
+    payload = {"code": 1, "data": ["热搜", 2]}
+    assert decode(b"  " + encrypt(payload) + b"\n") == payload
+
+
+def test_bad_padding_is_rejected():
+    body = base64.b64encode(AES.new(AES_KEY, AES.MODE_ECB).encrypt(b"x" * 16))
+    with pytest.raises(ValueError):
+        decrypt(body)
+
+
+def test_thread_pool_is_gone():
+    with pytest.raises(ValueError):
+        PayloadCodec(pool="thread")
+
+
+def test_process_pool_does_not_fork_the_crawler():
+    codec = PayloadCodec(pool="process", offload_bytes=0, workers=1)
+    try:
+        assert codec._process_pool()._mp_context.get_start_method() in ("forkserver", "spawn")
+    finally:
+        codec.close()
@@ -0,0 +1,21 @@
+from scrapy.settings import Settings
+
+from weibo_hot.endpoints import LIST, TREND, endpoint_kind, endpoint_slots
+
+
+def test_endpoint_kind():
+    assert endpoint_kind("https://h/hotEngineApi/data/list?pageNo=1") == LIST
+    assert endpoint_kind("https://h/hotEngineApi/data/superInfo?keyword=a") == TREND
+    assert endpoint_kind("https://h/hotEngineApi/data/liftingDiagram") == TREND
+    assert endpoint_kind("https://h/other") is None
+
+
+def test_slots_split_the_host_rate_and_concurrency():
+    slots = endpoint_slots(Settings({"DOWNLOAD_DELAY": 0.5, "CONCURRENT_REQUESTS_PER_DOMAIN": 5}))
+    assert [slots[k]["delay"] for k in (LIST, TREND)] == [1.0, 1.0]
+    assert [slots[k]["concurrency"] for k in (LIST, TREND)] == [3, 2]
+
+
+def test_explicit_slot_delay_wins():
+    slots = endpoint_slots(Settings({"DOWNLOAD_DELAY": 0.5, "LIST_DELAY": "0.2", "TREND_DELAY": ""}))
+    assert (slots[LIST]["delay"], slots[TREND]["delay"]) == (0.2, 1.0)
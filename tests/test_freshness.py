@@ -0,0 +1,65 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from weibo_hot.freshness import RefreshPolicy
+
+NOW = datetime(2024, 1, 10, 12, 0)
+
+
+@pytest.fixture
+def policy():
+    return RefreshPolicy(settle_minutes=60, min_age_minutes=60, slack_minutes=10, utc_offset_hours=8)
+
+
+def cached(last_date, updated_at):
+    return {"first_date": "2024-01-01 00:00:00", "last_date": last_date, "updated_at": updated_at}
+
+
+def test_settled_row_is_kept(policy):
+    # Fetched 2024-01-02 10:00 API time, series ended 08:00: off the board.
+    assert not policy.needs_refresh(cached("2024-01-02 08:00:00", "2024-01-02T02:00:00"), now=NOW)
+
+
+def test_row_fetched_while_on_the_board_is_refreshed(policy):
+    assert policy.needs_refresh(cached("2024-01-02 09:30:00", "2024-01-02T02:00:00"), now=NOW)
+
+
+def test_recent_fetch_is_never_refreshed(policy):
+    row = cached("2024-01-10 19:50:00", "2024-01-10T11:30:00")
+    assert not policy.needs_refresh(row, now=NOW)
+
+
+def test_list_row_seen_after_the_series_forces_refresh(policy):
+    row = cached("2024-01-02 08:00:00", "2024-01-02T02:00:00")
+    assert not policy.needs_refresh(row, "2024-01-02 08:05:00", now=NOW)
+    assert policy.needs_refresh(row, "2024-01-03 08:00:00", now=NOW)
+
+
+def test_bare_date_covers_the_whole_day(policy):
+    assert policy.needs_refresh(cached("2024-01-02", "2024-01-02T02:00:00"), now=NOW)
+
+
+def test_rows_without_timestamps_keep_the_old_skip(policy):
+    assert not policy.needs_refresh({"last_date": "2024-01-02 08:00:00"}, now=NOW)
+    assert not policy.needs_refresh(cached("", "2024-01-02T02:00:00"), now=NOW)
+
+
+def test_settled_sql_agrees_with_needs_refresh(policy):
+    rows = [
+        ("settled", "2024-01-02 08:00:00", "2024-01-02T02:00:00"),
+        ("on_board", "2024-01-02 09:30:00", "2024-01-02T02:00:00"),
+        ("bare_date", "2024-01-02", "2024-01-02T02:00:00"),
+        ("no_updated_at", "2024-01-02 09:30:00", None),
+        ("bad_updated_at", "2024-01-02 09:30:00", "yesterday"),
+        ("iso_micro", "2024-01-02 09:30:00", "2024-01-02T02:00:00.123456"),
+        ("space_format", "2024-01-02 08:00:00", "2024-01-02 02:00:00"),
+    ]
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE trend_cache_minute (topic TEXT, last_date TEXT, updated_at TEXT)")
+    conn.executemany("INSERT INTO trend_cache_minute VALUES (?, ?, ?)", rows)
+    where, params = policy.settled_sql()
+    kept = {row[0] for row in conn.execute(f"SELECT topic FROM trend_cache_minute WHERE {where}", params)}
+    expected = {topic for topic, last, updated in rows if not policy.needs_refresh(cached(last, updated))}
+    assert kept == expected == {"settled", "no_updated_at", "bad_updated_at", "space_format"}
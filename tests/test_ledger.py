@@ -0,0 +1,110 @@
+import multiprocessing
+import sqlite3
+from datetime import date
+
+import pytest
+
+from weibo_hot.ledger import CrawlLedger
+
+D = date.fromisoformat
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = CrawlLedger(str(tmp_path / "ledger.sqlite"), scope="weibo_total", run_id="t")
+    yield ledger
+    ledger.close()
+
+
+def test_remaining_untouched_range_is_one_gap(ledger):
+    assert ledger.remaining(D("2024-01-01"), D("2024-01-05")) == ([], [(D("2024-01-01"), D("2024-01-05"))])
+
+
+def test_remaining_skips_done_windows_and_splits_gaps(ledger):
+    ledger.page_parsed(D("2024-01-03"), D("2024-01-03"), 1, total=5, total_pages=1)
+    assert ledger.page_done(D("2024-01-03"), D("2024-01-03"), 1, rows=5)
+    pages, gaps = ledger.remaining(D("2024-01-01"), D("2024-01-05"))
+    assert pages == []
+    assert gaps == [(D("2024-01-01"), D("2024-01-02")), (D("2024-01-04"), D("2024-01-05"))]
+
+
+def test_remaining_lists_unfinished_pages_of_open_windows(ledger):
+    day = D("2024-01-02")
+    ledger.page_started(day, day, 1)
+    ledger.page_parsed(day, day, 1, total=60, total_pages=3)
+    ledger.page_done(day, day, 1, rows=20)
+    ledger.page_started(day, day, 2)
+    ledger.page_failed(day, day, 2)
+    pages, gaps = ledger.remaining(D("2024-01-01"), D("2024-01-03"))
+    assert pages == [(day, day, 2), (day, day, 3)]
+    assert gaps == [(D("2024-01-01"), D("2024-01-01")), (D("2024-01-03"), D("2024-01-03"))]
+
+
+def test_remaining_without_resume_reopens_the_range(ledger):
+    day = D("2024-01-01")
+    ledger.page_parsed(day, day, 1, total=1, total_pages=1)
+    ledger.page_done(day, day, 1, rows=1)
+    assert ledger.remaining(day, D("2024-01-02"), resume=False) == ([], [(day, D("2024-01-02"))])
+    assert ledger.done_dates(day, D("2024-01-02")) == set()
+
+
+def test_duplicate_start_does_not_undo_a_done_page(ledger):
+    day = D("2024-01-01")
+    ledger.page_parsed(day, day, 1, total=40, total_pages=2)
+    ledger.page_done(day, day, 1, rows=20)
+    ledger.page_started(day, day, 1)
+    ledger.flush()
+    pages, _ = ledger.remaining(day, day)
+    assert pages == [(day, day, 2)]
+
+
+def test_finished_run_with_failed_pages_is_reported(ledger):
+    day = D("2024-01-01")
+    ledger.run_started()
+    ledger.page_parsed(day, day, 1, total=40, total_pages=2)
+    ledger.page_failed(day, day, 2)
+    ledger.run_finished("finished")
+    assert ledger.last_run()["pages_failed"] == 1
+
+
+def _open_ledger(args):
+    path, barrier = args
+    barrier.wait()
+    try:
+        CrawlLedger(path, scope="weibo_total").close()
+    except Exception as exc:
+        return repr(exc)
+    return None
+
+
+def test_concurrent_opens_of_a_fresh_file(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    for i in range(5):
+        path = str(tmp_path / f"ledger{i}.sqlite")
+        with ctx.Manager() as manager:
+            barrier = manager.Barrier(6)
+            with ctx.Pool(6) as pool:
+                assert pool.map(_open_ledger, [(path, barrier)] * 6) == [None] * 6
+
+
+def test_old_file_is_migrated(tmp_path):
+    path = str(tmp_path / "old.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE ledger_pages (scope TEXT, start_date TEXT, end_date TEXT, page_no INTEGER, rows INTEGER, "
+        "done_at TEXT, PRIMARY KEY (scope, start_date, end_date, page_no))"
+    )
+    conn.execute(
+        "CREATE TABLE ledger_windows (scope TEXT, start_date TEXT, end_date TEXT, total INTEGER, pages INTEGER, "
+        "done_at TEXT, PRIMARY KEY (scope, start_date, end_date))"
+    )
+    conn.execute("INSERT INTO ledger_windows VALUES ('weibo_total', '2024-01-01', '2024-01-01', 20, 1, 'x')")
+    conn.commit()
+    conn.close()
+    ledger = CrawlLedger(path, scope="weibo_total", run_id="t")
+    ledger.run_started()
+    day = D("2024-01-02")
+    ledger.page_parsed(day, day, 1, total=20, total_pages=1)
+    ledger.page_done(day, day, 1, rows=20)
+    assert ledger.remaining(D("2024-01-01"), day) == ([], [(D("2024-01-01"), D("2024-01-01"))])
+    ledger.close()
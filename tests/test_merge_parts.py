@@ -0,0 +1,85 @@
+import json
+import sys
+
+import pytest
+
+import merge_parts
+
+
+def write_part(path, rows):
+    path.write_text("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows), encoding="utf-8")
+
+
+def run(monkeypatch, tmp_path, *args):
+    out = tmp_path / "merged.jsonl"
+    argv = ["merge_parts.py", "--parts", str(tmp_path / "part*.jsonl"), "--out", str(out), *args]
+    monkeypatch.setattr(sys, "argv", argv)
+    merge_parts.main()
+    return [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()]
+
+
+@pytest.mark.parametrize("chunk_args", [[], ["--chunk-mb", "0", "--fan-in", "2"]])
+def test_list_rows_dedup_on_keyword_and_date_keeping_the_fullest(monkeypatch, tmp_path, chunk_args):
+    write_part(
+        tmp_path / "part1.jsonl",
+        [
+            {"keyword": "b", "last_exists_time": "2024-01-02 10:00:00", "trend_first_time": None},
+            {"keyword": "a", "last_exists_time": "2024-01-03 08:00:00"},
+            "not an object",
+        ],
+    )
+    write_part(
+        tmp_path / "part2.jsonl",
+        [
+            {"keyword": "b", "last_exists_time": "2024-01-02 10:00:00", "trend_first_time": "2024-01-02 09:00:00"},
+            {"keyword": "a", "last_exists_time": "2024-01-01 08:00:00"},
+            {"keyword": "", "last_exists_time": "2024-01-01 00:00:00"},
+        ],
+    )
+    (tmp_path / "part3.jsonl").write_text("{broken\n\n", encoding="utf-8")
+    rows = run(monkeypatch, tmp_path, *chunk_args)
+    assert [(r["keyword"], r["last_exists_time"]) for r in rows] == [
+        ("a", "2024-01-01 08:00:00"),
+        ("b", "2024-01-02 10:00:00"),
+        ("a", "2024-01-03 08:00:00"),
+    ]
+    assert rows[1]["trend_first_time"] == "2024-01-02 09:00:00"
+
+
+def test_later_copy_wins_a_tie(monkeypatch, tmp_path):
+    write_part(tmp_path / "part1.jsonl", [{"keyword": "a", "last_exists_time": "2024-01-01", "rank": 1}])
+    write_part(tmp_path / "part2.jsonl", [{"keyword": "a", "last_exists_time": "2024-01-01", "rank": 2}])
+    assert [r["rank"] for r in run(monkeypatch, tmp_path)] == [2]
+
+
+@pytest.mark.parametrize("chunk_args", [[], ["--chunk-mb", "0", "--fan-in", "2"]])
+def test_trend_rows_dedup_on_keyword_and_sort_by_first_time(monkeypatch, tmp_path, chunk_args):
+    write_part(
+        tmp_path / "part1.jsonl",
+        [
+            {"keyword": "x", "trend_first_time": "2024-01-05 00:00:00"},
+            {"keyword": "y", "trend_first_time": "2024-01-02 00:00:00", "trend_last_time": "2024-01-03 00:00:00"},
+        ],
+    )
+    write_part(
+        tmp_path / "part2.jsonl",
+        [
+            {"keyword": "y", "trend_first_time": "2024-01-09 00:00:00"},
+            {"keyword": "z", "trend_first_time": "2024-01-01 00:00:00"},
+        ],
+    )
+    rows = run(monkeypatch, tmp_path, *chunk_args)
+    assert [(r["keyword"], r["trend_first_time"]) for r in rows] == [
+        ("z", "2024-01-01 00:00:00"),
+        ("y", "2024-01-02 00:00:00"),
+        ("x", "2024-01-05 00:00:00"),
+    ]
+
+
+def test_output_file_is_not_read_as_a_part(monkeypatch, tmp_path):
+    write_part(tmp_path / "part1.jsonl", [{"keyword": "a", "last_exists_time": "2024-01-01"}])
+    out = tmp_path / "part_merged.jsonl"
+    write_part(out, [{"keyword": "stale", "last_exists_time": "2023-01-01"}])
+    monkeypatch.setattr(sys, "argv", ["merge_parts.py", "--parts", str(tmp_path / "part*.jsonl"), "--out", str(out)])
+    merge_parts.main()
+    assert [json.loads(line)["keyword"] for line in out.read_text(encoding="utf-8").splitlines()] == ["a"]
@@ -0,0 +1,58 @@
+import sqlite3
+
+import merge_trend_cache
+from weibo_hot.trend_cache import TrendCache
+
+
+def old_part(path, rows):
+    conn = sqlite3.connect(str(path))
+    conn.execute(
+        "CREATE TABLE trend_cache_minute (topic TEXT PRIMARY KEY, first_date TEXT, last_date TEXT, "
+        "duration_minutes INTEGER, points INTEGER, updated_at TEXT)"
+    )
+    conn.executemany("INSERT INTO trend_cache_minute VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def merge(out, *parts):
+    TrendCache(str(out)).close()
+    conn = sqlite3.connect(str(out))
+    for part in parts:
+        merge_trend_cache.merge_part(conn, part)
+    rows = {
+        row[0]: row[1:]
+        for row in conn.execute("SELECT topic, first_date, updated_at, writer FROM trend_cache_minute")
+    }
+    conn.close()
+    return rows
+
+
+def test_rows_keep_their_shard_writer(tmp_path):
+    part = tmp_path / "trend_cache_part0.sqlite"
+    cache = TrendCache(str(part), writer="0")
+    cache.set("a", "2024-01-01 10:00:00", "2024-01-01 11:00:00", 60, 60)
+    cache.close()
+    old = tmp_path / "trend_cache_part1.sqlite"
+    old_part(old, [("b", "2024-01-02 10:00:00", "2024-01-02 11:00:00", 60, 60, "2024-01-03T00:00:00.5")])
+    rows = merge(tmp_path / "out.sqlite", part, old)
+    assert rows["a"][2] == "0"
+    assert rows["b"][1:] == ("2024-01-03 00:00:00", None)
+
+
+def test_newer_row_wins_across_timestamp_formats(tmp_path):
+    iso = tmp_path / "iso.sqlite"
+    old_part(iso, [("a", "2024-01-01 10:00:00", "2024-01-01 11:00:00", 60, 60, "2024-01-05T09:00:00")])
+    spaced = tmp_path / "spaced.sqlite"
+    old_part(spaced, [("a", "2024-01-01 09:00:00", "2024-01-01 11:00:00", 120, 120, "2024-01-05 10:00:00")])
+    # "2024-01-05T09..." sorts after "2024-01-05 10..." as a plain string.
+    assert merge(tmp_path / "out1.sqlite", iso, spaced)["a"][0] == "2024-01-01 09:00:00"
+    assert merge(tmp_path / "out2.sqlite", spaced, iso)["a"][0] == "2024-01-01 09:00:00"
+
+
+def test_success_beats_a_newer_empty_row(tmp_path):
+    good = tmp_path / "good.sqlite"
+    old_part(good, [("a", "2024-01-01 10:00:00", "2024-01-01 11:00:00", 60, 60, "2024-01-01 00:00:00")])
+    empty = tmp_path / "empty.sqlite"
+    old_part(empty, [("a", None, None, 0, 0, "2024-02-01 00:00:00")])
+    assert merge(tmp_path / "out.sqlite", good, empty)["a"][0] == "2024-01-01 10:00:00"
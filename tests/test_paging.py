@@ -0,0 +1,103 @@
+from datetime import date
+
+import pytest
+
+from weibo_hot.paging import WindowPlanner, iter_windows, next_pages
+
+D = date.fromisoformat
+
+
+@pytest.mark.parametrize(
+    "page_no, total_pages, fanout, pages",
+    [
+        (1, 5, 1, [2]),
+        (2, 5, 1, [3]),
+        (1, 5, 3, [2, 3, 4]),
+        (2, 5, 3, [5]),
+        (3, 5, 3, []),
+        (1, 5, 0, [2, 3, 4, 5]),
+        (2, 5, 0, []),
+        (5, 5, 1, []),
+    ],
+)
+def test_next_pages(page_no, total_pages, fanout, pages):
+    assert list(next_pages(page_no, total_pages, fanout)) == pages
+
+
+def test_iter_windows_clips_the_last_window():
+    assert list(iter_windows(D("2024-01-01"), D("2024-01-05"), 2)) == [
+        (D("2024-01-01"), D("2024-01-02")),
+        (D("2024-01-03"), D("2024-01-04")),
+        (D("2024-01-05"), D("2024-01-05")),
+    ]
+
+
+def test_fixed_plan_never_bisects():
+    planner = WindowPlanner(D("2024-01-01"), D("2024-01-10"), step_days=3, cap=100)
+    assert len(list(planner.initial_windows())) == 4
+    assert not planner.should_bisect(D("2024-01-01"), D("2024-01-03"), 500)
+    assert not planner.may_bisect(D("2024-01-01"), D("2024-01-03"), 500)
+
+
+def test_adaptive_plan_bisects_at_the_cap_but_not_single_days():
+    planner = WindowPlanner(D("2024-01-01"), D("2024-01-10"), mode="adaptive", start_days=10, cap=100)
+    start, end = D("2024-01-01"), D("2024-01-10")
+    assert not planner.should_bisect(start, end, 99)
+    assert planner.should_bisect(start, end, 100)
+    assert not planner.should_bisect(start, start, 500)
+    assert planner.bisect(start, end) == [(start, D("2024-01-05")), (D("2024-01-06"), end)]
+    assert planner.is_bisected(start, end)
+    assert not planner.should_bisect(start, end, 100)
+
+
+def test_short_page_teaches_the_cap():
+    planner = WindowPlanner(D("2024-01-01"), D("2024-01-10"), mode="adaptive")
+    start, end = D("2024-01-01"), D("2024-01-10")
+    assert planner.may_bisect(start, end, 10)
+    planner.open_window(start, end, 100)
+    assert planner.note_short_page(start, end, 4, 20)
+    assert planner.cap == 60
+    assert not planner.may_bisect(start, D("2024-01-02"), 59)
+    assert planner.should_bisect(start, D("2024-01-02"), 60)
+
+
+def test_rows_of_a_late_split_are_not_emitted_twice():
+    planner = WindowPlanner(D("2024-01-01"), D("2024-01-04"), mode="adaptive", start_days=4)
+    start, end = D("2024-01-01"), D("2024-01-04")
+    planner.open_window(start, end, 50)
+    assert planner.tracking(start, end)
+    assert [planner.keep_row(start, end, k) for k in ("a", "b")] == [True, True]
+    assert planner.note_short_page(start, end, 2, 2)
+    first, second = planner.bisect(start, end)
+    assert not planner.tracking(start, end)
+    planner.open_window(*first, 3)
+    assert [planner.keep_row(*first, k) for k in ("a", "c")] == [False, True]
+    planner.window_finished(*first)
+    assert [planner.keep_row(*second, k) for k in ("b", "d")] == [False, True]
+    assert planner.summary()["list/split_duplicates_dropped"] == 2
+
+
+def test_finished_window_is_no_longer_tracked():
+    planner = WindowPlanner(D("2024-01-01"), D("2024-01-04"), mode="adaptive", start_days=4)
+    start, end = D("2024-01-01"), D("2024-01-04")
+    planner.open_window(start, end, 5)
+    planner.keep_row(start, end, "a")
+    planner.window_finished(start, end)
+    assert not planner.tracking(start, end)
+    assert planner.keep_row(start, end, "a")
+
+
+def test_windows_that_may_split_are_walked_serially():
+    planner = WindowPlanner(D("2024-01-01"), D("2024-01-10"), mode="adaptive", start_days=10)
+    start, end, day = D("2024-01-01"), D("2024-01-10"), D("2024-01-02")
+    planner.open_window(start, end, 100)
+    planner.open_window(day, day, 100)
+    assert (planner.fanout(start, end, 4), planner.fanout(day, day, 4)) == (1, 4)
+    # A short page of a fanned-out window may not be the first empty one.
+    planner.note_short_page(day, day, 9, 10)
+    assert planner.cap == 0
+    planner.note_short_page(start, end, 7, 10)
+    planner.open_window(D("2024-01-03"), D("2024-01-04"), 59)
+    planner.open_window(D("2024-01-05"), D("2024-01-06"), 60)
+    assert planner.fanout(D("2024-01-03"), D("2024-01-04"), 4) == 4
+    assert planner.fanout(D("2024-01-05"), D("2024-01-06"), 4) == 1
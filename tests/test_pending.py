@@ -0,0 +1,52 @@
+from weibo_hot.pending import ROW_FIELDS, PendingStore
+
+
+def row(keyword, when="2024-01-01 10:00:00"):
+    return (keyword, 1, 100, when, 5, "host", "社会", "", "")
+
+
+def test_rows_group_by_topic_and_count_against_the_limit():
+    store = PendingStore(limit=3)
+    assert store.add("a", row("a")) == 1
+    assert store.add("a", row("a", "2024-01-02 10:00:00")) == 2
+    store.add("b", row("b"))
+    assert (len(store), store.topics, store.headroom(), store.full()) == (3, 2, 0, True)
+    # The limit is soft: a parsed page is always buffered.
+    store.add("c", row("c"))
+    assert store.headroom() == -1
+    assert [r[3] for r in store.pop("a")] == ["2024-01-01 10:00:00", "2024-01-02 10:00:00"]
+    assert ("a" in store, len(store), store.peak) == (False, 2, 4)
+    assert store.pop("missing") == []
+
+
+def test_spill_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "spill" / "pending.jsonl")
+    store = PendingStore(path=path)
+    store.add("话题", row("话题"))
+    store.add("b", row("b"))
+    store.add("b", row("b", "2024-01-03 00:00:00"))
+    assert store.spill([("2024-01-01", "2024-01-01", 2)]) == 3
+    rows, parked = PendingStore(path=path).load()
+    assert rows == {"话题": [row("话题")], "b": [row("b"), row("b", "2024-01-03 00:00:00")]}
+    assert parked == [("2024-01-01", "2024-01-01", 2)]
+    assert len(rows["b"][0]) == len(ROW_FIELDS)
+    # Loading leaves the file for a crash before the next spill.
+    assert PendingStore(path=path).load() == (rows, parked)
+
+
+def test_empty_spill_removes_the_old_file(tmp_path):
+    path = tmp_path / "pending.jsonl"
+    store = PendingStore(path=str(path))
+    store.add("a", row("a"))
+    store.spill()
+    store.pop("a")
+    assert store.spill() == 0
+    assert not path.exists()
+    assert store.load() == ({}, [])
+
+
+def test_no_path_means_no_spill(tmp_path):
+    store = PendingStore()
+    store.add("a", row("a"))
+    assert store.spill([("x",)]) == 0
+    assert store.load() == ({}, [])
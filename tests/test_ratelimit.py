@@ -0,0 +1,71 @@
+import multiprocessing
+import time
+
+import pytest
+from scrapy import signals
+from scrapy.utils.test import get_crawler
+
+from weibo_hot.middlewares import WeiboHotRateLimitMiddleware
+from weibo_hot.ratelimit import SharedTokenBucket
+
+
+def test_buckets_are_closed_with_the_spider(tmp_path):
+    crawler = get_crawler(settings_dict={"GLOBAL_RATE_LIMIT_ENABLED": True, "RATE_LIMIT_DIR": str(tmp_path)})
+    middleware = WeiboHotRateLimitMiddleware.from_crawler(crawler)
+    buckets = list(middleware.buckets.values())
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["list.bucket", "trend.bucket"]
+    crawler.signals.send_catch_log(signals.spider_closed, spider=None, reason="finished")
+    assert middleware.buckets == {}
+    assert all(bucket._fd is None and bucket._mm is None for bucket in buckets)
+
+
+def test_bucket_allows_a_burst_then_asks_to_wait(tmp_path, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    bucket = SharedTokenBucket(str(tmp_path / "b.bucket"), rate=2.0, burst=3.0)
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire() == pytest.approx(0.5)
+    now[0] += 0.5
+    assert bucket.try_acquire() == 0.0
+    bucket.close()
+
+
+def test_processes_share_one_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(time, "monotonic", lambda: 50.0)
+    path = str(tmp_path / "b.bucket")
+    first = SharedTokenBucket(path, rate=1.0, burst=2.0)
+    second = SharedTokenBucket(path, rate=1.0, burst=2.0)
+    assert first.try_acquire() == 0.0
+    assert second.try_acquire() == 0.0
+    assert first.try_acquire() == pytest.approx(1.0)
+    first.close()
+    second.close()
+
+
+def test_clock_going_backwards_refills_the_bucket(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    bucket = SharedTokenBucket(str(tmp_path / "b.bucket"), rate=1.0, burst=1.0)
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() > 0
+    now[0] = 5.0
+    assert bucket.try_acquire() == 0.0
+    bucket.close()
+
+
+def _drain(args):
+    path, barrier = args
+    bucket = SharedTokenBucket(path, rate=0.001, burst=20.0)
+    barrier.wait()
+    taken = sum(bucket.try_acquire() == 0.0 for _ in range(10))
+    bucket.close()
+    return taken
+
+
+def test_concurrent_processes_never_overdraw(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    path = str(tmp_path / "b.bucket")
+    with ctx.Manager() as manager:
+        barrier = manager.Barrier(4)
+        with ctx.Pool(4) as pool:
+            assert sum(pool.map(_drain, [(path, barrier)] * 4)) == 20
@@ -0,0 +1,53 @@
+import pytest
+
+from weibo_hot.retry_queue import RetryQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = RetryQueue(str(tmp_path / "retry.sqlite"), base_delay=10, max_delay=35, max_attempts=3)
+    yield queue
+    queue.close()
+
+
+def test_delay_doubles_up_to_the_cap(queue):
+    assert [queue.delay(n) for n in range(1, 5)] == [10, 20, 35, 35]
+
+
+def test_record_counts_attempts_and_defers(queue):
+    assert queue.record("u1", "list", "timeout") == 1
+    assert queue.record("u1", "list", "timeout") == 2
+    assert queue.due() == []
+    (entry,) = queue.due(now=1e12)
+    assert (entry.url, entry.kind, entry.attempts, entry.last_error) == ("u1", "list", 2, "timeout")
+
+
+def test_due_orders_by_priority_and_keeps_highest(queue):
+    queue.record("low", "list", priority=1)
+    queue.record("high", "trend", priority=5, meta={"topic": "x"})
+    queue.record("high", "trend", priority=2)
+    entries = queue.due(now=1e12)
+    assert [e.url for e in entries] == ["high", "low"]
+    assert entries[0].priority == 5
+    assert entries[0].meta == {"topic": "x"}
+    assert [e.url for e in queue.due(limit=1, now=1e12)] == ["high"]
+
+
+def test_exhausted_entries_are_kept_but_not_handed_out(queue):
+    for _ in range(3):
+        queue.record("u1", "list")
+    assert queue.due(now=1e12) == []
+    assert queue.counts(now=1e12) == {"queued": 1, "exhausted": 1, "deferred": 0}
+
+
+def test_success_removes_the_entry(queue):
+    queue.record("u1", "list")
+    assert queue.succeeded("u1")
+    assert not queue.succeeded("u1")
+    assert queue.urls() == []
+
+
+def test_legacy_urls_are_due_at_once_and_imported_once(queue):
+    assert queue.add_legacy(["a", "b"], lambda url: "list") == 2
+    assert queue.add_legacy(["a"], lambda url: "list") == 0
+    assert sorted(e.url for e in queue.due()) == ["a", "b"]
@@ -0,0 +1,63 @@
+import json
+from array import array
+
+import pytest
+
+from weibo_hot.series import (
+    decode_series,
+    encode_series,
+    extract_series,
+    minute_to_str,
+    summarize_with_series,
+)
+
+
+def payload(points, code=1):
+    return json.dumps({"code": code, "data": [{"name": "t", "value": p} for p in points]}).encode("utf-8")
+
+
+def test_extract_keeps_payload_order_and_ranks():
+    minutes, ranks = extract_series(
+        payload([["2024-01-01 10:00:00", 3], ["2024-01-01 09:59", "7"], ["2024-01-02 00:00:00"], ["2024-01-01 10:01:00", 99999]])
+    )
+    assert [minute_to_str(m) for m in minutes] == [
+        "2024-01-01 10:00:00",
+        "2024-01-01 09:59:00",
+        "2024-01-02 00:00:00",
+        "2024-01-01 10:01:00",
+    ]
+    assert list(ranks) == [3, 7, 0, 32767]
+
+
+@pytest.mark.parametrize("minutes", [[], [5], [28_000_000, 28_000_001, 27_999_000, 28_500_000]])
+def test_encode_decode_round_trip(minutes):
+    ranks = array("h", [i - 1 for i in range(len(minutes))])
+    blob = encode_series(array("i", minutes), ranks)
+    got_minutes, got_ranks = decode_series(blob)
+    assert list(got_minutes) == minutes
+    assert list(got_ranks) == list(ranks)
+
+
+def test_unknown_format_version_is_refused():
+    blob = bytearray(encode_series(array("i", [1]), array("h", [1])))
+    blob[0] = 99
+    with pytest.raises(ValueError):
+        decode_series(bytes(blob))
+
+
+def test_summary_comes_with_the_packed_series():
+    summary, blob = summarize_with_series(payload([["2024-01-01 10:00:00", 1], ["2024-01-01 10:02:00", 2]]))
+    assert (summary.first, summary.last, summary.points) == ("2024-01-01 10:00:00", "2024-01-01 10:02:00", 2)
+    assert [minute_to_str(m) for m in decode_series(blob)[0]] == ["2024-01-01 10:00:00", "2024-01-01 10:02:00"]
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        payload([], code=1),
+        payload([["2024-01-01 10:00:00", 1]], code=0),
+        payload([[1704067200, 3]]),
+    ],
+)
+def test_no_series_without_storable_points(body):
+    assert summarize_with_series(body)[1] is None
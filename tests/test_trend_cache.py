@@ -0,0 +1,152 @@
+import multiprocessing
+import sqlite3
+
+import pytest
+
+from weibo_hot.trend_cache import SuccessIndex, TrendCache
+
+
+def _open_cache(args):
+    path, barrier = args
+    barrier.wait()
+    try:
+        TrendCache(path).close()
+    except Exception as exc:
+        return repr(exc)
+    return None
+
+
+def test_concurrent_opens_of_a_fresh_file(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    for i in range(5):
+        path = str(tmp_path / f"cache{i}.sqlite")
+        with ctx.Manager() as manager:
+            barrier = manager.Barrier(6)
+            with ctx.Pool(6) as pool:
+                assert pool.map(_open_cache, [(path, barrier)] * 6) == [None] * 6
+
+
+def test_old_file_gets_the_writer_column(tmp_path):
+    path = str(tmp_path / "old.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE trend_cache_minute (topic TEXT PRIMARY KEY, first_date TEXT, last_date TEXT, "
+        "duration_minutes INTEGER, points INTEGER, updated_at TEXT)"
+    )
+    conn.execute("INSERT INTO trend_cache_minute VALUES ('a', '2024-01-01', '2024-01-02', 2, 2, NULL)")
+    conn.commit()
+    conn.close()
+    cache = TrendCache(path, writer="1")
+    assert cache.get("a")["writer"] is None
+    cache.set("b", "2024-01-01", "2024-01-01", 1, 1)
+    cache.close()
+    cache = TrendCache(path, writer="2")
+    assert cache.get("b")["writer"] == "1"
+    cache.close()
+
+
+def test_cross_shard_hits_need_both_writers(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    for writer in ("1", ""):
+        cache = TrendCache(path, writer=writer)
+        cache.set(f"by{writer or 'none'}", "2024-01-01", "2024-01-01", 1, 1)
+        cache.close()
+    cache = TrendCache(path, writer="2")
+    cache.get("by1")
+    cache.get("bynone")
+    assert (cache.hits, cache.cross_hits) == (2, 1)
+    cache.close()
+    cache = TrendCache(path)
+    cache.get("by1")
+    assert cache.cross_hits == 0
+    cache.close()
+
+
+def _count(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM trend_cache_minute").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_rows_are_written_in_batches(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = TrendCache(path, batch_size=3)
+    cache.set("a", "2024-01-01", "2024-01-01", 1, 1)
+    cache.set("b", "2024-01-01", "2024-01-01", 1, 1)
+    assert _count(path) == 0
+    cache.set("c", "2024-01-01", "2024-01-01", 1, 1)
+    assert _count(path) == 3
+    assert (cache.commits, cache.rows_written, cache.pending_rows()) == (1, 3, 0)
+    cache.close()
+
+
+def test_buffered_rows_are_read_before_the_flush(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = TrendCache(path, batch_size=100)
+    cache.set("a", "2024-01-01 10:00:00", "2024-01-01 11:00:00", 60, 61)
+    cache.set_day("b", "2024-01-01", "2024-01-03", 3, 3)
+    cache.set_series("a", b"packed", 61)
+    assert cache.get("a")["points"] == 61
+    assert cache.get_day("b")["days"] == 3
+    assert cache.get_series("a") == b"packed"
+    assert _count(path) == 0
+    assert cache.close() == 0
+    assert _count(path) == 1
+
+
+def test_locked_flush_keeps_the_rows_for_the_next_one(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = TrendCache(path, batch_size=100, busy_timeout=0.05)
+    cache.set("a", "2024-01-01", "2024-01-01", 1, 1)
+    other = sqlite3.connect(path)
+    other.execute("BEGIN IMMEDIATE")
+    assert cache.flush() == 0
+    assert cache.pending_rows() == 1
+    other.rollback()
+    assert cache.flush() == 1
+    assert cache.pending_rows() == 0
+    other.close()
+    cache.close()
+
+
+def test_close_reports_rows_it_could_not_write(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = TrendCache(path, batch_size=100, busy_timeout=0.01)
+    cache.set("a", "2024-01-01", "2024-01-01", 1, 1)
+    other = sqlite3.connect(path)
+    other.execute("BEGIN IMMEDIATE")
+    assert cache.close(attempts=2, final_busy_timeout=0.05) == 1
+    assert cache.stats()["trend_cache/rows_dropped"] == 1
+    other.rollback()
+    other.close()
+    assert _count(path) == 0
+
+
+@pytest.mark.parametrize("threshold, kind", [(10, "set"), (2, "sorted-hash")])
+def test_success_index_switches_to_sorted_hashes_above_the_threshold(threshold, kind):
+    topics = [f"topic{i}" for i in range(5)]
+    index = SuccessIndex(iter(topics), size_hint=len(topics), compact_threshold=threshold)
+    assert index.kind == kind
+    assert len(index) == 5
+    assert all(topic in index for topic in topics)
+    assert "topic5" not in index
+    assert "" not in index
+
+
+def test_load_success_index_skips_empty_rows_and_sees_the_buffer(tmp_path):
+    cache = TrendCache(str(tmp_path / "cache.sqlite"), batch_size=100)
+    cache.set("ok", "2024-01-01 10:00:00", "2024-01-01 11:00:00", 60, 60)
+    cache.set("empty", None, None, 0, 0)
+    cache.set("blank", "", "", 0, 0)
+    cache.set_day("short", "2024-01-01", "2024-01-02", 2, 2)
+    cache.set_day("long", "2024-01-01", "2024-01-09", 9, 9)
+    for threshold in (100, 0):
+        index = cache.load_success_index(compact_threshold=threshold)
+        assert index.kind == ("set" if threshold else "sorted-hash")
+        assert [t for t in ("ok", "empty", "blank", "short", "long") if t in index] == ["ok"]
+    index = cache.load_success_index(compact_threshold=0, day_max=3)
+    assert len(index) == 2
+    assert "short" in index and "long" not in index
+    cache.close()
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from weibo_hot.trend_stats import (
+    _day_of,
+    _minute_of,
+    _summarize_json,
+    day_level_enough,
+    summarize_lifting,
+    summarize_superinfo,
+)
+
+SUPERINFO = [
+    {"code": 1, "message": "ok", "data": [{"value": ["2024-01-01 10:00:00", 3]}, {"value": ["2024-01-01 10:01:00", 2]}]},
+    # Duplicates and out-of-order points.
+    {"code": 1, "data": [{"value": ["2024-01-01 10:05", 1]}, {"value": ["2024-01-01 10:01", 1]}, {"value": ["2024-01-01 10:05", 1]}]},
+    # Bare integer timestamps, as str(value[0]) would see them.
+    {"code": 1, "data": [{"value": [1704067200, 3]}, {"value": [1704067260, 2]}]},
+    # "code" is not the first key and a nested one comes earlier.
+    {"data": [{"code": 7, "value": ["2024-01-01 10:00:00", 1]}], "code": 1},
+    {"code": 1, "data": [{"value": []}, {"other": 1}, "x", {"value": ["2024-01-02 00:00:00"]}]},
+    {"code": 1, "data": []},
+    {"code": 0, "message": "topic \"x\" not found"},
+    {"message": "no code"},
+]
+
+LIFTING = [
+    {"code": 1, "data": [{"date": "2024-01-02"}, {"date": "2024-01-01"}, {"date": "2024-01-02"}]},
+    {"code": 1, "data": [{"date": ""}, {"date": "2024-01-03"}]},
+    {"data": [{"code": 2, "date": "2024-01-01"}], "code": 1},
+    {"code": -1, "message": "busy"},
+]
+
+
+def encode(payload, **kwargs):
+    return json.dumps(payload, ensure_ascii=False, **kwargs).encode("utf-8")
+
+
+@pytest.mark.parametrize("payload", SUPERINFO)
+@pytest.mark.parametrize("separators", [None, (",", ":")])
+def test_superinfo_scan_matches_json(payload, separators):
+    raw = encode(payload, separators=separators)
+    assert summarize_superinfo(raw) == _summarize_json(raw, _minute_of)
+    assert summarize_superinfo(memoryview(raw)) == summarize_superinfo(raw)
+
+
+@pytest.mark.parametrize("payload", LIFTING)
+def test_lifting_scan_matches_json(payload):
+    raw = encode(payload)
+    assert summarize_lifting(raw) == _summarize_json(raw, _day_of)
+
+
+def test_superinfo_summary_values():
+    summary = summarize_superinfo(encode(SUPERINFO[1]))
+    assert (summary.first, summary.last, summary.distinct, summary.points) == (
+        "2024-01-01 10:01",
+        "2024-01-01 10:05",
+        2,
+        3,
+    )
+
+
+def test_error_payload_keeps_message():
+    summary = summarize_superinfo(encode(SUPERINFO[6]))
+    assert summary.code == 0
+    assert summary.message == 'topic "x" not found'
+
+
+def test_day_level_enough():
+    summary = summarize_lifting(encode(LIFTING[0]))
+    assert day_level_enough(summary, 2)
+    assert not day_level_enough(summary, 1)
+    assert not day_level_enough(summarize_lifting(encode(LIFTING[3])), 10)
+    assert not day_level_enough(None, 10)
@@ -0,0 +1,98 @@
+import multiprocessing
+import time
+from datetime import date
+
+import pytest
+
+from weibo_hot.work_queue import WorkQueue, fill_window_queue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"), name="keywords", lease_seconds=60)
+    queue.add(["a", "b", "c"])
+    yield queue
+    queue.close()
+
+
+def test_add_ignores_duplicates(queue):
+    assert queue.add(["a", "d"]) == 1
+    assert queue.counts() == {"pending": 4}
+
+
+def test_lease_hands_out_items_once_in_order(queue):
+    assert queue.lease("w1", 2) == ["a", "b"]
+    assert queue.lease("w2", 2) == ["c"]
+    assert queue.lease("w3", 2) == []
+    assert queue.attempts(["a", "c", "x"]) == {"a": 1, "c": 1, "x": 0}
+
+
+def test_complete_and_release_only_touch_the_owners_items(queue):
+    queue.lease("w1", 2)
+    queue.complete("w2", ["a"])
+    queue.release("w2", ["b"])
+    assert queue.counts() == {"leased": 2, "pending": 1}
+    queue.complete("w1", ["a"])
+    queue.release("w1", ["b"])
+    assert queue.counts() == {"done": 1, "pending": 2}
+    assert queue.lease("w2", 5) == ["b", "c"]
+    assert queue.attempts(["b"]) == {"b": 2}
+
+
+def test_expired_leases_are_handed_out_again(queue, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    queue.lease("dead", 3)
+    now[0] += 30
+    queue.renew("dead", ["a"])
+    now[0] += 45
+    assert queue.lease("w2", 3) == ["b", "c"]
+
+
+def test_reset_empties_only_this_queue(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    first, second = WorkQueue(path, name="one"), WorkQueue(path, name="two")
+    first.add(["a"])
+    second.add(["a"])
+    first.reset()
+    assert (first.counts(), second.counts()) == ({}, {"pending": 1})
+    first.close()
+    second.close()
+
+
+def test_fill_window_queue_is_idempotent(tmp_path):
+    path = str(tmp_path / "out" / "windows.sqlite")
+    queue, added = fill_window_queue(path, date(2024, 1, 1), date(2024, 1, 5), 2)
+    assert added == 3
+    assert queue.lease("w", 5) == ["2024-01-01..2024-01-02", "2024-01-03..2024-01-04", "2024-01-05..2024-01-05"]
+    queue.close()
+    queue, added = fill_window_queue(path, date(2024, 1, 1), date(2024, 1, 5), 2)
+    assert added == 0
+    queue.close()
+
+
+def _lease_all(args):
+    path, barrier = args
+    queue = WorkQueue(path, name="keywords")
+    barrier.wait()
+    got = []
+    while True:
+        items = queue.lease(str(multiprocessing.current_process().pid), 3)
+        if not items:
+            break
+        got += items
+    queue.close()
+    return got
+
+
+def test_concurrent_workers_never_share_an_item(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    queue = WorkQueue(path, name="keywords")
+    queue.add(str(i) for i in range(200))
+    queue.close()
+    ctx = multiprocessing.get_context("fork")
+    with ctx.Manager() as manager:
+        barrier = manager.Barrier(4)
+        with ctx.Pool(4) as pool:
+            leased = [item for got in pool.map(_lease_all, [(path, barrier)] * 4) for item in got]
+    assert sorted(leased, key=int) == [str(i) for i in range(200)]
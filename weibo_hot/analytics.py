@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from weibo_hot.series import decode_series_raw, minute_to_str
+
+NO_RANK = np.iinfo(np.int16).max
+
+FIELDS = (
+    "trend_intervals",
+    "trend_reentries",
+    "trend_longest_stint_minutes",
+    "trend_best_rank",
+    "trend_best_rank_time",
+)
+
+
+def load_blobs(blobs: Sequence[bytes]):
+    """Decode packed series into concatenated ``minutes``/``ranks`` plus offsets.
+
+    Topic ``i`` owns ``minutes[offsets[i]:offsets[i + 1]]``. The per-topic
+    delta decoding is done as one cumulative sum over the whole batch.
+    """
+    counts = np.empty(len(blobs), dtype=np.int64)
+    deltas: List[bytes] = []
+    ranks: List[bytes] = []
+    for i, blob in enumerate(blobs):
+        n, raw = decode_series_raw(blob)
+        counts[i] = n
+        deltas.append(raw[: 4 * n])
+        ranks.append(raw[4 * n : 6 * n])
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    minutes = np.cumsum(np.frombuffer(b"".join(deltas), dtype="<i4").astype(np.int64))
+    # Every topic's first delta is absolute: remove what the topics before it added.
+    starts = offsets[:-1]
+    carry = np.zeros(len(blobs), dtype=np.int64)
+    carry[starts > 0] = minutes[starts[starts > 0] - 1]
+    minutes -= np.repeat(carry, counts)
+    return minutes, np.frombuffer(b"".join(ranks), dtype="<i2").astype(np.int16), offsets
+
+
+def analyze_batch(minutes: np.ndarray, ranks: np.ndarray, offsets: np.ndarray, gap: int = 10) -> Dict[str, np.ndarray]:
+    """On-board intervals and best rank for every topic of a batch at once.
+
+    Consecutive points at most ``gap`` minutes apart belong to the same
+    on-board interval. Returns one array per field, indexed by topic; topics
+    without points have 0 intervals and ``best_minute`` -1.
+    """
+    n_topics = len(offsets) - 1
+    counts = np.diff(offsets)
+    topic = np.repeat(np.arange(n_topics), counts)
+    # Series almost always arrive in time order; only pay for the sort when
+    # some topic does not.
+    if np.any((np.diff(minutes) < 0) & (topic[1:] == topic[:-1])):
+        order = np.lexsort((minutes, topic))
+        minutes = minutes[order]
+        ranks = ranks[order]
+
+    result = {
+        "intervals": np.zeros(n_topics, dtype=np.int64),
+        "longest": np.zeros(n_topics, dtype=np.int64),
+        "best_rank": np.zeros(n_topics, dtype=np.int64),
+        "best_minute": np.full(n_topics, -1, dtype=np.int64),
+    }
+    if not len(minutes):
+        return result
+
+    # Topics are contiguous runs, so per-topic reductions are reduceat calls
+    # over the first index of every non-empty topic.
+    nonempty = counts > 0
+    topic_starts = offsets[:-1][nonempty]
+    first_of_topic = np.zeros(len(minutes), dtype=bool)
+    first_of_topic[topic_starts] = True
+    new_interval = first_of_topic.copy()
+    new_interval[1:] |= np.diff(minutes) > gap
+    starts = np.flatnonzero(new_interval)
+    ends = np.append(starts[1:], len(minutes)) - 1
+    lengths = minutes[ends] - minutes[starts] + 1
+
+    result["intervals"][nonempty] = np.add.reduceat(new_interval, topic_starts, dtype=np.int64)
+    result["longest"][nonempty] = np.maximum.reduceat(lengths, np.flatnonzero(first_of_topic[starts]))
+
+    ranked = np.where(ranks > 0, ranks, NO_RANK).astype(np.int64)
+    best = np.full(n_topics, NO_RANK, dtype=np.int64)
+    best[nonempty] = np.minimum.reduceat(ranked, topic_starts)
+    hit = np.flatnonzero((ranked == best[topic]) & (ranked != NO_RANK))
+    # Points are sorted by time within each topic, so the first hit is the
+    # earliest time the best rank was reached.
+    hit_topics, first_hit = np.unique(topic[hit], return_index=True)
+    result["best_rank"] = np.where(best == NO_RANK, 0, best)
+    result["best_minute"][hit_topics] = minutes[hit[first_hit]]
+    return result
+
+
+def batch_fields(result: Dict[str, np.ndarray], i: int) -> Dict[str, object]:
+    intervals = int(result["intervals"][i])
+    if not intervals:
+        return dict.fromkeys(FIELDS)
+    best_minute = int(result["best_minute"][i])
+    return {
+        "trend_intervals": intervals,
+        "trend_reentries": intervals - 1,
+        "trend_longest_stint_minutes": int(result["longest"][i]),
+        "trend_best_rank": int(result["best_rank"][i]) or None,
+        "trend_best_rank_time": minute_to_str(best_minute) if best_minute >= 0 else None,
+    }
+
+
+def series_fields(blob: Optional[bytes], gap: int = 10) -> Dict[str, object]:
+    """Item fields for one packed series (all None when there is none)."""
+    if not blob:
+        return dict.fromkeys(FIELDS)
+    minutes, ranks, offsets = load_blobs([blob])
+    return batch_fields(analyze_batch(minutes, ranks, offsets, gap), 0)
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import os
+import time
+import zlib
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple
+
+from weibo_hot.trend_cache import connect
+
+
+class ArchivedResponse(NamedTuple):
+    url: str
+    status: int
+    body: bytes
+
+
+class RecordedEvent(NamedTuple):
+    fingerprint: str
+    url: str
+    sent_at: float
+    latency: float
+    status: int
+    error: str
+    segment: str
+    offset: int
+    length: int
+
+
+def offline(settings) -> bool:
+    """True when API responses come from the archive instead of the site."""
+    return settings.getbool("REPARSE_ONLY", False) or bool(settings.get("REPLAY_SESSION"))
+
+
+class ResponseArchive:
+    """Raw response bodies, zlib-compressed in append-only segment files.
+
+    Each writer appends to its own ``seg-<writer>-<n>.z`` files (so shards
+    can share one directory) and records (segment, offset, length) in the
+    shared ``index.sqlite`` under the request fingerprint. A body fetched
+    again is appended again and the index points at the newest copy.
+    Index rows are committed in batches, always after the segment bytes
+    they point at have been flushed.
+
+    A recorded session additionally logs every final outcome in order in
+    ``archive_events``: when the request was sent (seconds since the
+    writer's first request), its download latency, the status or exception
+    name, and where its body is stored, whatever the status.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        writer: str = "",
+        segment_bytes: int = 256 * 1024 * 1024,
+        level: int = 6,
+        batch_size: int = 200,
+    ) -> None:
+        self.directory = directory
+        self.writer = writer or str(os.getpid())
+        self.segment_bytes = max(1, int(segment_bytes))
+        self.level = int(level)
+        self.batch_size = max(1, int(batch_size))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = connect(os.path.join(directory, "index.sqlite"))
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS archive (
+                fingerprint TEXT PRIMARY KEY,
+                url TEXT,
+                status INTEGER,
+                segment TEXT,
+                offset INTEGER,
+                length INTEGER,
+                raw_length INTEGER,
+                stored_at REAL
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS archive_events (
+                session TEXT NOT NULL,
+                writer TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                fingerprint TEXT,
+                url TEXT,
+                sent_at REAL,
+                latency REAL,
+                status INTEGER,
+                error TEXT,
+                segment TEXT,
+                offset INTEGER,
+                length INTEGER,
+                raw_length INTEGER,
+                PRIMARY KEY (session, writer, seq)
+            )
+            """
+        )
+        self.conn.commit()
+        self._segment: Optional[BinaryIO] = None
+        self._segment_name = ""
+        self._readers: Dict[str, BinaryIO] = {}
+        self._buffer = []
+        self._events = []
+        self._seq: Dict[str, int] = {}
+        self.stored = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.events = 0
+
+    def _open_segment(self) -> BinaryIO:
+        if self._segment is not None and self._segment.tell() < self.segment_bytes:
+            return self._segment
+        if self._segment is not None:
+            self._segment.close()
+        n = 0
+        while True:
+            n += 1
+            name = f"seg-{self.writer}-{n:05d}.z"
+            path = os.path.join(self.directory, name)
+            if not os.path.exists(path) or os.path.getsize(path) < self.segment_bytes:
+                break
+        self._segment_name = name
+        self._segment = open(path, "ab")
+        return self._segment
+
+    def put(self, fingerprint: str, url: str, status: int, body: bytes, index: bool = True) -> Tuple[str, int, int, int]:
+        """Append ``body``; returns (segment, offset, length, raw_length).
+
+        With ``index=False`` the body is stored (for a session event) but the
+        fingerprint keeps pointing at its previous copy.
+        """
+        segment = self._open_segment()
+        data = zlib.compress(body, self.level)
+        offset = segment.tell()
+        segment.write(data)
+        location = (self._segment_name, offset, len(data), len(body))
+        if index:
+            self._buffer.append((fingerprint, url, status) + location + (time.time(),))
+        self.stored += 1
+        self.raw_bytes += len(body)
+        self.stored_bytes += len(data)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+        return location
+
+    def record(
+        self,
+        session: str,
+        fingerprint: str,
+        url: str,
+        sent_at: float,
+        latency: float,
+        status: int,
+        error: str = "",
+        location: Optional[Tuple[str, int, int, int]] = None,
+    ) -> None:
+        """Log one outcome of ``session``; ``location`` comes from ``put``."""
+        seq = self._seq.get(session)
+        if seq is None:
+            row = self.conn.execute(
+                "SELECT MAX(seq) FROM archive_events WHERE session=? AND writer=?", (session, self.writer)
+            ).fetchone()
+            seq = row[0] or 0
+        seq += 1
+        self._seq[session] = seq
+        self._events.append(
+            (session, self.writer, seq, fingerprint, url, sent_at, latency, status, error)
+            + (location or ("", 0, 0, 0))
+        )
+        self.events += 1
+        if len(self._events) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer and not self._events:
+            return
+        if self._segment is not None:
+            self._segment.flush()
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO archive VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._buffer)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO archive_events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self._events
+            )
+        self._buffer = []
+        self._events = []
+
+    def session(self, name: str) -> Dict[str, List[RecordedEvent]]:
+        """Recorded outcomes of session ``name`` by fingerprint, in recorded order."""
+        events: Dict[str, List[RecordedEvent]] = {}
+        rows = self.conn.execute(
+            """
+            SELECT fingerprint, url, sent_at, latency, status, error, segment, offset, length
+            FROM archive_events WHERE session=? ORDER BY writer, seq
+            """,
+            (name,),
+        )
+        for row in rows:
+            events.setdefault(row[0], []).append(RecordedEvent(*row))
+        return events
+
+    def read(self, segment: str, offset: int, length: int) -> bytes:
+        if not length:
+            return b""
+        reader = self._readers.get(segment)
+        if reader is None:
+            reader = self._readers[segment] = open(os.path.join(self.directory, segment), "rb")
+        reader.seek(offset)
+        return zlib.decompress(reader.read(length))
+
+    def get(self, fingerprint: str) -> Optional[ArchivedResponse]:
+        row = self.conn.execute(
+            "SELECT url, status, segment, offset, length FROM archive WHERE fingerprint=?", (fingerprint,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        url, status, segment, offset, length = row
+        self.hits += 1
+        return ArchivedResponse(url, status, self.read(segment, offset, length))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "archive/stored": self.stored,
+            "archive/raw_bytes": self.raw_bytes,
+            "archive/stored_bytes": self.stored_bytes,
+            "archive/hits": self.hits,
+            "archive/misses": self.misses,
+            "archive/events": self.events,
+        }
+
+    def close(self) -> None:
+        self.flush()
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+        for reader in self._readers.values():
+            reader.close()
+        self._readers = {}
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import binascii
+import json
+import multiprocessing
+from typing import Callable, Optional, Union
+
+from Crypto.Cipher import AES
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import defer
+
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+    _JSON_ACCEPTS_BUFFERS = True
+except Exception:
+    _json_loads = json.loads
+    _JSON_ACCEPTS_BUFFERS = False
+
+AES_KEY = b"cce1d5a8d58249048623eb26b8b0ea53"
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+_ciphers = {}
+
+
+def _cipher(key: bytes):
+    cipher = _ciphers.get(key)
+    if cipher is None:
+        cipher = _ciphers[key] = AES.new(key, AES.MODE_ECB)
+    return cipher
+
+
+def _strip(body: Buffer) -> memoryview:
+    view = memoryview(body)
+    lo, hi = 0, len(view)
+    while lo < hi and view[lo] in b" \t\r\n":
+        lo += 1
+    while hi > lo and view[hi - 1] in b" \t\r\n":
+        hi -= 1
+    if hi - lo >= 2 and view[lo] == 0x22 and view[hi - 1] == 0x22:  # '"'
+        lo += 1
+        hi -= 1
+    return view[lo:hi]
+
+
+def decrypt(body: Buffer, key: bytes = AES_KEY) -> memoryview:
+    """Return the plaintext of an API response body as a view (no str round trip)."""
+    ct = binascii.a2b_base64(_strip(body))
+    if not ct or len(ct) % 16:
+        raise ValueError("ciphertext is not a whole number of AES blocks")
+    pt = _cipher(key).decrypt(ct)
+    pad = pt[-1]
+    if not 1 <= pad <= 16 or pt[-pad:] != bytes((pad,)) * pad:
+        raise ValueError("padding is incorrect")
+    return memoryview(pt)[:-pad]
+
+
+def loads(plaintext: Buffer):
+    if _JSON_ACCEPTS_BUFFERS:
+        try:
+            return _json_loads(plaintext)
+        except ValueError:
+            pass
+    # Same leniency as the old str path: drop undecodable bytes.
+    return json.loads(bytes(plaintext).decode("utf-8", "ignore"))
+
+
+def decode(body: Buffer, key: bytes = AES_KEY):
+    return loads(decrypt(body, key))
+
+
+def _decode_and_reduce(body: bytes, key: bytes, reduce: Optional[Callable]):
+    # Module level so it can be pickled into a process pool.
+    if reduce is not None:
+        return reduce(decrypt(body, key))
+    return decode(body, key)
+
+
+class PayloadCodec:
+    """Decrypt + parse API responses, off the reactor thread when they are big.
+
+    Bodies smaller than ``offload_bytes`` are decoded inline; with
+    ``pool="process"`` larger ones go to a process pool. ``reduce`` lets a
+    caller summarise the plaintext inside the worker so only the small result
+    crosses back. There is no thread pool: decoding holds the GIL, so a
+    thread would stall the reactor just the same.
+    """
+
+    def __init__(self, key: bytes = AES_KEY, pool: str = "off", offload_bytes: int = 256 * 1024, workers: int = 0):
+        self.key = key
+        self.pool = (pool or "off").lower()
+        if self.pool not in ("off", "process"):
+            raise ValueError(f"unknown decode pool {pool!r} (expected off or process)")
+        self.offload_bytes = int(offload_bytes)
+        self.workers = int(workers)
+        self._executor = None
+        self.inline = 0
+        self.offloaded = 0
+        self.bytes_decoded = 0
+
+    @classmethod
+    def from_settings(cls, settings, key: bytes = AES_KEY) -> "PayloadCodec":
+        return cls(
+            key=key,
+            pool=settings.get("DECODE_POOL", "off"),
+            offload_bytes=int(settings.get("DECODE_OFFLOAD_BYTES", 256 * 1024)),
+            workers=int(settings.get("DECODE_POOL_WORKERS", 0)),
+        )
+
+    def decode(self, body: Buffer, reduce: Optional[Callable] = None):
+        self.inline += 1
+        self.bytes_decoded += len(body)
+        return _decode_and_reduce(body, self.key, reduce)
+
+    def should_offload(self, body: Buffer) -> bool:
+        return self.pool != "off" and len(body) >= self.offload_bytes
+
+    def decode_deferred(self, body: Buffer, reduce: Optional[Callable] = None) -> defer.Deferred:
+        if not self.should_offload(body):
+            return defer.maybeDeferred(self.decode, body, reduce)
+        self.offloaded += 1
+        self.bytes_decoded += len(body)
+        future = self._process_pool().submit(_decode_and_reduce, bytes(body), self.key, reduce)
+        return _deferred_from_future(future)
+
+    async def decode_async(self, body: Buffer, reduce: Optional[Callable] = None):
+        if not self.should_offload(body):
+            return self.decode(body, reduce)
+        return await maybe_deferred_to_future(self.decode_deferred(body, reduce))
+
+    def _process_pool(self):
+        if self._executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+
+            # Not fork: a child of the crawler would inherit the reactor,
+            # open sqlite handles and the lock state of other threads.
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            self._executor = ProcessPoolExecutor(max_workers=self.workers or None, mp_context=context)
+        return self._executor
+
+    def stats(self) -> dict:
+        return {
+            "decode/inline": self.inline,
+            "decode/offloaded": self.offloaded,
+            "decode/bytes": self.bytes_decoded,
+        }
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _deferred_from_future(future) -> defer.Deferred:
+    # Deferred.fromFuture only takes asyncio futures; bridge a
+    # concurrent.futures one so callbacks fire on the reactor thread.
+    from twisted.internet import reactor
+
+    d = defer.Deferred()
+
+    def _done(f):
+        if f.cancelled():
+            reactor.callFromThread(d.cancel)
+        elif f.exception() is not None:
+            reactor.callFromThread(d.errback, f.exception())
+        else:
+            reactor.callFromThread(d.callback, f.result())
+
+    future.add_done_callback(_done)
+    return d
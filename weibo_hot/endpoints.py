@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+API_HOST = "hotengineapi.zhaoyizhe.com"
+
+LIST = "list"
+TREND = "trend"
+
+
+def endpoint_kind(url: str) -> Optional[str]:
+    path = urlsplit(url).path
+    if path.endswith("/data/list"):
+        return LIST
+    if path.endswith("/data/superInfo") or path.endswith("/data/liftingDiagram"):
+        return TREND
+    return None
+
+
+def _setting(settings, name: str, get, default):
+    value = settings.get(name)
+    if value is None or str(value).strip() == "":
+        return default
+    return get(name)
+
+
+def endpoint_slots(settings) -> Dict[str, Dict[str, object]]:
+    """DOWNLOAD_SLOTS entries for the list and trend slots, from the crawler's settings.
+
+    Both slots talk to the same host, so unless LIST_CONCURRENCY /
+    TREND_CONCURRENCY are set they split CONCURRENT_REQUESTS_PER_DOMAIN, and
+    unless LIST_DELAY / TREND_DELAY are set each waits ``len(slots)`` times
+    DOWNLOAD_DELAY, which keeps the host at one request per DOWNLOAD_DELAY.
+    """
+    per_domain = settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN", 8)
+    trend_share = max(1, per_domain // 2)
+    defaults = {
+        LIST: (max(1, per_domain - trend_share), settings.getint("DOWNLOAD_TIMEOUT", 180)),
+        TREND: (trend_share, 60),
+    }
+    delay = settings.getfloat("DOWNLOAD_DELAY") * len(defaults)
+    slots: Dict[str, Dict[str, object]] = {}
+    for kind, (concurrency, timeout) in defaults.items():
+        prefix = kind.upper()
+        slots[kind] = {
+            "concurrency": _setting(settings, f"{prefix}_CONCURRENCY", settings.getint, concurrency),
+            "delay": _setting(settings, f"{prefix}_DELAY", settings.getfloat, delay),
+            "randomize_delay": settings.getbool("RANDOMIZE_DOWNLOAD_DELAY", True),
+            "max_delay": _setting(
+                settings, f"{prefix}_MAX_DELAY", settings.getfloat, settings.getfloat("AUTOTHROTTLE_MAX_DELAY", 60.0)
+            ),
+            "target_concurrency": _setting(
+                settings,
+                f"{prefix}_TARGET_CONCURRENCY",
+                settings.getfloat,
+                settings.getfloat("AUTOTHROTTLE_TARGET_CONCURRENCY", 1.0),
+            ),
+            "timeout": _setting(settings, f"{prefix}_TIMEOUT", settings.getint, timeout),
+        }
+    return slots
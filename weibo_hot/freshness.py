@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+
+def _parse_end(value: Optional[str]) -> Optional[datetime]:
+    """Latest moment a timestamp stands for: a bare date covers the whole day."""
+    if not value:
+        return None
+    value = str(value).strip()
+    for fmt in _FORMATS:
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return parsed + timedelta(days=1) if fmt == "%Y-%m-%d" else parsed
+    # Older cache rows kept updated_at as datetime.isoformat().
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+class RefreshPolicy:
+    """Decides whether a cached trend could have changed since it was fetched.
+
+    A cached row is final once the topic had left the board when it was
+    fetched: its ``last_date`` is at least ``settle_minutes`` before the
+    fetch time (``updated_at`` is UTC, API times are ``utc_offset_hours``
+    ahead). A list row last seen more than ``slack_minutes`` after the cached
+    ``last_date`` also means the series grew. Rows fetched less than
+    ``min_age_minutes`` ago are never refreshed, so a topic is fetched at
+    most once per run.
+    """
+
+    def __init__(
+        self,
+        settle_minutes: int = 60,
+        min_age_minutes: int = 60,
+        slack_minutes: int = 10,
+        utc_offset_hours: float = 8.0,
+    ) -> None:
+        self.settle = timedelta(minutes=settle_minutes)
+        self.min_age = timedelta(minutes=min_age_minutes)
+        self.slack = timedelta(minutes=slack_minutes)
+        self.offset = timedelta(hours=utc_offset_hours)
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional["RefreshPolicy"]:
+        if str(settings.get("TREND_REFRESH_POLICY", "freshness")).strip().lower() != "freshness":
+            return None
+        return cls(
+            settle_minutes=settings.getint("TREND_REFRESH_SETTLE_MINUTES", 60),
+            min_age_minutes=settings.getint("TREND_REFRESH_MIN_AGE_MINUTES", 60),
+            slack_minutes=settings.getint("TREND_REFRESH_SLACK_MINUTES", 10),
+            utc_offset_hours=settings.getfloat("TREND_API_UTC_OFFSET_HOURS", 8.0),
+        )
+
+    def needs_refresh(
+        self,
+        cached: Dict[str, object],
+        last_seen: Optional[str] = None,
+        now: Optional[datetime] = None,
+    ) -> bool:
+        fetched = _parse_end(cached.get("updated_at"))
+        last = _parse_end(cached.get("last_date"))
+        if fetched is None or last is None:
+            # Rows from before updated_at was kept: keep the old skip behaviour.
+            return False
+        now = now or datetime.utcnow()
+        if now - fetched < self.min_age:
+            return False
+        seen = _parse_end(last_seen)
+        if seen is not None and seen > last + self.slack:
+            return True
+        return fetched + self.offset < last + self.settle
+
+    def settled_sql(self) -> Tuple[str, Tuple]:
+        """SQL condition on ``trend_cache_minute`` matching rows ``needs_refresh`` keeps (without a list row)."""
+        offset_minutes = int(self.offset.total_seconds() // 60)
+        settle_minutes = int(self.settle.total_seconds() // 60)
+        min_age_minutes = int(self.min_age.total_seconds() // 60)
+        return (
+            "(datetime(updated_at) IS NULL OR datetime(last_date) IS NULL "
+            "OR datetime(updated_at) >= datetime('now', ?) "
+            "OR datetime(updated_at, ?) >= "
+            "datetime(last_date, CASE WHEN length(last_date) = 10 THEN '+1 day' ELSE '+0 minutes' END, ?))",
+            (f"-{min_age_minutes} minutes", f"+{offset_minutes} minutes", f"+{settle_minutes} minutes"),
+        )
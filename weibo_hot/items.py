@@ -14,3 +14,9 @@ class WeiboHotItem(scrapy.Item):
     trend_first_time = scrapy.Field()
     trend_last_time = scrapy.Field()
     trend_duration_days = scrapy.Field()
+    trend_precision = scrapy.Field()
+    trend_intervals = scrapy.Field()
+    trend_reentries = scrapy.Field()
+    trend_longest_stint_minutes = scrapy.Field()
+    trend_best_rank = scrapy.Field()
+    trend_best_rank_time = scrapy.Field()
@@ -0,0 +1,435 @@
+from __future__ import annotations
+
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from weibo_hot.archive import offline
+from weibo_hot.trend_cache import connect, ensure_column
+
+_TRUE = {"1", "true", "yes", "y", "on"}
+
+
+def _now() -> str:
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class CrawlLedger:
+    """Checkpoint ledger of list crawls, kept in SQLite.
+
+    List pages are keyed on (start_date, end_date, page_no) and trend
+    topics on the topic, each with a status (``pending``, ``in_flight``,
+    ``done``, ``failed``) and an attempt count. A page is done once every
+    row it produced has been emitted. Page 1 opens its window with the page
+    count; once all pages are done the window is done and so is every date
+    inside it. ``resume_plan`` turns that back into the remaining work.
+    ``scope`` separates spiders that write different outputs for the same
+    dates (``weibo_total`` vs ``weibo_list``). Several shard processes may
+    share one file; ``ledger_runs`` keeps how each shard's last run ended.
+    """
+
+    def __init__(self, path: str, scope: str, run_id: str = "", busy_timeout: float = 30.0) -> None:
+        self.path = path
+        self.scope = scope
+        self.run_id = run_id
+        self.pages_done = 0
+        self.pages_failed = 0
+        self.windows_done = 0
+        self.topics_done = 0
+        self.topics_failed = 0
+        # Written with the next page update: losing them in a crash only
+        # loses attempt counts, the page/topic is unfinished either way.
+        self._started: List[Tuple[str, str, int]] = []
+        self._topics: Dict[str, Tuple[str, int]] = {}
+        # Pages that failed in this run and have not been fetched since.
+        self._failed: Set[Tuple[str, str, str, int]] = set()
+        self.conn = connect(path, timeout=busy_timeout)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS ledger_pages (
+                scope TEXT,
+                start_date TEXT,
+                end_date TEXT,
+                page_no INTEGER,
+                rows INTEGER,
+                done_at TEXT,
+                status TEXT NOT NULL DEFAULT 'done',
+                attempts INTEGER NOT NULL DEFAULT 1,
+                PRIMARY KEY (scope, start_date, end_date, page_no)
+            );
+            CREATE TABLE IF NOT EXISTS ledger_windows (
+                scope TEXT,
+                start_date TEXT,
+                end_date TEXT,
+                total INTEGER,
+                pages INTEGER,
+                done_at TEXT,
+                status TEXT NOT NULL DEFAULT 'done',
+                PRIMARY KEY (scope, start_date, end_date)
+            );
+            CREATE TABLE IF NOT EXISTS ledger_dates (
+                scope TEXT,
+                day TEXT,
+                done_at TEXT,
+                PRIMARY KEY (scope, day)
+            );
+            CREATE TABLE IF NOT EXISTS ledger_topics (
+                scope TEXT,
+                topic TEXT,
+                status TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT,
+                PRIMARY KEY (scope, topic)
+            );
+            CREATE TABLE IF NOT EXISTS ledger_runs (
+                scope TEXT,
+                run_id TEXT,
+                started_at TEXT,
+                finished_at TEXT,
+                reason TEXT,
+                pages_failed INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (scope, run_id)
+            );
+            """
+        )
+        # Ledgers written before pages and windows had a status were done-only.
+        ensure_column(self.conn, "ledger_pages", "status", "TEXT NOT NULL DEFAULT 'done'")
+        ensure_column(self.conn, "ledger_pages", "attempts", "INTEGER NOT NULL DEFAULT 1")
+        ensure_column(self.conn, "ledger_windows", "status", "TEXT NOT NULL DEFAULT 'done'")
+        ensure_column(self.conn, "ledger_runs", "pages_failed", "INTEGER NOT NULL DEFAULT 0")
+        self.conn.commit()
+
+    @classmethod
+    def from_settings(cls, settings, scope: str) -> Optional["CrawlLedger"]:
+        path = settings.get("LEDGER_PATH", "")
+        # A re-parse or replay from the archive must not touch the crawl's progress.
+        if not path or offline(settings):
+            return None
+        return cls(path, scope=settings.get("LEDGER_SCOPE") or scope, run_id=str(settings.get("LEDGER_RUN_ID", "")))
+
+    def _window(self, start: date, end: date) -> Tuple[str, str, str]:
+        return self.scope, start.isoformat(), end.isoformat()
+
+    def run_started(self) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ledger_runs VALUES (?, ?, ?, NULL, NULL, 0)", (self.scope, self.run_id, _now())
+            )
+
+    def run_finished(self, reason: str) -> None:
+        self.flush()
+        with self.conn:
+            self.conn.execute(
+                "UPDATE ledger_runs SET finished_at=?, reason=?, pages_failed=? WHERE scope=? AND run_id=?",
+                (_now(), reason, len(self._failed), self.scope, self.run_id),
+            )
+
+    def last_run(self, run_id: Optional[str] = None) -> Optional[Dict[str, str]]:
+        row = self.conn.execute(
+            "SELECT started_at, finished_at, reason, pages_failed FROM ledger_runs WHERE scope=? AND run_id=?",
+            (self.scope, self.run_id if run_id is None else run_id),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"started_at": row[0], "finished_at": row[1], "reason": row[2], "pages_failed": row[3]}
+
+    def page_started(self, start: date, end: date, page_no: int) -> None:
+        self._started.append(self._window(start, end) + (page_no,))
+
+    def page_parsed(self, start: date, end: date, page_no: int, total: int, total_pages: int) -> None:
+        """Page 1 opens its window with the page count the API reported."""
+        if page_no != 1:
+            return
+        window = self._window(start, end)
+        with self.conn:
+            self._flush_started()
+            self.conn.execute(
+                """
+                INSERT INTO ledger_windows VALUES (?, ?, ?, ?, ?, NULL, 'open')
+                ON CONFLICT (scope, start_date, end_date) DO UPDATE
+                SET total=excluded.total, pages=excluded.pages, done_at=NULL, status='open'
+                WHERE status != 'done'
+                """,
+                window + (total, total_pages),
+            )
+
+    def page_done(self, start: date, end: date, page_no: int, rows: int) -> bool:
+        """Record one finished page; True when it completes its window."""
+        now = _now()
+        window = self._window(start, end)
+        with self.conn:
+            self._flush_started()
+            self.conn.execute(
+                """
+                INSERT INTO ledger_pages VALUES (?, ?, ?, ?, ?, ?, 'done', 1)
+                ON CONFLICT (scope, start_date, end_date, page_no) DO UPDATE
+                SET rows=excluded.rows, done_at=excluded.done_at, status='done'
+                """,
+                window + (page_no, rows, now),
+            )
+            row = self.conn.execute(
+                "SELECT pages, status FROM ledger_windows WHERE scope=? AND start_date=? AND end_date=?", window
+            ).fetchone()
+            complete = False
+            if row is not None and row[1] == "open":
+                pages = max(1, row[0] or 0)
+                done = self.conn.execute(
+                    """
+                    SELECT COUNT(*) FROM ledger_pages
+                    WHERE scope=? AND start_date=? AND end_date=? AND page_no<=? AND status='done'
+                    """,
+                    window + (pages,),
+                ).fetchone()[0]
+                complete = done >= pages
+            if complete:
+                self.conn.execute(
+                    "UPDATE ledger_windows SET status='done', done_at=? WHERE scope=? AND start_date=? AND end_date=?",
+                    (now,) + window,
+                )
+                days = (end - start).days + 1
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO ledger_dates VALUES (?, ?, ?)",
+                    ((self.scope, (start + timedelta(days=i)).isoformat(), now) for i in range(days)),
+                )
+            self._flush_topics()
+        self._failed.discard(window + (page_no,))
+        self.pages_done += 1
+        self.windows_done += complete
+        return complete
+
+    def page_failed(self, start: date, end: date, page_no: int) -> None:
+        with self.conn:
+            self._flush_started()
+            self.conn.execute(
+                "UPDATE ledger_pages SET status='failed' WHERE scope=? AND start_date=? AND end_date=? AND page_no=?",
+                self._window(start, end) + (page_no,),
+            )
+        self._failed.add(self._window(start, end) + (page_no,))
+        self.pages_failed += 1
+
+    def window_split(self, start: date, end: date) -> None:
+        # The halves are windows of their own; this one never completes.
+        with self.conn:
+            self._flush_started()
+            self.conn.execute(
+                """
+                INSERT INTO ledger_windows VALUES (?, ?, ?, NULL, NULL, NULL, 'split')
+                ON CONFLICT (scope, start_date, end_date) DO UPDATE SET status='split'
+                """,
+                self._window(start, end),
+            )
+
+    def topic_started(self, topic: str) -> None:
+        _, attempts = self._topics.get(topic, ("", 0))
+        self._topics[topic] = ("in_flight", attempts + 1)
+
+    def topic_finished(self, topic: str, ok: bool) -> None:
+        _, attempts = self._topics.get(topic, ("", 0))
+        self._topics[topic] = ("done" if ok else "failed", attempts)
+        if ok:
+            self.topics_done += 1
+        else:
+            self.topics_failed += 1
+        if len(self._topics) >= 500:
+            self.flush()
+
+    def _flush_started(self) -> None:
+        if not self._started:
+            return
+        now = _now()
+        # A page requested twice (one copy dupefiltered) may already be done
+        # by the time its start is written; done stays done.
+        self.conn.executemany(
+            """
+            INSERT INTO ledger_pages VALUES (?, ?, ?, ?, NULL, ?, 'in_flight', 1)
+            ON CONFLICT (scope, start_date, end_date, page_no) DO UPDATE
+            SET status='in_flight', attempts=attempts + 1, done_at=excluded.done_at
+            WHERE status != 'done'
+            """,
+            (page + (now,) for page in self._started),
+        )
+        self._started = []
+
+    def _flush_topics(self) -> None:
+        if not self._topics:
+            return
+        now = _now()
+        self.conn.executemany(
+            """
+            INSERT INTO ledger_topics VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (scope, topic) DO UPDATE
+            SET status=excluded.status, attempts=attempts + excluded.attempts, updated_at=excluded.updated_at
+            """,
+            ((self.scope, topic, status, attempts, now) for topic, (status, attempts) in self._topics.items()),
+        )
+        self._topics = {}
+
+    def flush(self) -> None:
+        with self.conn:
+            self._flush_started()
+            self._flush_topics()
+
+    def done_dates(self, start: date, end: date) -> Set[date]:
+        cur = self.conn.execute(
+            "SELECT day FROM ledger_dates WHERE scope=? AND day BETWEEN ? AND ?",
+            (self.scope, start.isoformat(), end.isoformat()),
+        )
+        return {date.fromisoformat(row[0]) for row in cur}
+
+    def watermark(self, start: date, end: date) -> Optional[date]:
+        """Last date of the unbroken run of done dates from ``start``, or None."""
+        done = self.done_dates(start, end)
+        day = start
+        while day <= end and day in done:
+            day += timedelta(days=1)
+        return day - timedelta(days=1) if day > start else None
+
+    def incremental_range(
+        self, start: date, end: date, recheck_days: int, reopen: bool = False
+    ) -> Optional[Tuple[date, date]]:
+        """Dates still to crawl: after the watermark, plus the last ``recheck_days`` done dates.
+
+        With ``reopen`` the re-checked dates are marked not done, so that
+        resuming crawls them again instead of skipping them.
+        """
+        mark = self.watermark(start, end)
+        if mark is None:
+            return start, end
+        first = max(start, mark + timedelta(days=1 - max(0, recheck_days)))
+        if first > end:
+            return None
+        if reopen and first <= mark:
+            self.reopen(first, min(mark, end))
+        return first, end
+
+    def reopen(self, start: date, end: date) -> None:
+        """Forget what is recorded for ``start``..``end`` so it is crawled again."""
+        lo, hi = start.isoformat(), end.isoformat()
+        with self.conn:
+            self.conn.execute("DELETE FROM ledger_dates WHERE scope=? AND day BETWEEN ? AND ?", (self.scope, lo, hi))
+            for table in ("ledger_pages", "ledger_windows"):
+                self.conn.execute(
+                    f"DELETE FROM {table} WHERE scope=? AND start_date<=? AND end_date>=?", (self.scope, hi, lo)
+                )
+
+    def remaining(
+        self, start: date, end: date, resume: bool = True
+    ) -> Tuple[List[Tuple[date, date, int]], List[Tuple[date, date]]]:
+        """Work left in ``start``..``end``: unfinished pages of open windows,
+        and the date runs that no window has covered yet.
+
+        Without ``resume`` the range is reopened and returned as one run.
+        """
+        if not resume:
+            self.reopen(start, end)
+            return [], [(start, end)] if start <= end else []
+        lo, hi = start.isoformat(), end.isoformat()
+        covered = self.done_dates(start, end)
+        pages: List[Tuple[date, date, int]] = []
+        windows = self.conn.execute(
+            """
+            SELECT start_date, end_date, pages FROM ledger_windows
+            WHERE scope=? AND status='open' AND start_date>=? AND end_date<=?
+            ORDER BY start_date
+            """,
+            (self.scope, lo, hi),
+        ).fetchall()
+        for s, e, n in windows:
+            done = {
+                row[0]
+                for row in self.conn.execute(
+                    "SELECT page_no FROM ledger_pages WHERE scope=? AND start_date=? AND end_date=? AND status='done'",
+                    (self.scope, s, e),
+                )
+            }
+            ws, we = date.fromisoformat(s), date.fromisoformat(e)
+            pages.extend((ws, we, p) for p in range(1, max(1, n or 0) + 1) if p not in done)
+            covered.update(ws + timedelta(days=i) for i in range((we - ws).days + 1))
+        gaps: List[Tuple[date, date]] = []
+        day = start
+        while day <= end:
+            if day in covered:
+                day += timedelta(days=1)
+                continue
+            first = day
+            while day + timedelta(days=1) <= end and day + timedelta(days=1) not in covered:
+                day += timedelta(days=1)
+            gaps.append((first, day))
+            day += timedelta(days=1)
+        return pages, gaps
+
+    def resuming(self) -> bool:
+        """True when this run id's last run stopped before finishing."""
+        last = self.last_run()
+        return last is not None and last["reason"] != "finished"
+
+    def plan(self, spider, settings) -> None:
+        """Narrow ``spider.start_date``/``end_date`` to the incremental range.
+
+        Incremental mode is on with ``-a incremental=1`` or INCREMENTAL=1;
+        without an explicit END_DATE it runs up to today. A run that resumes
+        an unfinished one does not reopen the re-checked dates again.
+        """
+        if settings.get("JOBDIR"):
+            spider.logger.warning("JOBDIR is not needed with LEDGER_PATH; its dupefilter skips pages the ledger re-schedules")
+        flag = getattr(spider, "incremental", None)
+        enabled = settings.getbool("INCREMENTAL", False) if flag is None else str(flag).strip().lower() in _TRUE
+        spider.incremental = enabled
+        if not enabled:
+            return
+        if not spider.end_date_given:
+            spider.end_date = date.today()
+        requested = (spider.start_date, spider.end_date)
+        planned = self.incremental_range(
+            spider.start_date,
+            spider.end_date,
+            settings.getint("LEDGER_RECHECK_DAYS", 2),
+            reopen=not self.resuming(),
+        )
+        if planned is None:
+            # Everything is done: an empty range makes the planner yield no windows.
+            planned = (spider.end_date + timedelta(days=1), spider.end_date)
+        spider.start_date, spider.end_date = planned
+        spider.logger.info(
+            "incremental: %s..%s requested, crawling %s..%s (ledger %s)",
+            requested[0],
+            requested[1],
+            planned[0],
+            planned[1],
+            self.path,
+        )
+
+    def stats(self):
+        return {
+            "ledger/pages_done": self.pages_done,
+            "ledger/pages_failed": self.pages_failed,
+            "ledger/windows_done": self.windows_done,
+            "ledger/topics_done": self.topics_done,
+            "ledger/topics_failed": self.topics_failed,
+        }
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.flush()
+            self.conn.close()
+            self.conn = None
+
+
+def finish_reason(path: str, scope: str, run_id: str) -> str:
+    """How the last run of ``run_id`` ended ("" when unknown or still running).
+
+    A run that finished with list pages still failed reports ``failed_pages``:
+    it needs another run just like one stopped on backoff.
+    """
+    if not path or not os.path.exists(path):
+        return ""
+    ledger = CrawlLedger(path, scope=scope)
+    try:
+        last = ledger.last_run(run_id)
+    finally:
+        ledger.close()
+    if last is None:
+        return ""
+    if last["reason"] == "finished" and last["pages_failed"]:
+        return "failed_pages"
+    return last["reason"] or ""
@@ -1,6 +1,386 @@
+from __future__ import annotations
+
+import os
+import random
+import time
+from typing import Dict, Optional
+
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Response
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet.error import ConnectionRefusedError, TimeoutError
+
+from weibo_hot.archive import ResponseArchive
+from weibo_hot.endpoints import LIST, TREND, endpoint_kind, endpoint_slots
+from weibo_hot.ratelimit import SharedTokenBucket
+
+
 class WeiboHotSpiderMiddleware:
     pass
 
 
 class WeiboHotDownloaderMiddleware:
-    pass
+    """Pause-and-resume backoff for rate-limit errors.
+
+    A timeout or refused connection pauses the engine for an exponentially
+    growing, jittered delay and reschedules the failed request, so the crawl
+    recovers in-process instead of raising CloseSpider and restarting. A
+    request that keeps failing after BACKOFF_MAX_RETRIES falls through to the
+    spider errback (and the old CloseSpider + runner restart path).
+    """
+
+    backoff_exceptions = (TimeoutError, ConnectionRefusedError)
+
+    def __init__(self, crawler) -> None:
+        settings = crawler.settings
+        self.crawler = crawler
+        self.base_delay = settings.getfloat("BACKOFF_BASE_DELAY", 5.0)
+        self.max_delay = settings.getfloat("BACKOFF_MAX_DELAY", 300.0)
+        self.max_retries = settings.getint("BACKOFF_MAX_RETRIES", 8)
+        self.level = 0
+        self.paused_at = None
+        self.paused_until = 0.0
+        self._resume_call = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("BACKOFF_ENABLED", True):
+            raise NotConfigured
+        return cls(crawler)
+
+    @property
+    def stats(self):
+        return self.crawler.stats
+
+    def process_response(self, request, response, spider=None):
+        if self.level and response.status == 200 and time.monotonic() >= self.paused_until:
+            if self.paused_at is not None:
+                recovery = time.monotonic() - self.paused_at
+                self.stats.max_value("backoff/max_recovery_seconds", round(recovery, 3))
+                self.crawler.spider.logger.info("backoff: recovered after %.1fs", recovery)
+            self.level = 0
+            self.paused_at = None
+        return response
+
+    def process_exception(self, request, exception, spider=None):
+        if not isinstance(exception, self.backoff_exceptions):
+            return None
+        if request.meta.get("dont_retry", False):
+            return None
+        retries = request.meta.get("backoff_retries", 0)
+        if retries >= self.max_retries:
+            self.stats.inc_value("backoff/gave_up")
+            return None
+        self._pause(type(exception).__name__)
+        retry = request.replace(dont_filter=True)
+        retry.meta["backoff_retries"] = retries + 1
+        self.stats.inc_value("backoff/retried")
+        return retry
+
+    def _pause(self, reason: str) -> None:
+        now = time.monotonic()
+        if now < self.paused_until:
+            # Requests that were already in flight fail in a burst; they all
+            # belong to the same throttle event.
+            return
+        self.level += 1
+        delay = min(self.max_delay, self.base_delay * (2 ** (self.level - 1)))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        self.paused_until = now + delay
+        if self.paused_at is None:
+            self.paused_at = now
+        self.stats.inc_value("backoff/pauses")
+        self.stats.max_value("backoff/max_level", self.level)
+        self.crawler.spider.logger.warning(
+            "backoff: %s, pausing engine for %.1fs (level %d)", reason, delay, self.level
+        )
+        self.crawler.engine.pause()
+
+        from twisted.internet import reactor
+
+        if self._resume_call is not None and self._resume_call.active():
+            self._resume_call.cancel()
+        self._resume_call = reactor.callLater(delay, self._resume)
+
+    def _resume(self) -> None:
+        self._resume_call = None
+        self.crawler.spider.logger.info("backoff: resuming engine")
+        engine = self.crawler.engine
+        engine.unpause()
+        # Kick the scheduler loop now instead of waiting for its 5s heartbeat.
+        slot = getattr(engine, "slot", None) or getattr(engine, "_slot", None)
+        if slot is not None and getattr(slot, "nextcall", None) is not None:
+            slot.nextcall.schedule()
+
+
+class WeiboHotStaleRequestMiddleware:
+    """Drop requests the spider has superseded before they are downloaded.
+
+    A spider that re-issues a request at a higher priority exposes
+    ``is_stale_request(request)``; the older copy still sitting in the
+    scheduler is ignored here instead of costing a download.
+    """
+
+    def __init__(self, crawler) -> None:
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_request(self, request, spider=None):
+        is_stale = getattr(self.crawler.spider, "is_stale_request", None)
+        if is_stale is not None and is_stale(request):
+            self.crawler.stats.inc_value("trend/stale_dropped")
+            raise IgnoreRequest("superseded by a newer request")
+        return None
+
+
+class WeiboHotEndpointSlotMiddleware:
+    """Send list pages and trend calls through separate downloader slots.
+
+    Both endpoints share one host, so Scrapy would put them in one slot:
+    60-second trend calls then hold the concurrency list pagination needs.
+    Requests get ``download_slot`` "list" or "trend" and that slot's
+    ``timeout`` unless they set their own. The slots are built from the
+    crawler's settings (so ``-s LIST_DELAY=...`` applies) and added to the
+    downloader's DOWNLOAD_SLOTS when the engine starts.
+    """
+
+    def __init__(self, crawler) -> None:
+        self.crawler = crawler
+        self.slots = endpoint_slots(crawler.settings)
+        self.timeouts = {kind: conf.get("timeout") for kind, conf in self.slots.items()}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("ENDPOINT_SLOTS_ENABLED", True):
+            raise NotConfigured
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.engine_started, signal=signals.engine_started)
+        return middleware
+
+    def engine_started(self) -> None:
+        # Downloader slots are created on first use, after this.
+        per_slot = self.crawler.engine.downloader.per_slot_settings
+        for kind, conf in self.slots.items():
+            per_slot[kind] = {**conf, **per_slot.get(kind, {})}
+
+    def process_request(self, request, spider=None):
+        kind = endpoint_kind(request.url)
+        if kind is None:
+            return None
+        request.meta.setdefault("download_slot", kind)
+        if self.timeouts.get(kind):
+            request.meta.setdefault("download_timeout", self.timeouts[kind])
+        return None
+
+
+class WeiboHotRateLimitMiddleware:
+    """Host-wide request budget shared by every spider process.
+
+    Each API request takes a token from the bucket of its endpoint (list or
+    trend) before it is sent; buckets live in RATE_LIMIT_DIR so all shards
+    on the machine draw from the same budget.
+    """
+
+    def __init__(self, crawler) -> None:
+        settings = crawler.settings
+        self.crawler = crawler
+        bucket_dir = settings.get("RATE_LIMIT_DIR", ".ratelimit")
+        self.buckets = {
+            LIST: SharedTokenBucket(
+                os.path.join(bucket_dir, "list.bucket"),
+                rate=settings.getfloat("LIST_RATE", 4.0),
+                burst=settings.getfloat("LIST_BURST", 4.0),
+            ),
+            TREND: SharedTokenBucket(
+                os.path.join(bucket_dir, "trend.bucket"),
+                rate=settings.getfloat("TREND_RATE", 1.0),
+                burst=settings.getfloat("TREND_BURST", 2.0),
+            ),
+        }
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("GLOBAL_RATE_LIMIT_ENABLED", False):
+            raise NotConfigured
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    async def process_request(self, request, spider=None):
+        kind = endpoint_kind(request.url)
+        if kind not in self.buckets:
+            return None
+        from twisted.internet import reactor
+        from twisted.internet.task import deferLater
+
+        waited = 0.0
+        while True:
+            bucket = self.buckets.get(kind)
+            if bucket is None:
+                # Closed while this request was waiting.
+                break
+            wait = bucket.try_acquire()
+            if wait <= 0:
+                break
+            waited += wait
+            await maybe_deferred_to_future(deferLater(reactor, wait, lambda: None))
+        if waited:
+            self.crawler.stats.inc_value(f"ratelimit/{kind}/waits")
+            self.crawler.stats.inc_value(f"ratelimit/{kind}/wait_seconds", round(waited, 3))
+        return None
+
+    def spider_closed(self, spider=None) -> None:
+        buckets, self.buckets = self.buckets, {}
+        for bucket in buckets.values():
+            bucket.close()
+
+
+class WeiboHotArchiveMiddleware:
+    """Keep the raw body of every successful API response.
+
+    Bodies go to a ResponseArchive (ARCHIVE_DIR) keyed by request
+    fingerprint, still encrypted, so changed parsing can be replayed
+    without the site. With REPARSE_ONLY the archive answers every API
+    request instead: nothing is downloaded and a request with no archived
+    body is dropped.
+
+    RECORD_SESSION also logs each request's final outcome (status or
+    exception, timing, body) as a named session; REPLAY_SESSION answers
+    the n-th request for a fingerprint with its n-th recorded outcome,
+    either as fast as possible or, with REPLAY_PACING=recorded, no earlier
+    than it arrived in the recording. Replayed requests are not retried:
+    the recording already holds the outcome after retries.
+    """
+
+    replay_errors = {"TimeoutError": TimeoutError, "ConnectionRefusedError": ConnectionRefusedError}
+
+    def __init__(
+        self,
+        crawler,
+        archive: ResponseArchive,
+        reparse: bool,
+        session: str = "",
+        replay: str = "",
+        pacing: str = "fast",
+    ) -> None:
+        self.crawler = crawler
+        self.archive = archive
+        self.reparse = reparse
+        self.session = session
+        self.pacing = pacing
+        self.replay = archive.session(replay) if replay else None
+        self.served: Dict[str, int] = {}
+        self.t0: Optional[float] = None
+        if replay and not self.replay:
+            raise ValueError(f"REPLAY_SESSION {replay!r} not found in {archive.directory}")
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        reparse = settings.getbool("REPARSE_ONLY", False)
+        session = settings.get("RECORD_SESSION", "")
+        replay = settings.get("REPLAY_SESSION", "")
+        if not (reparse or session or replay or settings.getbool("ARCHIVE_ENABLED", False)):
+            raise NotConfigured
+        pacing = str(settings.get("REPLAY_PACING", "fast")).strip().lower()
+        if pacing not in ("fast", "recorded"):
+            raise ValueError(f"REPLAY_PACING must be 'fast' or 'recorded', not {pacing!r}")
+        archive = ResponseArchive(
+            settings.get("ARCHIVE_DIR", "archive"),
+            writer=settings.get("ARCHIVE_WRITER", ""),
+            segment_bytes=settings.getint("ARCHIVE_SEGMENT_MB", 256) * 1024 * 1024,
+            level=settings.getint("ARCHIVE_COMPRESS_LEVEL", 6),
+        )
+        middleware = cls(crawler, archive, reparse, session=session, replay=replay, pacing=pacing)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def _fingerprint(self, request) -> str:
+        return self.crawler.request_fingerprinter.fingerprint(request).hex()
+
+    def _clock(self) -> float:
+        now = time.monotonic()
+        if self.t0 is None:
+            self.t0 = now
+        return now - self.t0
+
+    async def process_request(self, request, spider=None):
+        if endpoint_kind(request.url) is None:
+            return None
+        if self.replay is not None:
+            return await self._replay(request)
+        if self.reparse:
+            hit = self.archive.get(self._fingerprint(request))
+            if hit is None:
+                raise IgnoreRequest(f"not in archive: {request.url}")
+            return Response(request.url, status=hit.status, body=hit.body, request=request, flags=["archived"])
+        if self.session:
+            request.meta["archive_sent_at"] = self._clock()
+        return None
+
+    async def _replay(self, request):
+        stats = self.crawler.stats
+        fingerprint = self._fingerprint(request)
+        events = self.replay.get(fingerprint)
+        if not events:
+            stats.inc_value("replay/misses")
+            raise IgnoreRequest(f"not in session: {request.url}")
+        n = self.served.get(fingerprint, 0)
+        self.served[fingerprint] = n + 1
+        event = events[min(n, len(events) - 1)]
+        if n >= len(events):
+            stats.inc_value("replay/reused")
+        now = self._clock()
+        wait = event.sent_at + event.latency - now if self.pacing == "recorded" else 0.0
+        if wait > 0:
+            from twisted.internet import reactor
+            from twisted.internet.task import deferLater
+
+            stats.inc_value("replay/wait_seconds", round(wait, 3))
+            await maybe_deferred_to_future(deferLater(reactor, wait, lambda: None))
+        request.meta["dont_retry"] = True
+        request.meta["download_latency"] = event.latency
+        if event.error:
+            stats.inc_value("replay/errors")
+            raise self.replay_errors.get(event.error, IgnoreRequest)(f"recorded {event.error}: {request.url}")
+        stats.inc_value("replay/served")
+        body = self.archive.read(event.segment, event.offset, event.length)
+        return Response(request.url, status=event.status, body=body, request=request, flags=["replayed"])
+
+    def _record(self, request, status: int, error: str = "", location=None) -> None:
+        sent_at = request.meta.get("archive_sent_at")
+        if sent_at is None:
+            return
+        latency = request.meta.get("download_latency")
+        if latency is None:
+            latency = self._clock() - sent_at
+        self.archive.record(
+            self.session, self._fingerprint(request), request.url, round(sent_at, 4), round(latency, 4),
+            status, error, location,
+        )
+
+    def process_response(self, request, response, spider=None):
+        if self.reparse or self.replay is not None or endpoint_kind(request.url) is None:
+            return response
+        if response.status != 200 and not self.session:
+            return response
+        location = self.archive.put(
+            self._fingerprint(request), request.url, response.status, response.body, index=response.status == 200
+        )
+        if self.session:
+            self._record(request, response.status, location=location)
+        return response
+
+    def process_exception(self, request, exception, spider=None):
+        if self.session and self.replay is None and endpoint_kind(request.url) is not None:
+            self._record(request, 0, type(exception).__name__)
+        return None
+
+    def spider_closed(self, spider=None) -> None:
+        self.archive.close()
+        for key, value in self.archive.stats().items():
+            self.crawler.stats.set_value(key, value)
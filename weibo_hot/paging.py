@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Dict, Hashable, Iterator, List, Set, Tuple
+
+
+def next_pages(page_no: int, total_pages: int, fanout: int) -> range:
+    """Pages to request once ``page_no`` of a date window has been parsed.
+
+    ``fanout`` is the number of pages kept in flight per window: 1 is the
+    old strictly serial walk, N makes page 1 schedule pages 2..N+1 and every
+    later page schedule the one N ahead of it, and 0 (or less) schedules all
+    remaining pages as soon as page 1 reports ``total``.
+    """
+    if page_no >= total_pages:
+        return range(0)
+    if fanout <= 0:
+        return range(2, total_pages + 1) if page_no == 1 else range(0)
+    if page_no == 1:
+        return range(2, min(total_pages, 1 + fanout) + 1)
+    nxt = page_no + fanout
+    return range(nxt, nxt + 1) if nxt <= total_pages else range(0)
+
+
+def iter_windows(start: date, end: date, days: int) -> Iterator[Tuple[date, date]]:
+    days = max(1, int(days))
+    current = start
+    while current <= end:
+        chunk_end = min(current + timedelta(days=days - 1), end)
+        yield current, chunk_end
+        current = chunk_end + timedelta(days=1)
+
+
+class WindowPlanner:
+    """Date-window plan for the list endpoint.
+
+    ``fixed`` reproduces the old DATE_STEP_DAYS walk. ``adaptive`` starts
+    with ``start_days``-wide windows and bisects a window when its result
+    looks capped: page 1 reports ``total`` at or above the cap (configured,
+    or learned the first time a page inside ``total`` comes back empty).
+    Single-day windows are never split.
+
+    While the cap is unknown a window can turn out capped after some of its
+    pages were emitted. ``open_window`` starts recording the row keys of
+    such a window; if it is bisected, ``keep_row`` drops those rows when the
+    halves return them again. Such windows are walked one page at a time
+    (``fanout``), so the cap learned from their first empty page is exact.
+    """
+
+    def __init__(
+        self,
+        start: date,
+        end: date,
+        mode: str = "fixed",
+        step_days: int = 1,
+        start_days: int = 30,
+        cap: int = 0,
+    ) -> None:
+        self.start = start
+        self.end = end
+        self.adaptive = str(mode).strip().lower() == "adaptive"
+        self.step_days = max(1, int(step_days))
+        self.start_days = max(1, int(start_days))
+        self.cap = max(0, int(cap))
+        self.windows_requested = 0
+        self.windows_bisected = 0
+        self.duplicates_dropped = 0
+        self._bisected = set()
+        self._unconfirmed: Dict[Tuple[date, date], Set[Hashable]] = {}
+        self._split_keys: Set[Hashable] = set()
+
+    def initial_windows(self) -> Iterator[Tuple[date, date]]:
+        return self.windows_for(self.start, self.end)
+
+    def windows_for(self, start: date, end: date) -> Iterator[Tuple[date, date]]:
+        return iter_windows(start, end, self.start_days if self.adaptive else self.step_days)
+
+    def should_bisect(self, start: date, end: date, total: int) -> bool:
+        if not self.adaptive or end <= start or (start, end) in self._bisected:
+            return False
+        return bool(self.cap) and total >= self.cap
+
+    def may_bisect(self, start: date, end: date, total: int) -> bool:
+        """Whether a window with this ``total`` could still be split later."""
+        if not self.adaptive or end <= start or (start, end) in self._bisected:
+            return False
+        return not self.cap or total >= self.cap
+
+    def is_bisected(self, start: date, end: date) -> bool:
+        return (start, end) in self._bisected
+
+    def open_window(self, start: date, end: date, total: int) -> None:
+        """Page 1 of a window was parsed; track its rows if it may still be split."""
+        if self.may_bisect(start, end, total):
+            self._unconfirmed[(start, end)] = set()
+
+    def tracking(self, start: date, end: date) -> bool:
+        return (start, end) in self._unconfirmed
+
+    def fanout(self, start: date, end: date, fanout: int) -> int:
+        """Pages in flight for a window; 1 while it may still be split."""
+        return 1 if self.tracking(start, end) else fanout
+
+    def keep_row(self, start: date, end: date, key: Hashable) -> bool:
+        """False for a row already emitted by a window that was bisected later."""
+        if key in self._split_keys:
+            self.duplicates_dropped += 1
+            return False
+        seen = self._unconfirmed.get((start, end))
+        if seen is not None:
+            seen.add(key)
+        return True
+
+    def window_finished(self, start: date, end: date) -> None:
+        self._unconfirmed.pop((start, end), None)
+
+    def note_short_page(self, start: date, end: date, page_no: int, page_size: int) -> bool:
+        # A page inside ``total`` came back empty: the server stops serving
+        # rows after (page_no - 1) * page_size, whatever total says.
+        # Only serial windows tell: with pages in flight a later page may be
+        # the first one seen empty.
+        served = (page_no - 1) * page_size
+        if self.tracking(start, end) and served > 0 and (not self.cap or served < self.cap):
+            self.cap = served
+        return self.adaptive and end > start and (start, end) not in self._bisected
+
+    def bisect(self, start: date, end: date) -> List[Tuple[date, date]]:
+        self._bisected.add((start, end))
+        self.windows_bisected += 1
+        self._split_keys.update(self._unconfirmed.pop((start, end), ()))
+        mid = start + timedelta(days=(end - start).days // 2)
+        return [(start, mid), (mid + timedelta(days=1), end)]
+
+    def summary(self) -> Dict[str, int]:
+        daily = (self.end - self.start).days + 1
+        return {
+            "list/window_requests": self.windows_requested,
+            "list/windows_bisected": self.windows_bisected,
+            "list/split_duplicates_dropped": self.duplicates_dropped,
+            "list/daily_plan_window_requests": daily,
+            "list/window_requests_saved": daily - self.windows_requested,
+        }
+
+
+def format_window(start: date, end: date) -> str:
+    return f"{start.isoformat()}..{end.isoformat()}"
+
+
+def parse_window(item: str) -> Tuple[date, date]:
+    start, _, end = item.partition("..")
+    return date.fromisoformat(start), date.fromisoformat(end or start)
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import json
+import os
+from typing import Dict, Iterable, List, Tuple
+
+# Order of the values in a pending row tuple.
+ROW_FIELDS = (
+    "keyword",
+    "rank_peak",
+    "hot_value",
+    "last_exists_time",
+    "durations",
+    "host_name",
+    "category",
+    "location",
+    "icon",
+)
+
+
+class PendingStore:
+    """Bounded buffer of list rows waiting for their topic's trend.
+
+    Rows are plain tuples (``ROW_FIELDS`` order) grouped by topic, about a
+    tenth of the memory of a ``WeiboHotItem`` each. ``limit`` is soft: a
+    page that is already parsed is always buffered, but ``headroom()`` tells
+    the spider how many more rows it may schedule. ``spill``/``load`` carry
+    the buffer and any parked list pages across restarts as JSON lines.
+    """
+
+    def __init__(self, limit: int = 20000, path: str = "") -> None:
+        self.limit = max(1, int(limit))
+        self.path = path
+        self._rows: Dict[str, List[tuple]] = {}
+        self.size = 0
+        self.peak = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, topic: str) -> bool:
+        return topic in self._rows
+
+    @property
+    def topics(self) -> int:
+        return len(self._rows)
+
+    def add(self, topic: str, row: tuple) -> int:
+        """Buffer ``row``; returns how many rows now wait on ``topic``."""
+        rows = self._rows.get(topic)
+        if rows is None:
+            rows = self._rows[topic] = []
+        rows.append(row)
+        self.size += 1
+        if self.size > self.peak:
+            self.peak = self.size
+        return len(rows)
+
+    def count(self, topic: str) -> int:
+        return len(self._rows.get(topic, ()))
+
+    def pop(self, topic: str) -> List[tuple]:
+        rows = self._rows.pop(topic, [])
+        self.size -= len(rows)
+        return rows
+
+    def headroom(self) -> int:
+        return self.limit - self.size
+
+    def full(self) -> bool:
+        return self.size >= self.limit
+
+    def spill(self, parked: Iterable[Tuple] = ()) -> int:
+        """Write buffered rows and parked list pages to ``path``; returns rows written."""
+        if not self.path:
+            return 0
+        parked = list(parked)
+        if not self._rows and not parked:
+            self.discard()
+            return 0
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for topic, rows in self._rows.items():
+                f.write(json.dumps({"topic": topic, "rows": rows}, ensure_ascii=False) + "\n")
+            for page in parked:
+                f.write(json.dumps({"list": list(page)}, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+        return self.size
+
+    def load(self) -> Tuple[Dict[str, List[tuple]], List[tuple]]:
+        """Read a previous spill. The file stays until the next spill/discard,
+        so a crash before then replays it instead of losing it."""
+        rows: Dict[str, List[tuple]] = {}
+        parked: List[tuple] = []
+        if not self.path or not os.path.exists(self.path):
+            return rows, parked
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                obj = json.loads(line)
+                if "topic" in obj:
+                    rows.setdefault(obj["topic"], []).extend(tuple(r) for r in obj["rows"])
+                elif "list" in obj:
+                    parked.append(tuple(obj["list"]))
+        return rows, parked
+
+    def discard(self) -> None:
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import fcntl
+import mmap
+import os
+import struct
+import time
+
+_LAYOUT = struct.Struct("dd")  # tokens, last refill (time.monotonic, system-wide)
+
+
+class SharedTokenBucket:
+    """Token bucket kept in a 16-byte mmap'd file.
+
+    Every process that opens the same path draws from the same budget;
+    ``flock`` serialises the read-refill-take-write cycle.
+    """
+
+    def __init__(self, path: str, rate: float, burst: float) -> None:
+        self.path = path
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < _LAYOUT.size:
+                os.ftruncate(self._fd, _LAYOUT.size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._mm = mmap.mmap(self._fd, _LAYOUT.size)
+
+    def try_acquire(self) -> float:
+        """Take one token; return 0.0 on success or the seconds to wait."""
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            tokens, last = _LAYOUT.unpack_from(self._mm, 0)
+            now = time.monotonic()
+            if last <= 0 or last > now:
+                # Fresh file, or the clock went backwards (reboot).
+                tokens, last = self.burst, now
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1.0:
+                tokens -= 1.0
+                wait = 0.0
+            else:
+                wait = (1.0 - tokens) / self.rate
+            _LAYOUT.pack_into(self._mm, 0, tokens, now)
+            return wait
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
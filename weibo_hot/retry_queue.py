@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import json
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from weibo_hot.trend_cache import connect
+
+
+class RetryEntry(NamedTuple):
+    url: str
+    kind: str
+    priority: int
+    attempts: int
+    last_error: str
+    next_at: float
+    meta: Dict[str, object]
+
+
+class RetryQueue:
+    """Failed requests waiting to be retried, one row per URL, in SQLite.
+
+    Failing again bumps ``attempts`` and pushes ``next_at`` out by
+    ``base_delay * 2 ** (attempts - 1)`` (capped at ``max_delay``); a
+    success deletes the row. Entries with ``max_attempts`` attempts are
+    kept for inspection but no longer handed out.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        base_delay: float = 60.0,
+        max_delay: float = 3600.0,
+        max_attempts: int = 8,
+    ) -> None:
+        self.path = path
+        self.base_delay = max(0.0, float(base_delay))
+        self.max_delay = max(self.base_delay, float(max_delay))
+        self.max_attempts = max(1, int(max_attempts))
+        self.conn = connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS retry_queue (
+                url TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                next_at REAL NOT NULL DEFAULT 0,
+                meta TEXT,
+                updated_at REAL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS retry_queue_due ON retry_queue (next_at)")
+        self.conn.commit()
+
+    def delay(self, attempts: int) -> float:
+        return min(self.max_delay, self.base_delay * 2 ** max(0, attempts - 1))
+
+    def record(
+        self,
+        url: str,
+        kind: str,
+        error: str = "",
+        priority: int = 0,
+        meta: Optional[Dict[str, object]] = None,
+    ) -> int:
+        """Count one more failure of ``url``; returns its attempts so far."""
+        now = time.time()
+        row = self.conn.execute("SELECT attempts FROM retry_queue WHERE url=?", (url,)).fetchone()
+        attempts = (row[0] if row else 0) + 1
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO retry_queue VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    priority=MAX(priority, excluded.priority), attempts=excluded.attempts,
+                    last_error=excluded.last_error, next_at=excluded.next_at, updated_at=excluded.updated_at
+                """,
+                (
+                    url,
+                    kind,
+                    int(priority),
+                    attempts,
+                    error,
+                    now + self.delay(attempts),
+                    json.dumps(meta or {}, ensure_ascii=False),
+                    now,
+                ),
+            )
+        return attempts
+
+    def add_legacy(self, urls: Iterable[str], kind_of) -> int:
+        """Import URLs from an old failed-URL file, due at once; returns new entries."""
+        now = time.time()
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO retry_queue (url, kind, attempts, last_error, next_at, meta, updated_at) "
+                "VALUES (?, ?, 1, 'legacy', 0, '{}', ?)",
+                ((url, kind_of(url), now) for url in urls),
+            )
+        return self.conn.total_changes - before
+
+    def due(self, limit: int = 0, now: Optional[float] = None) -> List[RetryEntry]:
+        """Eligible entries, highest priority first, then oldest due first."""
+        rows = self.conn.execute(
+            """
+            SELECT url, kind, priority, attempts, last_error, next_at, meta FROM retry_queue
+            WHERE next_at <= ? AND attempts < ?
+            ORDER BY priority DESC, next_at LIMIT ?
+            """,
+            (time.time() if now is None else now, self.max_attempts, int(limit) if limit > 0 else -1),
+        ).fetchall()
+        return [RetryEntry(*row[:6], json.loads(row[6] or "{}")) for row in rows]
+
+    def urls(self) -> List[str]:
+        return [row[0] for row in self.conn.execute("SELECT url FROM retry_queue")]
+
+    def succeeded(self, url: str) -> bool:
+        with self.conn:
+            cur = self.conn.execute("DELETE FROM retry_queue WHERE url=?", (url,))
+        return cur.rowcount > 0
+
+    def counts(self, now: Optional[float] = None) -> Dict[str, int]:
+        now = time.time() if now is None else now
+        row = self.conn.execute(
+            """
+            SELECT
+                COUNT(*),
+                COALESCE(SUM(attempts >= ?), 0),
+                COALESCE(SUM(attempts < ? AND next_at > ?), 0)
+            FROM retry_queue
+            """,
+            (self.max_attempts, self.max_attempts, now),
+        ).fetchone()
+        return {"queued": row[0], "exhausted": row[1], "deferred": row[2]}
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import re
+import struct
+import sys
+import zlib
+from array import array
+from datetime import date, datetime, timedelta
+from itertools import accumulate, islice
+from operator import sub
+from typing import Optional, Tuple
+
+from weibo_hot.codec import Buffer
+from weibo_hot.trend_stats import TrendSummary, summarize_superinfo
+
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<BI")  # version, points
+_EPOCH = date(1970, 1, 1).toordinal()
+_EPOCH_DT = datetime(1970, 1, 1)
+_POINT_RE = re.compile(
+    rb'"value"\s*:\s*\[\s*"(\d{4})-(\d\d)-(\d\d) (\d\d):(\d\d)(?::\d\d)?"(?:\s*,\s*"?(-?\d+))?'
+)
+_RANK_MIN, _RANK_MAX = -(2**15), 2**15 - 1
+
+
+def extract_series(plaintext: Buffer) -> Tuple[array, array]:
+    """Minute-level series of a superInfo payload as parallel int arrays.
+
+    ``minutes`` are minutes since 1970-01-01 of the API's wall-clock time
+    (no timezone shift), ``ranks`` the board position of each point (0 when
+    the point has none). Points keep the payload order.
+    """
+    minutes = array("i")
+    ranks = array("h")
+    days = {}
+    for m in _POINT_RE.finditer(plaintext):
+        y, mo, d, hh, mm, rank = m.groups()
+        key = (y, mo, d)
+        day = days.get(key)
+        if day is None:
+            day = days[key] = (date(int(y), int(mo), int(d)).toordinal() - _EPOCH) * 1440
+        minutes.append(day + int(hh) * 60 + int(mm))
+        ranks.append(min(_RANK_MAX, max(_RANK_MIN, int(rank))) if rank else 0)
+    return minutes, ranks
+
+
+def _little_endian(a: array) -> bytes:
+    if sys.byteorder == "big":
+        a = array(a.typecode, a)
+        a.byteswap()
+    return a.tobytes()
+
+
+def encode_series(minutes: array, ranks: array) -> bytes:
+    """Pack a series as header + zlib(delta-encoded int32 minutes + int16 ranks)."""
+    n = len(minutes)
+    deltas = array("i", islice(minutes, 0, 1))
+    deltas.extend(map(sub, islice(minutes, 1, None), minutes))
+    body = _little_endian(deltas) + _little_endian(array("h", ranks))
+    return _HEADER.pack(FORMAT_VERSION, n) + zlib.compress(body, 6)
+
+
+def decode_series_raw(blob: bytes) -> Tuple[int, bytes]:
+    version, n = _HEADER.unpack_from(blob)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"unsupported series format {version}")
+    return n, zlib.decompress(memoryview(blob)[_HEADER.size:])
+
+
+def decode_series(blob: bytes) -> Tuple[array, array]:
+    n, raw = decode_series_raw(blob)
+    deltas = array("i")
+    deltas.frombytes(raw[: 4 * n])
+    ranks = array("h")
+    ranks.frombytes(raw[4 * n : 6 * n])
+    if sys.byteorder == "big":
+        deltas.byteswap()
+        ranks.byteswap()
+    return array("i", accumulate(deltas)), ranks
+
+
+def minute_to_str(minute: int) -> str:
+    return (_EPOCH_DT + timedelta(minutes=int(minute))).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def summarize_with_series(plaintext: Buffer) -> Tuple[TrendSummary, Optional[bytes]]:
+    """``summarize_superinfo`` plus the packed series, for the codec's reduce step."""
+    summary = summarize_superinfo(plaintext)
+    if summary.code != 1 or not summary.points:
+        return summary, None
+    minutes, ranks = extract_series(plaintext)
+    if not minutes:
+        # Timestamps the series format cannot hold (not "YYYY-MM-DD HH:MM").
+        return summary, None
+    return summary, encode_series(minutes, ranks)
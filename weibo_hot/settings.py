@@ -68,9 +68,69 @@ AUTOTHROTTLE_START_DELAY = _env_float("AUTOTHROTTLE_START_DELAY", 0.5)
 AUTOTHROTTLE_MAX_DELAY = _env_float("AUTOTHROTTLE_MAX_DELAY", 5.0)
 AUTOTHROTTLE_TARGET_CONCURRENCY = _env_float("AUTOTHROTTLE_TARGET_CONCURRENCY", 1.0)
 
+# Separate downloader slots for /data/list and the trend endpoints, each with
+# its own concurrency, delay, timeout and AutoThrottle bounds. Unset values are
+# derived from the crawler's settings when it starts (weibo_hot.endpoints.endpoint_slots):
+# the two slots split CONCURRENT_REQUESTS_PER_DOMAIN, delays default to twice
+# DOWNLOAD_DELAY (same host-level rate as one shared slot) and the bounds to the
+# AUTOTHROTTLE_* values. Setting LIST_DELAY / TREND_DELAY opts into a higher rate.
+ENDPOINT_SLOTS_ENABLED = _env_bool("ENDPOINT_SLOTS_ENABLED", True)
+LIST_CONCURRENCY = os.getenv("LIST_CONCURRENCY")
+LIST_DELAY = os.getenv("LIST_DELAY")
+LIST_MAX_DELAY = os.getenv("LIST_MAX_DELAY")
+LIST_TARGET_CONCURRENCY = os.getenv("LIST_TARGET_CONCURRENCY")
+LIST_TIMEOUT = os.getenv("LIST_TIMEOUT")
+TREND_CONCURRENCY = os.getenv("TREND_CONCURRENCY")
+TREND_DELAY = os.getenv("TREND_DELAY")
+TREND_MAX_DELAY = os.getenv("TREND_MAX_DELAY")
+TREND_TARGET_CONCURRENCY = os.getenv("TREND_TARGET_CONCURRENCY")
+TREND_TIMEOUT = _env_int("TREND_TIMEOUT", 60)
+# Trend requests go ahead of list pages; more waiting rows raise it further
+TREND_PRIORITY = _env_int("TREND_PRIORITY", 10)
+TREND_FANIN_BOOST = _env_bool("TREND_FANIN_BOOST", True)
+EXTENSIONS = {
+    "scrapy.extensions.throttle.AutoThrottle": None,
+    "weibo_hot.throttle.EndpointAutoThrottle": 0,
+}
+
 RETRY_TIMES = _env_int("RETRY_TIMES", 5)
 RETRY_HTTP_CODES = [429, 500, 502, 503, 504, 522, 524, 408]
 
+# In-process backoff on timeouts / refused connections (runs before RetryMiddleware)
+DOWNLOADER_MIDDLEWARES = {
+    "weibo_hot.middlewares.WeiboHotStaleRequestMiddleware": 50,
+    # Before DownloadTimeoutMiddleware (350) so the per-endpoint timeout wins.
+    "weibo_hot.middlewares.WeiboHotEndpointSlotMiddleware": 100,
+    # Between the slot middleware and backoff/rate limiting: archived
+    # replies skip both, and stored bodies are already decompressed (590).
+    "weibo_hot.middlewares.WeiboHotArchiveMiddleware": 540,
+    "weibo_hot.middlewares.WeiboHotDownloaderMiddleware": 560,
+    "weibo_hot.middlewares.WeiboHotRateLimitMiddleware": 590,
+}
+BACKOFF_ENABLED = _env_bool("BACKOFF_ENABLED", True)
+BACKOFF_BASE_DELAY = _env_float("BACKOFF_BASE_DELAY", 5.0)
+BACKOFF_MAX_DELAY = _env_float("BACKOFF_MAX_DELAY", 300.0)
+BACKOFF_MAX_RETRIES = _env_int("BACKOFF_MAX_RETRIES", 8)
+
+# Raw response archive and offline re-parse (see WeiboHotArchiveMiddleware)
+ARCHIVE_ENABLED = _env_bool("ARCHIVE_ENABLED", False)
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_WRITER = os.getenv("ARCHIVE_WRITER", os.getenv("SHARD_ID", ""))
+ARCHIVE_SEGMENT_MB = _env_int("ARCHIVE_SEGMENT_MB", 256)
+ARCHIVE_COMPRESS_LEVEL = _env_int("ARCHIVE_COMPRESS_LEVEL", 6)
+REPARSE_ONLY = _env_bool("REPARSE_ONLY", False)
+RECORD_SESSION = os.getenv("RECORD_SESSION", "")
+REPLAY_SESSION = os.getenv("REPLAY_SESSION", "")
+REPLAY_PACING = os.getenv("REPLAY_PACING", "fast")
+
+# Host-wide token buckets shared by all shard processes (requests per second)
+GLOBAL_RATE_LIMIT_ENABLED = _env_bool("GLOBAL_RATE_LIMIT_ENABLED", False)
+RATE_LIMIT_DIR = os.getenv("RATE_LIMIT_DIR", ".ratelimit")
+LIST_RATE = _env_float("LIST_RATE", 4.0)
+LIST_BURST = _env_float("LIST_BURST", 4.0)
+TREND_RATE = _env_float("TREND_RATE", 1.0)
+TREND_BURST = _env_float("TREND_BURST", 2.0)
+
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
 # Output as JSON Lines for large volume
@@ -85,12 +145,55 @@ FEEDS = {
 
 # Custom settings
 WEIBO_COOKIE = os.getenv("WEIBO_COOKIE", "")
+HOTENGINE_BASE_URL = os.getenv("HOTENGINE_BASE_URL", "")
 FETCH_TREND = os.getenv("FETCH_TREND", "1") == "1"
 DATE_STEP_DAYS = int(os.getenv("DATE_STEP_DAYS", "1"))
+DATE_PLAN = os.getenv("DATE_PLAN", "fixed")
+ADAPTIVE_START_DAYS = _env_int("ADAPTIVE_START_DAYS", 30)
+LIST_WINDOW_CAP = _env_int("LIST_WINDOW_CAP", 0)
 PAGE_SIZE = int(os.getenv("PAGE_SIZE", "100"))
+LIST_PAGE_FANOUT = _env_int("LIST_PAGE_FANOUT", 1)
+LEDGER_PATH = os.getenv("LEDGER_PATH", "crawl_ledger.sqlite")
+LEDGER_SCOPE = os.getenv("LEDGER_SCOPE", "")
+LEDGER_RECHECK_DAYS = _env_int("LEDGER_RECHECK_DAYS", 2)
+INCREMENTAL = _env_bool("INCREMENTAL", False)
+LEDGER_RESUME = _env_bool("LEDGER_RESUME", True)
+LEDGER_RUN_ID = os.getenv("LEDGER_RUN_ID", os.getenv("SHARD_ID", ""))
 TREND_CACHE_PATH = os.getenv("TREND_CACHE_PATH", "trend_cache.sqlite")
+TREND_CACHE_BATCH_SIZE = _env_int("TREND_CACHE_BATCH_SIZE", 200)
+TREND_CACHE_FLUSH_INTERVAL = _env_float("TREND_CACHE_FLUSH_INTERVAL", 5.0)
+TREND_CACHE_SHARED = _env_bool("TREND_CACHE_SHARED", False)
+TREND_CACHE_WRITER = os.getenv("TREND_CACHE_WRITER", os.getenv("SHARD_ID", ""))
 TREND_SOURCE = os.getenv("TREND_SOURCE", "superInfo")
-TREND_TIMEOUT = _env_int("TREND_TIMEOUT", 60)
+TREND_TIER_MAX_DAYS = _env_int("TREND_TIER_MAX_DAYS", 1)
+TREND_SKIP_SUCCESS = _env_bool("TREND_SKIP_SUCCESS", True)
+TREND_REFRESH_POLICY = os.getenv("TREND_REFRESH_POLICY", "freshness")
+TREND_REFRESH_SETTLE_MINUTES = _env_int("TREND_REFRESH_SETTLE_MINUTES", 60)
+TREND_REFRESH_MIN_AGE_MINUTES = _env_int("TREND_REFRESH_MIN_AGE_MINUTES", 60)
+TREND_REFRESH_SLACK_MINUTES = _env_int("TREND_REFRESH_SLACK_MINUTES", 10)
+TREND_API_UTC_OFFSET_HOURS = _env_float("TREND_API_UTC_OFFSET_HOURS", 8.0)
+TREND_PRELOAD_COMPACT_THRESHOLD = _env_int("TREND_PRELOAD_COMPACT_THRESHOLD", 1_000_000)
+TREND_STORE_SERIES = _env_bool("TREND_STORE_SERIES", True)
+TREND_ANALYTICS = _env_bool("TREND_ANALYTICS", True)
+TREND_GAP_MINUTES = _env_int("TREND_GAP_MINUTES", 10)
+WORK_QUEUE_PATH = os.getenv("WORK_QUEUE_PATH", "")
+WORK_QUEUE_NAME = os.getenv("WORK_QUEUE_NAME", "")
+WORK_LEASE_BATCH = _env_int("WORK_LEASE_BATCH", 4)
+WORK_LEASE_SECONDS = _env_float("WORK_LEASE_SECONDS", 600.0)
+# Keywords still without a trend answer after this many leases are marked done
+WORK_MAX_ATTEMPTS = _env_int("WORK_MAX_ATTEMPTS", 3)
+WORKER_ID = os.getenv("WORKER_ID", "")
+DECODE_POOL = os.getenv("DECODE_POOL", "off")
+DECODE_OFFLOAD_BYTES = _env_int("DECODE_OFFLOAD_BYTES", 256 * 1024)
+DECODE_POOL_WORKERS = _env_int("DECODE_POOL_WORKERS", 0)
+PENDING_LIMIT = _env_int("PENDING_LIMIT", 20000)
+PENDING_SPILL_PATH = os.getenv("PENDING_SPILL_PATH", "output/pending_spill.jsonl")
+RETRY_QUEUE_PATH = os.getenv("RETRY_QUEUE_PATH", "output/retry_queue.sqlite")
+RETRY_BASE_DELAY = _env_float("RETRY_BASE_DELAY", 60.0)
+RETRY_MAX_DELAY = _env_float("RETRY_MAX_DELAY", 3600.0)
+RETRY_MAX_ATTEMPTS = _env_int("RETRY_MAX_ATTEMPTS", 8)
+RETRY_POLL_INTERVAL = _env_float("RETRY_POLL_INTERVAL", 30.0)
+# Old append-only failed-URL file, imported into RETRY_QUEUE_PATH once.
 FAILED_URLS_PATH = os.getenv("FAILED_URLS_PATH", "output/failed_urls.txt")
 
 # Disable Telnet Console (for security)
@@ -1,16 +1,17 @@
 from __future__ import annotations
 
-import base64
-import json
 import math
 import os
 import re
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 from typing import Dict, Iterable
+from urllib.parse import urlsplit
 
 import scrapy
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
+
+from weibo_hot.codec import AES_KEY, PayloadCodec
+from weibo_hot.ledger import CrawlLedger
+from weibo_hot.paging import WindowPlanner, next_pages
 
 
 class WeiboListSpider(scrapy.Spider):
@@ -18,7 +19,7 @@ class WeiboListSpider(scrapy.Spider):
     allowed_domains = ["hotengineapi.zhaoyizhe.com", "weibo.zhaoyizhe.com"]
 
     base_url = "https://hotengineapi.zhaoyizhe.com/hotEngineApi"
-    aes_key = b"cce1d5a8d58249048623eb26b8b0ea53"
+    aes_key = AES_KEY
 
     def __init__(
         self,
@@ -32,12 +33,32 @@ class WeiboListSpider(scrapy.Spider):
             start_date = os.getenv("START_DATE")
         if end_date is None:
             end_date = os.getenv("END_DATE")
+        self.end_date_given = bool(end_date)
         start_date = start_date or "2019-10-25"
         end_date = end_date or "2025-12-31"
         self.start_date = self._parse_date(start_date)
         self.end_date = self._parse_date(end_date)
         if self.start_date > self.end_date:
             raise ValueError("start_date must be <= end_date")
+        self.ledger = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider._apply_base_url(crawler.settings)
+        spider.codec = PayloadCodec.from_settings(crawler.settings, key=spider.aes_key)
+        spider.ledger = CrawlLedger.from_settings(crawler.settings, scope=spider.name)
+        if spider.ledger is not None:
+            spider.ledger.plan(spider, crawler.settings)
+            spider.ledger.run_started()
+        return spider
+
+    def _apply_base_url(self, settings) -> None:
+        # HOTENGINE_BASE_URL points the spider at a mirror or the local mock server.
+        base_url = settings.get("HOTENGINE_BASE_URL", "")
+        if base_url:
+            self.base_url = base_url.rstrip("/")
+            self.allowed_domains = list(self.allowed_domains) + [urlsplit(self.base_url).hostname]
 
     @staticmethod
     def _parse_date(s: str) -> date:
@@ -59,26 +80,35 @@ class WeiboListSpider(scrapy.Spider):
                 headers["wbrsnew"] = m.group(1)
         return headers
 
-    def _decrypt(self, ciphertext_b64: str) -> str:
-        ciphertext_b64 = ciphertext_b64.strip()
-        if ciphertext_b64.startswith("\"") and ciphertext_b64.endswith("\""):
-            ciphertext_b64 = ciphertext_b64[1:-1]
-        ct = base64.b64decode(ciphertext_b64)
-        cipher = AES.new(self.aes_key, AES.MODE_ECB)
-        pt = unpad(cipher.decrypt(ct), 16)
-        return pt.decode("utf-8", "ignore")
-
     def start_requests(self) -> Iterable[scrapy.Request]:
         headers = self._build_headers()
-        current = self.start_date
-        step = int(self.settings.get("DATE_STEP_DAYS", 1))
-        while current <= self.end_date:
-            chunk_end = min(current + timedelta(days=step - 1), self.end_date)
-            yield self._make_list_request(current, chunk_end, page_no=1, headers=headers)
-            current = chunk_end + timedelta(days=1)
+        self.planner = WindowPlanner(
+            self.start_date,
+            self.end_date,
+            mode=self.settings.get("DATE_PLAN", "fixed"),
+            step_days=int(self.settings.get("DATE_STEP_DAYS", 1)),
+            start_days=int(self.settings.get("ADAPTIVE_START_DAYS", 30)),
+            cap=int(self.settings.get("LIST_WINDOW_CAP", 0)),
+        )
+        if self.ledger is None:
+            for start, end in self.planner.initial_windows():
+                yield self._make_list_request(start, end, page_no=1, headers=headers)
+            return
+        pages, gaps = self.ledger.remaining(
+            self.start_date, self.end_date, resume=self.settings.getbool("LEDGER_RESUME", True)
+        )
+        for start, end, page_no in pages:
+            yield self._make_list_request(start, end, page_no, headers=headers)
+        for gap_start, gap_end in gaps:
+            for start, end in self.planner.windows_for(gap_start, gap_end):
+                yield self._make_list_request(start, end, page_no=1, headers=headers)
 
     def _make_list_request(self, start: date, end: date, page_no: int, headers: Dict[str, str]) -> scrapy.Request:
         page_size = int(self.settings.get("PAGE_SIZE", 100))
+        if page_no == 1:
+            self.planner.windows_requested += 1
+        if self.ledger is not None:
+            self.ledger.page_started(start, end, page_no)
         url = (
             f"{self.base_url}/data/list"
             f"?startDate={start.strftime('%Y-%m-%d')}"
@@ -100,12 +130,15 @@ class WeiboListSpider(scrapy.Spider):
             },
         )
 
-    def parse_list(self, response: scrapy.http.Response):
+    async def parse_list(self, response: scrapy.http.Response):
         try:
-            payload = json.loads(self._decrypt(response.text))
+            payload = await self.codec.decode_async(response.body)
         except Exception:
             return
+        for result in self._handle_list(response, payload):
+            yield result
 
+    def _handle_list(self, response: scrapy.http.Response, payload: dict):
         if payload.get("code") != 1:
             return
 
@@ -113,10 +146,33 @@ class WeiboListSpider(scrapy.Spider):
         total = int(data.get("total", 0) or 0)
         page_no = int(data.get("pageNo", response.meta.get("page_no", 1)) or 1)
         items = data.get("data", []) or []
+        page_size = int(self.settings.get("PAGE_SIZE", 100))
+        total_pages = max(1, math.ceil(total / page_size)) if total > 0 else 0
+        start = self._parse_date(response.meta["start_date"])
+        end = self._parse_date(response.meta["end_date"])
 
+        if self.planner.is_bisected(start, end):
+            # Split while this page was queued; the halves cover its rows.
+            self.crawler.stats.inc_value("list/split_window_pages_dropped")
+            return
+        if page_no == 1 and self.planner.should_bisect(start, end, total):
+            yield from self._bisect_window(start, end, total)
+            return
+        if not items and 1 < page_no <= total_pages:
+            if self.planner.note_short_page(start, end, page_no, page_size):
+                yield from self._bisect_window(start, end, total)
+                return
+            self.logger.warning("page %d of %s..%s empty inside total=%d", page_no, start, end, total)
+        if page_no == 1:
+            self.planner.open_window(start, end, total)
+
+        if self.ledger is not None:
+            self.ledger.page_parsed(start, end, page_no, total, total_pages)
         for row in items:
             keyword = row.get("topic") or row.get("title") or row.get("word") or row.get("name")
             last_exists = row.get("updateTime") or row.get("date") or row.get("createTime")
+            if not self.planner.keep_row(start, end, (keyword, last_exists)):
+                continue
             yield {
                 "keyword": keyword,
                 "rank_peak": row.get("pm"),
@@ -129,10 +185,48 @@ class WeiboListSpider(scrapy.Spider):
                 "icon": row.get("icon"),
             }
 
+        if self.ledger is not None:
+            self.ledger.page_done(start, end, page_no, len(items))
+        if page_no >= total_pages:
+            self.planner.window_finished(start, end)
+
         if total > 0:
-            total_pages = max(1, math.ceil(total / int(self.settings.get("PAGE_SIZE", 100))))
-            if page_no < total_pages:
+            fanout = self.planner.fanout(start, end, int(self.settings.get("LIST_PAGE_FANOUT", 1)))
+            pages = next_pages(page_no, total_pages, fanout)
+            if pages:
                 headers = self._build_headers()
-                start = datetime.strptime(response.meta["start_date"], "%Y-%m-%d").date()
-                end = datetime.strptime(response.meta["end_date"], "%Y-%m-%d").date()
-                yield self._make_list_request(start, end, page_no + 1, headers)
+                for next_page in pages:
+                    yield self._make_list_request(start, end, next_page, headers)
+
+    def _bisect_window(self, start: date, end: date, total: int) -> Iterable[scrapy.Request]:
+        self.logger.info("window %s..%s looks capped (total=%d), bisecting", start, end, total)
+        if self.ledger is not None:
+            self.ledger.window_split(start, end)
+        headers = self._build_headers()
+        for s, e in self.planner.bisect(start, end):
+            yield self._make_list_request(s, e, page_no=1, headers=headers)
+
+    def closed(self, reason: str) -> None:
+        if self.ledger is not None:
+            self.ledger.run_finished(reason)
+            for key, value in self.ledger.stats().items():
+                self.crawler.stats.set_value(key, value)
+            self.ledger.close()
+        codec = getattr(self, "codec", None)
+        if codec is not None:
+            codec.close()
+            for key, value in codec.stats().items():
+                self.crawler.stats.set_value(key, value)
+        planner = getattr(self, "planner", None)
+        if planner is None:
+            return
+        summary = planner.summary()
+        for key, value in summary.items():
+            self.crawler.stats.set_value(key, value)
+        self.logger.info(
+            "date plan: %d window requests (%d bisected) vs %d with daily windows, saved %d",
+            summary["list/window_requests"],
+            summary["list/windows_bisected"],
+            summary["list/daily_plan_window_requests"],
+            summary["list/window_requests_saved"],
+        )
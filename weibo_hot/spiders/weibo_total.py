@@ -1,37 +1,39 @@
 from __future__ import annotations
 
-import base64
-import json
 import math
 import os
 import re
-import sqlite3
-from datetime import date, datetime, timedelta
-from typing import Dict, Iterable, List, Optional
-from urllib.parse import quote
+from collections import Counter, deque
+from datetime import date, datetime
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, quote, urlsplit
 
 import scrapy
-from scrapy.exceptions import CloseSpider
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
+from scrapy import signals
+from scrapy.exceptions import CloseSpider, DontCloseSpider, IgnoreRequest
+from twisted.internet import task
 from twisted.internet.error import TimeoutError
 
+from weibo_hot.analytics import FIELDS as ANALYTICS_FIELDS, series_fields
+from weibo_hot.archive import offline
+from weibo_hot.codec import AES_KEY, PayloadCodec
+from weibo_hot.freshness import RefreshPolicy
 from weibo_hot.items import WeiboHotItem
-
-try:
-    import orjson
-
-    _json_loads = orjson.loads
-except Exception:
-    _json_loads = json.loads
-
+from weibo_hot.ledger import CrawlLedger
+from weibo_hot.paging import WindowPlanner, next_pages, parse_window
+from weibo_hot.pending import ROW_FIELDS, PendingStore
+from weibo_hot.retry_queue import RetryEntry, RetryQueue
+from weibo_hot.series import summarize_with_series
+from weibo_hot.trend_cache import TrendCache
+from weibo_hot.trend_stats import TrendSummary, day_level_enough, summarize_lifting, summarize_superinfo
+from weibo_hot.work_queue import WorkQueue
 
 class WeiboTotalSpider(scrapy.Spider):
     name = "weibo_total"
     allowed_domains = ["hotengineapi.zhaoyizhe.com", "weibo.zhaoyizhe.com"]
 
     base_url = "https://hotengineapi.zhaoyizhe.com/hotEngineApi"
-    aes_key = b"cce1d5a8d58249048623eb26b8b0ea53"
+    aes_key = AES_KEY
 
     def __init__(
         self,
@@ -45,52 +47,370 @@ class WeiboTotalSpider(scrapy.Spider):
             start_date = os.getenv("START_DATE")
         if end_date is None:
             end_date = os.getenv("END_DATE")
+        self.end_date_given = bool(end_date)
         start_date = start_date or "2019-10-25"
         end_date = end_date or "2025-12-31"
         self.start_date = self._parse_date(start_date)
         self.end_date = self._parse_date(end_date)
         if self.start_date > self.end_date:
             raise ValueError("start_date must be <= end_date")
+        self.ledger = None
 
 
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
         spider = super().from_crawler(crawler, *args, **kwargs)
         spider._init_from_settings(crawler.settings)
+        crawler.signals.connect(spider._on_idle, signal=signals.spider_idle)
+        crawler.signals.connect(spider._on_request_dropped, signal=signals.request_dropped)
+        crawler.signals.connect(spider._on_request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(spider._on_request_left_downloader, signal=signals.request_left_downloader)
         return spider
 
     def _init_from_settings(self, settings):
+        self._apply_base_url(settings)
+        self.ledger = CrawlLedger.from_settings(settings, scope=self.name)
+        if self.ledger is not None:
+            self.ledger.plan(self, settings)
+            self.ledger.run_started()
+        self.ledger_resume = settings.getbool("LEDGER_RESUME", True)
+        # A list page is done once all its rows are emitted: rows still
+        # waiting per page as [waiting, rows], and per topic by page.
+        self.page_waits: Dict[Tuple[date, date, int], List[int]] = {}
+        self.topic_pages: Dict[str, Counter] = {}
         self.date_step_days = int(settings.get("DATE_STEP_DAYS", 1))
         self.page_size = int(settings.get("PAGE_SIZE", 100))
+        self.page_fanout = int(settings.get("LIST_PAGE_FANOUT", 1))
+        self.planner = WindowPlanner(
+            self.start_date,
+            self.end_date,
+            mode=settings.get("DATE_PLAN", "fixed"),
+            step_days=self.date_step_days,
+            start_days=int(settings.get("ADAPTIVE_START_DAYS", 30)),
+            cap=int(settings.get("LIST_WINDOW_CAP", 0)),
+        )
         self.fetch_trend = bool(settings.get("FETCH_TREND", True))
         self.trend_source = str(settings.get("TREND_SOURCE", "superInfo")).strip()
+        self.tiered = self.trend_source.lower() == "tiered"
+        self.tier_max_days = int(settings.get("TREND_TIER_MAX_DAYS", 1))
+        self.refresh = RefreshPolicy.from_settings(settings)
+        # Tiered mode: topics whose day-level answer was not enough.
+        self.escalated = set()
         self.trend_timeout = int(settings.get("TREND_TIMEOUT", 60))
-        self.failed_urls_path = str(settings.get("FAILED_URLS_PATH", "output/failed_urls.txt"))
-        self._aes_cipher = AES.new(self.aes_key, AES.MODE_ECB)
+        self.store_series = settings.getbool("TREND_STORE_SERIES", True)
+        self.trend_analytics = settings.getbool("TREND_ANALYTICS", True)
+        self.trend_gap_minutes = int(settings.get("TREND_GAP_MINUTES", 10))
+        self.trend_priority = int(settings.get("TREND_PRIORITY", 10))
+        self.trend_fanin_boost = settings.getbool("TREND_FANIN_BOOST", True)
+        # topic -> generation of its newest trend request; older ones are stale.
+        self.trend_gens: Dict[str, int] = {}
+        self._trend_gen = 0
+        # Topics whose trend request is being downloaded; a copy re-issued
+        # now would not replace it, only download the topic twice.
+        self.trend_downloading: Set[str] = set()
+        self.failed_urls_path = str(settings.get("FAILED_URLS_PATH", ""))
+        self.codec = PayloadCodec.from_settings(settings, key=self.aes_key)
 
         self.cookie = settings.get("WEIBO_COOKIE", "")
         if not self.cookie:
             self.logger.warning("WEIBO_COOKIE is empty; requests may fail.")
 
         self._init_trend_cache()
-        self.pending = {}
+        self._init_work_queue()
+        self._init_retry_queue()
+        self.pending = PendingStore(
+            limit=int(settings.get("PENDING_LIMIT", 20000)),
+            path="" if offline(settings) else str(settings.get("PENDING_SPILL_PATH", "")),
+        )
+        # List pages held back while the pending buffer is near its limit,
+        # as (start_date, end_date, page_no).
+        self.parked_lists: Deque[Tuple[str, str, int]] = deque()
+        self.lists_in_flight = 0
+        self.parked_peak = 0
+
+    def _apply_base_url(self, settings) -> None:
+        # HOTENGINE_BASE_URL points the spider at a mirror or the local mock server.
+        base_url = settings.get("HOTENGINE_BASE_URL", "")
+        if base_url:
+            self.base_url = base_url.rstrip("/")
+            self.allowed_domains = list(self.allowed_domains) + [urlsplit(self.base_url).hostname]
 
     def _init_trend_cache(self) -> None:
         self.trend_cache_path = self.settings.get("TREND_CACHE_PATH", "trend_cache.sqlite")
-        self.conn = sqlite3.connect(self.trend_cache_path)
-        self.conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS trend_cache_minute (
-                topic TEXT PRIMARY KEY,
-                first_date TEXT,
-                last_date TEXT,
-                duration_minutes INTEGER,
-                points INTEGER,
-                updated_at TEXT
+        if offline(self.settings) and os.path.exists(self.trend_cache_path):
+            self.logger.warning(
+                "offline run with existing trend cache %s: cached topics are not parsed again", self.trend_cache_path
             )
-            """
+        self.trend_cache = TrendCache(
+            self.trend_cache_path,
+            batch_size=int(self.settings.get("TREND_CACHE_BATCH_SIZE", 200)),
+            flush_interval=float(self.settings.get("TREND_CACHE_FLUSH_INTERVAL", 5.0)),
+            writer=self.settings.get("TREND_CACHE_WRITER", ""),
+        )
+        self._trend_flush_loop = task.LoopingCall(self.trend_cache.flush)
+        self._trend_flush_loop.start(self.trend_cache.flush_interval, now=False)
+
+    def _init_work_queue(self) -> None:
+        self.work_queue = None
+        self.leased_windows: List[str] = []
+        # Windows handed back with failed pages; left to other workers or the next run.
+        self.windows_given_back: Set[str] = set()
+        # Set once a lease comes back empty; cleared when the spider goes idle.
+        self.windows_drained = False
+        path = self.settings.get("WORK_QUEUE_PATH", "")
+        if not path:
+            return
+        self.work_queue = WorkQueue(
+            path,
+            name=self.settings.get("WORK_QUEUE_NAME") or "windows",
+            lease_seconds=float(self.settings.get("WORK_LEASE_SECONDS", 600)),
+        )
+        self.worker_id = str(self.settings.get("WORKER_ID") or os.getpid())
+        self.lease_batch = int(self.settings.get("WORK_LEASE_BATCH", 4))
+        self._lease_renew_loop = task.LoopingCall(self._renew_leases)
+        self._lease_renew_loop.start(max(1.0, self.work_queue.lease_seconds / 3), now=False)
+
+    def _init_retry_queue(self) -> None:
+        self.retry_queue = None
+        # URLs in the queue (to spot their successes) and those already
+        # scheduled in this run.
+        self.retry_urls: Set[str] = set()
+        self.retry_scheduled: Set[str] = set()
+        path = self.settings.get("RETRY_QUEUE_PATH", "")
+        if not path or offline(self.settings):
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.retry_queue = RetryQueue(
+            path,
+            base_delay=self.settings.getfloat("RETRY_BASE_DELAY", 60.0),
+            max_delay=self.settings.getfloat("RETRY_MAX_DELAY", 3600.0),
+            max_attempts=self.settings.getint("RETRY_MAX_ATTEMPTS", 8),
         )
-        self.conn.commit()
+        duplicates = self._import_failed_urls()
+        self.retry_urls = set(self.retry_queue.urls())
+        counts = self.retry_queue.counts()
+        # Stats do not exist yet; start_requests records these.
+        self.retry_saved = {
+            "retry_queue/legacy_duplicates": duplicates,
+            "retry_queue/skipped_not_due": counts["deferred"],
+            "retry_queue/skipped_exhausted": counts["exhausted"],
+        }
+        self._retry_loop = task.LoopingCall(self._drain_retries)
+        self._retry_loop.start(max(1.0, self.settings.getfloat("RETRY_POLL_INTERVAL", 30.0)), now=False)
+
+    def _import_failed_urls(self) -> int:
+        # One-off migration of the old append-only file; returns the
+        # duplicate lines that are no longer requested.
+        path = self.failed_urls_path
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path, "r", encoding="utf-8") as f:
+            urls = [line.strip() for line in f if line.strip()]
+        added = self.retry_queue.add_legacy(urls, self._retry_kind)
+        os.replace(path, f"{path}.imported")
+        self.logger.info("imported %d failed URLs (%d new) from %s into %s", len(urls), added, path, self.retry_queue.path)
+        return len(urls) - added
+
+    @staticmethod
+    def _retry_kind(url: str) -> str:
+        return "list" if "/data/list" in url else "trend"
+
+    def _due_retries(self) -> List[scrapy.Request]:
+        requests = []
+        for entry in self.retry_queue.due():
+            if entry.url in self.retry_scheduled:
+                continue
+            request = self._retry_request(entry)
+            if request is None:
+                continue
+            self.retry_scheduled.add(entry.url)
+            requests.append(request)
+        if requests:
+            self.crawler.stats.inc_value("retry_queue/scheduled", len(requests))
+        return requests
+
+    def _drain_retries(self) -> None:
+        for request in self._due_retries():
+            self.crawler.engine.crawl(request)
+
+    def _retry_request(self, entry: RetryEntry) -> Optional[scrapy.Request]:
+        # Rebuilt rather than replayed, so list pages get their window meta
+        # and trends go to the endpoint the current settings pick.
+        query = parse_qs(urlsplit(entry.url).query)
+        if entry.kind == "list":
+            try:
+                start = self._parse_date(query["startDate"][0])
+                end = self._parse_date(query["endDate"][0])
+                page_no = int(query["pageNo"][0])
+            except (KeyError, ValueError):
+                self.logger.warning("dropping unparseable list retry %s", entry.url)
+                self.retry_queue.succeeded(entry.url)
+                return None
+            request = self._make_list_request(start, end, page_no, self._build_headers())
+        else:
+            topic = (query.get("keyword") or [""])[0]
+            if not topic:
+                # Would otherwise come due again on every poll.
+                self.logger.warning("dropping trend retry without keyword %s", entry.url)
+                self.retry_queue.succeeded(entry.url)
+                return None
+            request = self._make_trend_request(topic)
+        request.meta["retry_url"] = entry.url
+        return request.replace(dont_filter=True, priority=max(request.priority, entry.priority))
+
+    def _retry_succeeded(self, response: scrapy.http.Response) -> None:
+        url = response.meta.get("retry_url") or response.request.url
+        if url not in self.retry_urls:
+            return
+        self.retry_urls.discard(url)
+        self.retry_scheduled.discard(url)
+        if self.retry_queue.succeeded(url):
+            self.crawler.stats.inc_value("retry_queue/succeeded")
+
+    def _record_failed(self, failure, kind: str) -> None:
+        if self.retry_queue is None:
+            return
+        request = failure.request
+        url = request.meta.get("retry_url") or request.url
+        self.retry_scheduled.discard(url)
+        self.retry_queue.record(url, kind, error=failure.type.__name__, priority=request.priority)
+        self.crawler.stats.inc_value("retry_queue/failed_again" if url in self.retry_urls else "retry_queue/added")
+        self.retry_urls.add(url)
+
+    def _renew_leases(self) -> None:
+        if self.leased_windows:
+            self.work_queue.renew(self.worker_id, self.leased_windows)
+
+    def _lease_windows(self) -> List[scrapy.Request]:
+        self._park_new_windows()
+        return self._release_lists()
+
+    def _park_new_windows(self) -> bool:
+        leased = self.work_queue.lease(self.worker_id, self.lease_batch + len(self.windows_given_back))
+        fresh = [w for w in leased if w not in self.windows_given_back][: self.lease_batch]
+        extra = [w for w in leased if w not in fresh]
+        if extra:
+            self.work_queue.release(self.worker_id, extra)
+        if not fresh:
+            self.windows_drained = True
+            return False
+        self.leased_windows.extend(fresh)
+        for start, end in map(parse_window, fresh):
+            if self.ledger is None:
+                self._park_lists([(start, end, 1)])
+                continue
+            # A window handed back by another worker resumes at its failed pages.
+            pages, gaps = self.ledger.remaining(start, end, resume=self.ledger_resume)
+            self._park_lists(pages)
+            self._park_lists((s, e, 1) for s, e in gaps)
+        self.logger.info("leased windows %s", ", ".join(fresh))
+        return True
+
+    def _on_idle(self, spider=None) -> None:
+        # Parked pages first: they belong to the windows currently leased.
+        requests = self._release_lists(force=True)
+        if not requests and self.work_queue is not None:
+            requests = self._lease_more_windows()
+        if not requests:
+            return
+        for request in requests:
+            self.crawler.engine.crawl(request)
+        raise DontCloseSpider
+
+    def _lease_more_windows(self) -> List[scrapy.Request]:
+        # Idle means every request of the leased windows has been handled.
+        if self.leased_windows:
+            self._hand_back_windows()
+        self.windows_drained = False
+        return self._lease_windows()
+
+    def _top_up_windows(self) -> bool:
+        # The leased windows are running dry: lease the next batch now rather
+        # than leave download slots empty until the spider goes idle.
+        if self.ledger is not None:
+            self._complete_finished_windows()
+        if len(self.leased_windows) >= 2 * self.lease_batch:
+            return False
+        self.crawler.stats.inc_value("work_queue/early_leases")
+        return self._park_new_windows()
+
+    def _complete_finished_windows(self) -> None:
+        done = [w for w in self.leased_windows if self.ledger.remaining(*parse_window(w)) == ([], [])]
+        if done:
+            self.work_queue.complete(self.worker_id, done)
+            self.crawler.stats.inc_value("work_queue/windows_done", len(done))
+            self.leased_windows = [w for w in self.leased_windows if w not in done]
+
+    def _hand_back_windows(self) -> None:
+        """Complete the leased windows; those the ledger still has pages of go back to the queue."""
+        unfinished = []
+        if self.ledger is not None:
+            for window in self.leased_windows:
+                pages, gaps = self.ledger.remaining(*parse_window(window))
+                if pages or gaps:
+                    unfinished.append(window)
+        done = [w for w in self.leased_windows if w not in unfinished]
+        self.work_queue.complete(self.worker_id, done)
+        self.crawler.stats.inc_value("work_queue/windows_done", len(done))
+        if unfinished:
+            self.logger.warning("windows with failed pages handed back: %s", ", ".join(unfinished))
+            self.work_queue.release(self.worker_id, unfinished)
+            self.windows_given_back.update(unfinished)
+            self.crawler.stats.inc_value("work_queue/windows_released", len(unfinished))
+        self.leased_windows = []
+
+    def _park_lists(self, pages: Iterable[Tuple[date, date, int]]) -> None:
+        later = []
+        for start, end, page_no in pages:
+            entry = (start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"), page_no)
+            if page_no > 1:
+                later.append(entry)
+            else:
+                self.parked_lists.append(entry)
+        # Pages of a window already started go ahead of new windows so that
+        # windows finish instead of all being open at once.
+        self.parked_lists.extendleft(reversed(later))
+        self.parked_peak = max(self.parked_peak, len(self.parked_lists))
+
+    def _list_budget(self) -> int:
+        # Each list page in flight may still add a full page of pending rows.
+        return self.pending.headroom() - self.lists_in_flight * self.page_size
+
+    def _release_lists(self, force: bool = False) -> List[scrapy.Request]:
+        requests: List[scrapy.Request] = []
+        headers = None
+        while True:
+            while self.parked_lists and (self._list_budget() > 0 or (force and not requests)):
+                start, end, page_no = self.parked_lists.popleft()
+                headers = headers or self._build_headers()
+                requests.append(
+                    self._make_list_request(self._parse_date(start), self._parse_date(end), page_no, headers)
+                )
+            if (
+                self.work_queue is None
+                or self.parked_lists
+                or self.windows_drained
+                or self.lists_in_flight >= self.lease_batch
+                or self._list_budget() <= 0
+                or not self._top_up_windows()
+            ):
+                return requests
+
+    def _on_request_dropped(self, request, spider=None) -> None:
+        if request.callback == self.parse_list:
+            self._list_done()
+
+    def _on_request_reached_downloader(self, request, spider=None) -> None:
+        if request.meta.get("trend_gen") is not None:
+            self.trend_downloading.add(request.meta.get("topic"))
+
+    def _on_request_left_downloader(self, request, spider=None) -> None:
+        if request.meta.get("trend_gen") is not None:
+            self.trend_downloading.discard(request.meta.get("topic"))
+
+    def _list_done(self) -> None:
+        # Requests restored from JOBDIR were never counted in this process.
+        self.lists_in_flight = max(0, self.lists_in_flight - 1)
 
     @staticmethod
     def _parse_date(s: str) -> date:
@@ -111,73 +431,69 @@ class WeiboTotalSpider(scrapy.Spider):
                 headers["wbrsnew"] = m.group(1)
         return headers
 
-    def _decrypt(self, ciphertext_b64: str) -> str:
-        ciphertext_b64 = ciphertext_b64.strip()
-        if ciphertext_b64.startswith("\"") and ciphertext_b64.endswith("\""):
-            ciphertext_b64 = ciphertext_b64[1:-1]
-        ct = base64.b64decode(ciphertext_b64)
-        cipher = getattr(self, "_aes_cipher", None)
-        if cipher is None:
-            cipher = AES.new(self.aes_key, AES.MODE_ECB)
-        pt = unpad(cipher.decrypt(ct), 16)
-        return pt.decode("utf-8", "ignore")
-
     def _trend_cache_get(self, topic: str) -> Optional[Dict[str, object]]:
-        cur = self.conn.execute(
-            "SELECT first_date, last_date, duration_minutes, points FROM trend_cache_minute WHERE topic=?",
-            (topic,),
-        )
-        row = cur.fetchone()
-        if not row:
-            return None
-        return {
-            "first_date": row[0],
-            "last_date": row[1],
-            "duration_minutes": row[2],
-        }
+        return self.trend_cache.get(topic)
 
     def _trend_cache_set(self, topic: str, first_date: str, last_date: str, duration_minutes: int, points: int) -> None:
-        self.conn.execute(
-            """
-            INSERT INTO trend_cache_minute (topic, first_date, last_date, duration_minutes, points, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ON CONFLICT(topic) DO UPDATE SET
-                first_date=excluded.first_date,
-                last_date=excluded.last_date,
-                duration_minutes=excluded.duration_minutes,
-                points=excluded.points,
-                updated_at=excluded.updated_at
-            """,
-            (topic, first_date, last_date, duration_minutes, points, datetime.utcnow().isoformat()),
-        )
-        self.conn.commit()
+        self.trend_cache.set(topic, first_date, last_date, duration_minutes, points)
 
     def start_requests(self) -> Iterable[scrapy.Request]:
-        headers = self._build_headers()
-
-        # Retry failed URLs from previous run (do not filter by dupefilter)
-        if os.path.exists(self.failed_urls_path):
-            with open(self.failed_urls_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    url = line.strip()
-                    if not url:
-                        continue
-                    yield scrapy.Request(
-                        url,
-                        headers=headers,
-                        callback=self.parse_list,
-                        errback=self.errback_list,
-                        dont_filter=True,
-                        meta={"from_failed": True},
-                    )
-
-        current = self.start_date
-        while current <= self.end_date:
-            chunk_end = min(current + timedelta(days=self.date_step_days - 1), self.end_date)
-            yield self._make_list_request(current, chunk_end, page_no=1, headers=headers)
-            current = chunk_end + timedelta(days=1)
+        yield from self._reload_pending()
+
+        # Due retries first; the rest stay queued until their backoff ends.
+        if self.retry_queue is not None:
+            for key, value in self.retry_saved.items():
+                self.crawler.stats.set_value(key, value)
+            yield from self._due_retries()
+
+        if self.work_queue is not None:
+            yield from self._lease_windows()
+            return
+
+        if self.ledger is None:
+            self._park_lists((start, end, 1) for start, end in self.planner.initial_windows())
+        else:
+            self._park_remaining()
+        yield from self._release_lists()
+
+    def _park_remaining(self) -> None:
+        pages, gaps = self.ledger.remaining(self.start_date, self.end_date, resume=self.ledger_resume)
+        if pages or gaps != [(self.start_date, self.end_date)]:
+            self.logger.info(
+                "ledger: resuming %d unfinished pages and %d date runs (%d days) of %s..%s",
+                len(pages),
+                len(gaps),
+                sum((end - start).days + 1 for start, end in gaps),
+                self.start_date,
+                self.end_date,
+            )
+        self._park_lists(pages)
+        self._park_lists((s, e, 1) for start, end in gaps for s, e in self.planner.windows_for(start, end))
+
+    def _reload_pending(self) -> Iterable[scrapy.Request]:
+        rows, parked = self.pending.load()
+        if not rows and not parked:
+            return
+        self.logger.info(
+            "resuming %d pending rows (%d topics) and %d parked list pages from %s",
+            sum(map(len, rows.values())),
+            len(rows),
+            len(parked),
+            self.pending.path,
+        )
+        # The ledger re-schedules unfinished pages itself.
+        if self.work_queue is None and self.ledger is None:
+            self.parked_lists.extend((start, end, int(page_no)) for start, end, page_no in parked)
+        for topic_rows in rows.values():
+            for row in topic_rows:
+                yield from self._route_row(row)
 
     def _make_list_request(self, start: date, end: date, page_no: int, headers: Dict[str, str]) -> scrapy.Request:
+        if page_no == 1:
+            self.planner.windows_requested += 1
+        if self.ledger is not None:
+            self.ledger.page_started(start, end, page_no)
+        self.lists_in_flight += 1
         url = (
             f"{self.base_url}/data/list"
             f"?startDate={start.strftime('%Y-%m-%d')}"
@@ -200,13 +516,22 @@ class WeiboTotalSpider(scrapy.Spider):
             },
         )
 
-    def parse_list(self, response: scrapy.http.Response):
+    async def parse_list(self, response: scrapy.http.Response):
+        self._list_done()
+        if self.retry_urls:
+            self._retry_succeeded(response)
         try:
-            payload = _json_loads(self._decrypt(response.text))
+            payload = await self.codec.decode_async(response.body)
         except Exception as exc:
             self.logger.error("decrypt failed: %s", exc)
-            return
-
+            payload = None
+        if payload is not None:
+            for result in self._handle_list(response, payload):
+                yield result
+        for request in self._release_lists():
+            yield request
+
+    def _handle_list(self, response: scrapy.http.Response, payload: dict):
         code = payload.get("code")
         if code != 1:
             self.logger.warning("list api error: %s", payload.get("message"))
@@ -216,191 +541,374 @@ class WeiboTotalSpider(scrapy.Spider):
         total = int(data.get("total", 0) or 0)
         page_no = int(data.get("pageNo", response.meta.get("page_no", 1)) or 1)
         items = data.get("data", []) or []
+        total_pages = max(1, math.ceil(total / self.page_size)) if total > 0 else 0
+
+        window = self._window_of(response)
+        if window is not None:
+            start, end = window
+            if self.planner.is_bisected(start, end):
+                # Split while this page was queued; the halves cover its rows.
+                self.crawler.stats.inc_value("list/split_window_pages_dropped")
+                return
+            if page_no == 1 and self.planner.should_bisect(start, end, total):
+                self._bisect_window(start, end, total)
+                return
+            if not items and 1 < page_no <= total_pages:
+                if self.planner.note_short_page(start, end, page_no, self.page_size):
+                    # The planner drops the earlier pages' rows when the
+                    # halves return them again.
+                    self._bisect_window(start, end, total)
+                    return
+                self.logger.warning("page %d of %s..%s empty inside total=%d", page_no, start, end, total)
+            if page_no == 1:
+                self.planner.open_window(start, end, total)
+
+        page = None
+        if self.ledger is not None and window is not None:
+            self.ledger.page_parsed(window[0], window[1], page_no, total, total_pages)
+            page = (window[0], window[1], page_no)
+            self.page_waits[page] = [0, len(items)]
 
         for row in items:
-            item = self._build_item(row)
-            if not self.fetch_trend:
-                yield item
+            row = self._build_row(row)
+            if window is not None and not self.planner.keep_row(window[0], window[1], (row[0], row[3])):
                 continue
+            yield from self._route_row(row, page)
 
-            topic = item.get("keyword")
-            if not topic:
-                yield item
-                continue
+        if page is not None:
+            self._page_settled(page, 0)
+        if window is not None and page_no >= total_pages:
+            self.planner.window_finished(window[0], window[1])
 
-            cached = self._trend_cache_get(topic)
-            if cached:
-                item["trend_first_time"] = cached["first_date"]
-                item["trend_last_time"] = cached["last_date"]
-                item["trend_duration_days"] = cached["duration_minutes"]
-                yield item
-                continue
+        if total > 0 and window is not None:
+            fanout = self.planner.fanout(window[0], window[1], self.page_fanout)
+            self._park_lists((window[0], window[1], p) for p in next_pages(page_no, total_pages, fanout))
 
-            self.pending.setdefault(topic, []).append(item)
-            if len(self.pending[topic]) == 1:
-                headers = self._build_headers()
-                if self.trend_source.lower() == "liftingdiagram":
-                    url = f"{self.base_url}/data/liftingDiagram?keyword={quote(str(topic))}"
-                    callback = self.parse_trend_lifting
-                else:
-                    url = f"{self.base_url}/data/superInfo?keyword={quote(str(topic))}"
-                    callback = self.parse_trend_superinfo
-                yield scrapy.Request(
-                    url,
-                    headers=headers,
-                    callback=callback,
-                    errback=self.errback_trend,
-                    meta={"topic": topic, "download_timeout": self.trend_timeout},
-                )
-
-        if total > 0:
-            total_pages = max(1, math.ceil(total / self.page_size))
-            if page_no < total_pages:
-                headers = self._build_headers()
-                start = datetime.strptime(response.meta["start_date"], "%Y-%m-%d").date()
-                end = datetime.strptime(response.meta["end_date"], "%Y-%m-%d").date()
-                yield self._make_list_request(start, end, page_no + 1, headers)
-
-    def parse_trend_superinfo(self, response: scrapy.http.Response):
-        topic = response.meta.get("topic")
-        if not topic:
+    def _page_settled(self, page: Tuple[date, date, int], rows: int) -> None:
+        waits = self.page_waits.get(page)
+        if waits is None:
             return
-        try:
-            payload = _json_loads(self._decrypt(response.text))
-        except Exception as exc:
-            self.logger.error("trend decrypt failed: %s", exc)
-            pending_items = self.pending.pop(topic, [])
-            for item in pending_items:
-                yield item
+        waits[0] -= rows
+        if waits[0] <= 0:
+            del self.page_waits[page]
+            self.ledger.page_done(page[0], page[1], page[2], waits[1])
+
+    def _route_row(self, row: tuple, page: Optional[Tuple[date, date, int]] = None):
+        topic = row[0]
+        if not self.fetch_trend or not topic:
+            yield self._build_item(row)
             return
 
-        if payload.get("code") != 1:
-            self.logger.warning("trend api error for %s: %s", topic, payload.get("message"))
-            pending_items = self.pending.pop(topic, [])
-            for item in pending_items:
-                yield item
+        cached = self._trend_cache_get(topic)
+        if cached and self.refresh is not None and self.refresh.needs_refresh(cached, row[3]):
+            # Fetched while the topic was still on the board, or the list has
+            # seen it after the cached series ends.
+            if topic not in self.pending:
+                self.crawler.stats.inc_value("trend/refreshed")
+            cached = None
+        if cached:
+            item = self._build_item(row)
+            item["trend_first_time"] = cached["first_date"]
+            item["trend_last_time"] = cached["last_date"]
+            item["trend_duration_days"] = cached["duration_minutes"]
+            item["trend_precision"] = "day" if self.trend_source.lower() == "liftingdiagram" else "minute"
+            if self.trend_analytics:
+                item.update(series_fields(self.trend_cache.get_series(topic), self.trend_gap_minutes))
+            yield item
             return
 
-        data = payload.get("data", []) or []
-        seen = set()
-        first_time = None
-        last_time = None
-        for d in data:
-            if not isinstance(d, dict):
-                continue
-            value = d.get("value")
-            if not isinstance(value, list) or not value:
-                continue
-            t = str(value[0])
-            seen.add(t)
-            if first_time is None or t < first_time:
-                first_time = t
-            if last_time is None or t > last_time:
-                last_time = t
-
-        duration_minutes = len(seen)
-        if first_time and last_time:
-            self._trend_cache_set(topic, first_time, last_time, duration_minutes, len(seen))
-
-        pending_items = self.pending.pop(topic, [])
-        for item in pending_items:
-            item["trend_first_time"] = first_time
-            item["trend_last_time"] = last_time
-            item["trend_duration_days"] = duration_minutes
+        day = self.trend_cache.get_day(topic) if self.tiered else None
+        if day and 0 < (day["days"] or 0) <= self.tier_max_days:
+            item = self._build_item(row)
+            item["trend_first_time"] = day["first_date"]
+            item["trend_last_time"] = day["last_date"]
+            item["trend_duration_days"] = day["days"]
+            item["trend_precision"] = "day"
             yield item
+            return
 
-    def parse_trend_lifting(self, response: scrapy.http.Response):
+        # The first row of a topic issues the trend request; later rows wait
+        # for the same response. Each time the fan-in doubles a request still
+        # queued is re-issued at a higher priority and the queued one goes stale.
+        fan_in = self.pending.add(topic, row)
+        if page is not None:
+            self.page_waits[page][0] += 1
+            self.topic_pages.setdefault(topic, Counter())[page] += 1
+        if fan_in == 1:
+            if self.ledger is not None:
+                self.ledger.topic_started(topic)
+            yield self._make_trend_request(topic, fan_in)
+        elif self.trend_fanin_boost and not fan_in & (fan_in - 1) and topic not in self.trend_downloading:
+            self.crawler.stats.inc_value("trend/priority_bumps")
+            yield self._make_trend_request(topic, fan_in)
+
+    def is_stale_request(self, request: scrapy.Request) -> bool:
+        gen = request.meta.get("trend_gen")
+        return gen is not None and self.trend_gens.get(request.meta.get("topic")) != gen
+
+    def _make_trend_request(self, topic: str, fan_in: int = 1) -> scrapy.Request:
+        source = self.trend_source.lower()
+        if source == "liftingdiagram" or (self.tiered and topic not in self.escalated):
+            if self.tiered:
+                self.crawler.stats.inc_value("trend/tier_light_requests")
+            url = f"{self.base_url}/data/liftingDiagram?keyword={quote(str(topic))}"
+            callback = self.parse_trend_lifting
+        else:
+            url = f"{self.base_url}/data/superInfo?keyword={quote(str(topic))}"
+            callback = self.parse_trend_superinfo
+        self._trend_gen += 1
+        gen = self.trend_gens[topic] = self._trend_gen
+        return scrapy.Request(
+            url,
+            headers=self._build_headers(),
+            callback=callback,
+            errback=self.errback_trend,
+            # The pending store already keeps one request per topic in flight;
+            # a topic seen again after a failed fetch must not be dupefiltered.
+            dont_filter=True,
+            priority=self.trend_priority + fan_in.bit_length(),
+            meta={"topic": topic, "download_timeout": self.trend_timeout, "trend_gen": gen},
+        )
+
+    def _window_of(self, response: scrapy.http.Response):
+        start = response.meta.get("start_date")
+        end = response.meta.get("end_date")
+        if not start or not end:
+            return None
+        return self._parse_date(start), self._parse_date(end)
+
+    def _bisect_window(self, start: date, end: date, total: int) -> None:
+        self.logger.info("window %s..%s looks capped (total=%d), bisecting", start, end, total)
+        if self.ledger is not None:
+            self.ledger.window_split(start, end)
+        self._park_lists((s, e, 1) for s, e in self.planner.bisect(start, end))
+
+    async def parse_trend_superinfo(self, response: scrapy.http.Response):
         topic = response.meta.get("topic")
         if not topic:
             return
-        try:
-            payload = _json_loads(self._decrypt(response.text))
-        except Exception as exc:
-            self.logger.error("trend decrypt failed: %s", exc)
-            pending_items = self.pending.pop(topic, [])
-            for item in pending_items:
-                yield item
+        if self.retry_urls:
+            self._retry_succeeded(response)
+        want_series = self.store_series or self.trend_analytics
+        summary = await self._summarize_trend(response, summarize_with_series if want_series else summarize_superinfo)
+        fields = None
+        if want_series and summary is not None:
+            summary, series = summary
+            if series is not None and self.store_series:
+                self.trend_cache.set_series(topic, series, summary.points)
+            if self.trend_analytics:
+                fields = series_fields(series, self.trend_gap_minutes)
+        for item in self._handle_trend(topic, summary, fields):
+            yield item
+
+    async def parse_trend_lifting(self, response: scrapy.http.Response):
+        topic = response.meta.get("topic")
+        if not topic:
             return
+        if self.retry_urls:
+            self._retry_succeeded(response)
+        summary = await self._summarize_trend(response, summarize_lifting)
+        if self.tiered:
+            for result in self._handle_tier(topic, summary):
+                yield result
+            return
+        for item in self._handle_trend(topic, summary, precision="day"):
+            yield item
 
-        if payload.get("code") != 1:
-            self.logger.warning("trend api error for %s: %s", topic, payload.get("message"))
-            pending_items = self.pending.pop(topic, [])
-            for item in pending_items:
-                yield item
+    def _handle_tier(self, topic: str, summary: Optional[TrendSummary]):
+        if summary is not None and summary.code == 1 and summary.first and summary.last:
+            self.trend_cache.set_day(topic, summary.first, summary.last, summary.distinct, summary.points)
+        if day_level_enough(summary, self.tier_max_days):
+            self.crawler.stats.inc_value("trend/heavy_avoided")
+            yield from self._handle_trend(topic, summary, precision="day")
+            return
+        if topic not in self.pending or topic in self.escalated:
             return
+        # Ambiguous or too long at day level: ask superInfo for the same rows.
+        self.crawler.stats.inc_value("trend/tier_escalated")
+        self.escalated.add(topic)
+        yield self._make_trend_request(topic, self.pending.count(topic))
+
+    async def _summarize_trend(self, response: scrapy.http.Response, summarize) -> Optional[TrendSummary]:
+        # The series is reduced to first/last/distinct straight from the
+        # decrypted bytes; it is never materialised as Python objects.
+        try:
+            return await self.codec.decode_async(response.body, reduce=summarize)
+        except Exception as exc:
+            self.logger.error("trend decrypt failed: %s", exc)
+            return None
 
-        data = payload.get("data", []) or []
-        dates = set()
-        first_date = None
-        last_date = None
-        for d in data:
-            if not isinstance(d, dict):
-                continue
-            t = d.get("date")
-            if not t:
-                continue
-            t = str(t)
-            dates.add(t)
-            if first_date is None or t < first_date:
-                first_date = t
-            if last_date is None or t > last_date:
-                last_date = t
-
-        duration_days = len(dates)
-        if first_date and last_date:
-            self._trend_cache_set(topic, first_date, last_date, duration_days, len(dates))
-
-        pending_items = self.pending.pop(topic, [])
-        for item in pending_items:
-            item["trend_first_time"] = first_date
-            item["trend_last_time"] = last_date
-            item["trend_duration_days"] = duration_days
+    def _handle_trend(
+        self,
+        topic: str,
+        summary: Optional[TrendSummary],
+        fields: Optional[dict] = None,
+        precision: str = "minute",
+    ):
+        if summary is not None and summary.code != 1:
+            self.logger.warning("trend api error for %s: %s", topic, summary.message)
+            summary = None
+
+        # Tiered day-level answers live in trend_cache_day (see _handle_tier).
+        if summary is not None and summary.first and summary.last and not (self.tiered and precision == "day"):
+            self._trend_cache_set(topic, summary.first, summary.last, summary.distinct, summary.distinct)
+
+        self.trend_gens.pop(topic, None)
+        self.escalated.discard(topic)
+        rows = self.pending.pop(topic)
+        for row in rows:
+            item = self._build_item(row)
+            if summary is not None:
+                item["trend_first_time"] = summary.first
+                item["trend_last_time"] = summary.last
+                item["trend_duration_days"] = summary.distinct
+                item["trend_precision"] = precision
+                if fields:
+                    item.update(fields)
             yield item
+        if self.ledger is not None and rows:
+            self.ledger.topic_finished(topic, summary is not None)
+            for page, count in self.topic_pages.pop(topic, {}).items():
+                self._page_settled(page, count)
+        yield from self._release_lists()
 
     def errback_trend(self, failure):
         topic = getattr(failure.request, "meta", {}).get("topic")
         if not topic:
             return
+        if failure.check(IgnoreRequest) and self.is_stale_request(failure.request):
+            # Superseded by a higher-priority request for the same topic.
+            return
         if failure.check(TimeoutError):
-            self._record_failed_url(failure.request.url)
+            self._record_failed(failure, "trend")
+            self.trend_cache.flush()
             raise CloseSpider("timeout_backoff")
         self.logger.warning("trend request failed for %s: %s", topic, failure.value)
-        pending_items = self.pending.pop(topic, [])
-        for item in pending_items:
-            yield item
+        if self.tiered and topic not in self.escalated:
+            yield from self._handle_tier(topic, None)
+            return
+        # Queued so that a later run fills the trend cache for this topic.
+        self._record_failed(failure, "trend")
+        yield from self._handle_trend(topic, None)
 
     def errback_list(self, failure):
+        self._list_done()
+        # With a ledger the page stays unfinished there and is re-scheduled
+        # on the next run; the retry queue is only for runs without one.
+        window = self._window_of(failure.request) if self.ledger is not None else None
         if failure.check(TimeoutError):
-            self._record_failed_url(failure.request.url)
+            if window is None:
+                self._record_failed(failure, "list")
+            self.trend_cache.flush()
             raise CloseSpider("timeout_backoff")
         self.logger.warning("list request failed: %s", failure.value)
-        self._record_failed_url(failure.request.url)
-
-    def _record_failed_url(self, url: str) -> None:
-        os.makedirs(os.path.dirname(self.failed_urls_path) or ".", exist_ok=True)
-        with open(self.failed_urls_path, "a", encoding="utf-8") as f:
-            f.write(url + "\n")
-
-    def _build_item(self, row: dict) -> WeiboHotItem:
-        keyword = row.get("topic") or row.get("title") or row.get("word") or row.get("name")
-        last_exists = row.get("updateTime") or row.get("date") or row.get("createTime")
-
-        item = WeiboHotItem()
-        item["keyword"] = keyword
-        item["rank_peak"] = row.get("pm")
-        item["hot_value"] = row.get("hotNumber") or row.get("hotValue")
-        item["last_exists_time"] = last_exists
-        item["durations"] = row.get("durations")
-        item["host_name"] = row.get("screenName")
-        item["category"] = row.get("fenlei")
-        item["location"] = row.get("location")
-        item["icon"] = row.get("icon")
+        if window is None:
+            self._record_failed(failure, "list")
+        else:
+            self.ledger.page_failed(window[0], window[1], failure.request.meta.get("page_no", 1))
+
+    def _spill_pending(self, reason: str) -> None:
+        stats = self.crawler.stats
+        stats.set_value("pending/peak_rows", self.pending.peak)
+        stats.set_value("pending/peak_parked_lists", self.parked_peak)
+        # Queue mode hands unfinished windows back and the ledger re-schedules
+        # unfinished pages, so then only the rows are kept.
+        parked = self.parked_lists if self.work_queue is None and self.ledger is None else ()
+        spilled = self.pending.spill(parked)
+        if self.ledger is not None and self.pending.path:
+            # Rows still waiting are in the spill file now, which the next
+            # run reloads: their pages need not be fetched again.
+            for page, waits in list(self.page_waits.items()):
+                self._page_settled(page, waits[0])
+        if spilled or parked:
+            stats.set_value("pending/spilled_rows", spilled)
+            self.logger.info(
+                "closed (%s) with %d pending rows and %d parked list pages, saved to %s",
+                reason,
+                spilled,
+                len(parked),
+                self.pending.path or "(nowhere: PENDING_SPILL_PATH is empty)",
+            )
+
+    @staticmethod
+    def _build_row(row: dict) -> tuple:
+        # Values in ROW_FIELDS order; the item is only built when it is emitted.
+        return (
+            row.get("topic") or row.get("title") or row.get("word") or row.get("name"),
+            row.get("pm"),
+            row.get("hotNumber") or row.get("hotValue"),
+            row.get("updateTime") or row.get("date") or row.get("createTime"),
+            row.get("durations"),
+            row.get("screenName"),
+            row.get("fenlei"),
+            row.get("location"),
+            row.get("icon"),
+        )
+
+    def _build_item(self, row: tuple) -> WeiboHotItem:
+        item = WeiboHotItem(zip(ROW_FIELDS, row))
         item["trend_first_time"] = None
         item["trend_last_time"] = None
         item["trend_duration_days"] = None
+        item["trend_precision"] = None
+        for field in ANALYTICS_FIELDS:
+            item[field] = None
         return item
 
     def closed(self, reason: str) -> None:
-        if getattr(self, "conn", None):
-            self.conn.commit()
-            self.conn.close()
+        self._spill_pending(reason)
+        if self.work_queue is not None:
+            if self._lease_renew_loop.running:
+                self._lease_renew_loop.stop()
+            if reason == "finished":
+                self._hand_back_windows()
+            else:
+                # Hand unfinished windows straight back instead of waiting
+                # for the lease to expire.
+                self.work_queue.release(self.worker_id, self.leased_windows)
+            self.work_queue.close()
+        if self.ledger is not None:
+            self.ledger.run_finished(reason)
+            for key, value in self.ledger.stats().items():
+                self.crawler.stats.set_value(key, value)
+            self.ledger.close()
+        if self.retry_queue is not None:
+            if self._retry_loop.running:
+                self._retry_loop.stop()
+            for key, value in self.retry_queue.counts().items():
+                self.crawler.stats.set_value(f"retry_queue/{key}_at_close", value)
+            self.retry_queue.close()
+        summary = self.planner.summary()
+        for key, value in summary.items():
+            self.crawler.stats.set_value(key, value)
+        self.logger.info(
+            "date plan: %d window requests (%d bisected) vs %d with daily windows, saved %d",
+            summary["list/window_requests"],
+            summary["list/windows_bisected"],
+            summary["list/daily_plan_window_requests"],
+            summary["list/window_requests_saved"],
+        )
+        loop = getattr(self, "_trend_flush_loop", None)
+        if loop is not None and loop.running:
+            loop.stop()
+        codec = getattr(self, "codec", None)
+        if codec is not None:
+            codec.close()
+            for key, value in codec.stats().items():
+                self.crawler.stats.set_value(key, value)
+        if getattr(self, "trend_cache", None):
+            dropped = self.trend_cache.close()
+            if dropped:
+                self.logger.error(
+                    "trend cache: %d buffered rows dropped, the cache database stayed locked", dropped
+                )
+            for key, value in self.trend_cache.stats().items():
+                self.crawler.stats.set_value(key, value)
+            self.logger.info(
+                "trend cache: %d rows in %d commits, %d/%d lookups hit (%d from other shards)",
+                self.trend_cache.rows_written,
+                self.trend_cache.commits,
+                self.trend_cache.hits,
+                self.trend_cache.lookups,
+                self.trend_cache.cross_hits,
+            )
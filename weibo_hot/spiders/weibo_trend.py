@@ -1,17 +1,24 @@
 from __future__ import annotations
 
-import base64
-import json
 import os
-import sqlite3
-from typing import Dict, Iterable
-from urllib.parse import quote
+import time
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import quote, urlsplit
 
 import scrapy
-from scrapy.exceptions import CloseSpider
+from scrapy import signals
+from scrapy.exceptions import CloseSpider, DontCloseSpider
+from twisted.internet import task
 from twisted.internet.error import TimeoutError, ConnectionRefusedError
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
+
+from weibo_hot.analytics import series_fields
+from weibo_hot.codec import AES_KEY, PayloadCodec
+from weibo_hot.freshness import RefreshPolicy
+from weibo_hot.ledger import CrawlLedger
+from weibo_hot.series import summarize_with_series
+from weibo_hot.trend_cache import TrendCache
+from weibo_hot.trend_stats import TrendSummary, day_level_enough, summarize_lifting, summarize_superinfo
+from weibo_hot.work_queue import WorkQueue
 
 
 class WeiboTrendSpider(scrapy.Spider):
@@ -19,40 +26,83 @@ class WeiboTrendSpider(scrapy.Spider):
     allowed_domains = ["hotengineapi.zhaoyizhe.com", "weibo.zhaoyizhe.com"]
 
     base_url = "https://hotengineapi.zhaoyizhe.com/hotEngineApi"
-    aes_key = b"cce1d5a8d58249048623eb26b8b0ea53"
+    aes_key = AES_KEY
 
     def __init__(self, keywords_file: str = None, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
         self.keywords_file = keywords_file or os.getenv("KEYWORDS_FILE", "output/keywords.txt")
-        self._aes_cipher = AES.new(self.aes_key, AES.MODE_ECB)
-        self.conn = None
+        self.trend_cache = None
         self.trend_source = "superInfo"
         self.skip_success = True
+        self.ledger = None
 
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
         spider = super().from_crawler(crawler, *args, **kwargs)
         spider._init_from_settings(crawler.settings)
+        if spider.work_queue is not None:
+            crawler.signals.connect(spider._on_idle, signal=signals.spider_idle)
         return spider
 
     def _init_from_settings(self, settings):
+        self._apply_base_url(settings)
         self.trend_cache_path = settings.get("TREND_CACHE_PATH", "trend_cache.sqlite")
         self.trend_source = str(settings.get("TREND_SOURCE", "superInfo")).strip()
-        self.skip_success = bool(int(str(settings.get("TREND_SKIP_SUCCESS", "1")).strip()))
-        self.conn = sqlite3.connect(self.trend_cache_path)
-        self.conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS trend_cache_minute (
-                topic TEXT PRIMARY KEY,
-                first_date TEXT,
-                last_date TEXT,
-                duration_minutes INTEGER,
-                points INTEGER,
-                updated_at TEXT
-            )
-            """
+        self.tiered = self.trend_source.lower() == "tiered"
+        self.tier_max_days = int(settings.get("TREND_TIER_MAX_DAYS", 1))
+        # A day-level answer counts as success only in tiered mode.
+        self.success_day_max = self.tier_max_days if self.tiered else 0
+        self.skip_success = settings.getbool("TREND_SKIP_SUCCESS", True)
+        # Cached topics that could still have changed are fetched again.
+        self.refresh = RefreshPolicy.from_settings(settings) if self.skip_success else None
+        self.preload_compact_threshold = int(settings.get("TREND_PRELOAD_COMPACT_THRESHOLD", 1_000_000))
+        self.cache_shared = settings.getbool("TREND_CACHE_SHARED", False)
+        self.codec = PayloadCodec.from_settings(settings, key=self.aes_key)
+        self.store_series = settings.getbool("TREND_STORE_SERIES", True)
+        self.trend_analytics = settings.getbool("TREND_ANALYTICS", True)
+        self.trend_gap_minutes = int(settings.get("TREND_GAP_MINUTES", 10))
+        self.trend_cache = TrendCache(
+            self.trend_cache_path,
+            batch_size=int(settings.get("TREND_CACHE_BATCH_SIZE", 200)),
+            flush_interval=float(settings.get("TREND_CACHE_FLUSH_INTERVAL", 5.0)),
+            writer=settings.get("TREND_CACHE_WRITER", ""),
+        )
+        self._trend_flush_loop = task.LoopingCall(self.trend_cache.flush)
+        self._trend_flush_loop.start(self.trend_cache.flush_interval, now=False)
+        self._init_work_queue(settings)
+        # Only the run outcome is kept; the success index is the resume state.
+        self.ledger = CrawlLedger.from_settings(settings, scope=self.name)
+        if self.ledger is not None:
+            self.ledger.run_started()
+
+    def _apply_base_url(self, settings) -> None:
+        # HOTENGINE_BASE_URL points the spider at a mirror or the local mock server.
+        base_url = settings.get("HOTENGINE_BASE_URL", "")
+        if base_url:
+            self.base_url = base_url.rstrip("/")
+            self.allowed_domains = list(self.allowed_domains) + [urlsplit(self.base_url).hostname]
+
+    def _init_work_queue(self, settings) -> None:
+        self.work_queue = None
+        # Keyword -> queue item ("keyword" or "keyword\tlast_seen").
+        self.leased: Dict[str, str] = {}
+        self.finished: List[str] = []
+        # Leased keywords without a usable answer; handed back at close so
+        # this worker does not lease them again straight away.
+        self.unresolved: List[str] = []
+        path = settings.get("WORK_QUEUE_PATH", "")
+        if not path:
+            return
+        self.work_queue = WorkQueue(
+            path,
+            name=settings.get("WORK_QUEUE_NAME") or "keywords",
+            lease_seconds=float(settings.get("WORK_LEASE_SECONDS", 600)),
         )
-        self.conn.commit()
+        self.worker_id = str(settings.get("WORKER_ID") or os.getpid())
+        self.lease_batch = max(1, int(settings.get("WORK_LEASE_BATCH", 4)))
+        self.max_attempts = max(1, int(settings.get("WORK_MAX_ATTEMPTS", 3)))
+        self._lease_renew_loop = task.LoopingCall(self._renew_leases)
+        self._lease_renew_loop.start(max(1.0, self.work_queue.lease_seconds / 3), now=False)
 
     def _build_headers(self) -> Dict[str, str]:
         headers = {
@@ -73,137 +123,267 @@ class WeiboTrendSpider(scrapy.Spider):
                     break
         return headers
 
-    def _decrypt(self, ciphertext_b64: str) -> str:
-        ciphertext_b64 = ciphertext_b64.strip()
-        if ciphertext_b64.startswith("\"") and ciphertext_b64.endswith("\""):
-            ciphertext_b64 = ciphertext_b64[1:-1]
-        ct = base64.b64decode(ciphertext_b64)
-        pt = unpad(self._aes_cipher.decrypt(ct), 16)
-        return pt.decode("utf-8", "ignore")
-
     def _trend_cache_get(self, topic: str):
-        cur = self.conn.execute(
-            "SELECT first_date, last_date, duration_minutes, points FROM trend_cache_minute WHERE topic=?",
-            (topic,),
-        )
-        row = cur.fetchone()
-        if not row:
-            return None
-        return {
-            "first_date": row[0],
-            "last_date": row[1],
-            "duration_minutes": row[2],
-            "points": row[3],
-        }
+        return self.trend_cache.get(topic)
 
     def _trend_cache_has_success(self, topic: str) -> bool:
-        cached = self._trend_cache_get(topic)
-        if not cached:
-            return False
-        return bool(cached.get("first_date")) and bool(cached.get("last_date"))
+        return self.trend_cache.has_success(topic, day_max=self.success_day_max, refresh=self.refresh)
 
     def _trend_cache_set(self, topic: str, first_date: str, last_date: str, duration_minutes: int, points: int) -> None:
-        self.conn.execute(
-            """
-            INSERT INTO trend_cache_minute (topic, first_date, last_date, duration_minutes, points, updated_at)
-            VALUES (?, ?, ?, ?, ?, datetime('now'))
-            ON CONFLICT(topic) DO UPDATE SET
-                first_date=excluded.first_date,
-                last_date=excluded.last_date,
-                duration_minutes=excluded.duration_minutes,
-                points=excluded.points,
-                updated_at=excluded.updated_at
-            """,
-            (topic, first_date, last_date, duration_minutes, points),
+        self.trend_cache.set(topic, first_date, last_date, duration_minutes, points)
+
+    def _preload_success(self):
+        t0 = time.perf_counter()
+        success = self.trend_cache.load_success_index(
+            self.preload_compact_threshold, day_max=self.success_day_max, refresh=self.refresh
+        )
+        self.logger.info(
+            "preloaded %d successful topics (%s) in %.2fs", len(success), success.kind, time.perf_counter() - t0
+        )
+        return success
+
+    def _is_light(self, heavy: bool) -> bool:
+        return self.trend_source.lower() == "liftingdiagram" or (self.tiered and not heavy)
+
+    def _make_trend_request(self, keyword: str, headers: Dict[str, str], heavy: bool = False) -> scrapy.Request:
+        if self._is_light(heavy):
+            url = f"{self.base_url}/data/liftingDiagram?keyword={quote(keyword)}"
+            if self.tiered:
+                self.crawler.stats.inc_value("trend/tier_light_requests")
+        else:
+            url = f"{self.base_url}/data/superInfo?keyword={quote(keyword)}"
+        return scrapy.Request(
+            url,
+            headers=headers,
+            callback=self.parse_trend,
+            errback=self.errback_trend,
+            meta={"keyword": keyword, "heavy": heavy},
+            dont_filter=True,
         )
-        self.conn.commit()
 
     def start_requests(self) -> Iterable[scrapy.Request]:
         headers = self._build_headers()
+        if self.work_queue is not None:
+            yield from self._lease_keywords()
+            return
+
+        success = self._preload_success() if self.skip_success else None
+        skipped = 0
         with open(self.keywords_file, "r", encoding="utf-8") as f:
             for line in f:
-                keyword = line.strip()
+                # Optional second column: when the list last saw the keyword.
+                keyword, _, last_seen = line.strip().partition("\t")
+                keyword = keyword.strip()
                 if not keyword:
                     continue
-                if self.skip_success and self._trend_cache_has_success(keyword):
+                if success is not None and keyword in success and not self._seen_after_cache(keyword, last_seen):
+                    skipped += 1
                     continue
-                if self.trend_source.lower() == "liftingdiagram":
-                    url = f"{self.base_url}/data/liftingDiagram?keyword={quote(keyword)}"
-                else:
-                    url = f"{self.base_url}/data/superInfo?keyword={quote(keyword)}"
-                yield scrapy.Request(
-                    url,
-                    headers=headers,
-                    callback=self.parse_trend,
-                    errback=self.errback_trend,
-                    meta={"keyword": keyword},
-                    dont_filter=True,
-                )
+                # Start requests are pulled lazily, so with a shared cache
+                # another shard may have resolved the keyword since preload.
+                if self.skip_success and self.cache_shared and self._trend_cache_has_success(keyword):
+                    skipped += 1
+                    continue
+                yield self._make_trend_request(keyword, headers)
+        self.logger.info("skipped %d keywords with a cached trend", skipped)
+        self.crawler.stats.set_value("trend/skipped_cached", skipped)
+
+    def _seen_after_cache(self, keyword: str, last_seen: str) -> bool:
+        if not last_seen or self.refresh is None:
+            return False
+        cached = self._trend_cache_get(keyword)
+        if cached and self.refresh.needs_refresh(cached, last_seen.strip()):
+            self.crawler.stats.inc_value("trend/refreshed")
+            return True
+        return False
+
+    def _renew_leases(self) -> None:
+        if self.leased or self.unresolved:
+            self.work_queue.renew(self.worker_id, [*self.leased.values(), *self.unresolved])
+
+    def _flush_finished(self) -> None:
+        if self.finished:
+            self.work_queue.complete(self.worker_id, self.finished)
+            self.crawler.stats.inc_value("work_queue/keywords_done", len(self.finished))
+            self.finished = []
 
-    def parse_trend(self, response: scrapy.http.Response):
+    def _hand_back_unresolved(self) -> None:
+        if not self.unresolved:
+            return
+        attempts = self.work_queue.attempts(self.unresolved)
+        given_up = [item for item in self.unresolved if attempts.get(item, 0) >= self.max_attempts]
+        retry = [item for item in self.unresolved if attempts.get(item, 0) < self.max_attempts]
+        if given_up:
+            # Otherwise a keyword the API never answers keeps the runner looping.
+            self.logger.warning("giving up on %d keywords after %d leases", len(given_up), self.max_attempts)
+            self.work_queue.complete(self.worker_id, given_up)
+            self.crawler.stats.set_value("work_queue/keywords_given_up", len(given_up))
+        self.work_queue.release(self.worker_id, retry)
+        self.crawler.stats.set_value("work_queue/keywords_released", len(retry))
+        self.unresolved = []
+
+    def _lease_keywords(self) -> List[scrapy.Request]:
+        self._flush_finished()
+        headers = self._build_headers()
+        requests = []
+        # Keep leasing until we have real work: shared-cache hits are done
+        # immediately and do not occupy a download slot.
+        while not requests:
+            items = self.work_queue.lease(self.worker_id, self.lease_batch)
+            if not items:
+                break
+            for item in items:
+                keyword, _, last_seen = item.partition("\t")
+                if (
+                    self.skip_success
+                    and self._trend_cache_has_success(keyword)
+                    and not self._seen_after_cache(keyword, last_seen)
+                ):
+                    self.finished.append(item)
+                    self.crawler.stats.inc_value("trend/skipped_cached")
+                    continue
+                self.leased[keyword] = item
+                requests.append(self._make_trend_request(keyword, headers))
+            self._flush_finished()
+        return requests
+
+    def _keyword_finished(self, keyword: str, resolved: bool = True) -> Iterable[scrapy.Request]:
+        if self.work_queue is None or keyword not in self.leased:
+            return []
+        (self.finished if resolved else self.unresolved).append(self.leased.pop(keyword))
+        # Top up before the batch drains so download slots never sit idle.
+        if len(self.leased) <= self.lease_batch // 2:
+            return self._lease_keywords()
+        return []
+
+    def _on_idle(self, spider=None) -> None:
+        requests = self._lease_keywords()
+        if not requests:
+            return
+        for request in requests:
+            self.crawler.engine.crawl(request)
+        raise DontCloseSpider
+
+    async def parse_trend(self, response: scrapy.http.Response):
         keyword = response.meta.get("keyword")
+        want_series = False
+        light = self._is_light(response.meta.get("heavy", False))
+        if light:
+            summarize = summarize_lifting
+        elif self.store_series or self.trend_analytics:
+            summarize = summarize_with_series
+            want_series = True
+        else:
+            summarize = summarize_superinfo
+        try:
+            summary = await self.codec.decode_async(response.body, reduce=summarize)
+        except Exception as exc:
+            self.logger.warning("trend decode failed for %s: %s", keyword, exc)
+            self.crawler.stats.inc_value("trend/decode_failed")
+            summary = None
+        fields = None
+        if want_series and summary is not None:
+            summary, series = summary
+            if keyword and series is not None and self.store_series:
+                self.trend_cache.set_series(keyword, series, summary.points)
+            if self.trend_analytics:
+                fields = series_fields(series, self.trend_gap_minutes)
+        if self.tiered and light:
+            for result in self._handle_tier(keyword, summary):
+                yield result
+            return
+        for result in self._parse_trend(keyword, summary, fields, "day" if light else "minute"):
+            yield result
+        for request in self._keyword_finished(keyword, summary is not None and summary.code == 1):
+            yield request
+
+    def _handle_tier(self, keyword: str, summary: Optional[TrendSummary]):
         if not keyword:
             return
-        try:
-            payload = json.loads(self._decrypt(response.text))
-        except Exception:
+        if summary is not None and summary.code == 1 and summary.first and summary.last:
+            self.trend_cache.set_day(keyword, summary.first, summary.last, summary.distinct, summary.points)
+        if day_level_enough(summary, self.tier_max_days):
+            self.crawler.stats.inc_value("trend/heavy_avoided")
+            yield from self._parse_trend(keyword, summary, precision="day")
+            yield from self._keyword_finished(keyword, summary is not None and summary.code == 1)
             return
-        if payload.get("code") != 1:
+        self.crawler.stats.inc_value("trend/tier_escalated")
+        yield self._make_trend_request(keyword, self._build_headers(), heavy=True)
+
+    def _parse_trend(
+        self,
+        keyword: str,
+        summary: Optional[TrendSummary],
+        fields: Optional[dict] = None,
+        precision: str = "minute",
+    ):
+        if not keyword or summary is None:
             return
-        data = payload.get("data", []) or []
-
-        if self.trend_source.lower() == "liftingdiagram":
-            dates = set()
-            first_time = None
-            last_time = None
-            for d in data:
-                if not isinstance(d, dict):
-                    continue
-                t = d.get("date")
-                if not t:
-                    continue
-                t = str(t)
-                dates.add(t)
-                if first_time is None or t < first_time:
-                    first_time = t
-                if last_time is None or t > last_time:
-                    last_time = t
-            duration_value = len(dates)
-        else:
-            seen = set()
-            first_time = None
-            last_time = None
-            for d in data:
-                if not isinstance(d, dict):
-                    continue
-                value = d.get("value")
-                if not isinstance(value, list) or not value:
-                    continue
-                t = str(value[0])
-                seen.add(t)
-                if first_time is None or t < first_time:
-                    first_time = t
-                if last_time is None or t > last_time:
-                    last_time = t
-            duration_value = len(seen)
-
-        if first_time and last_time:
+        if summary.code != 1:
+            return
+
+        first_time, last_time, duration_value = summary.first, summary.last, summary.distinct
+        # Tiered day-level answers are cached in trend_cache_day by _handle_tier.
+        if first_time and last_time and not (self.tiered and precision == "day"):
             self._trend_cache_set(keyword, first_time, last_time, duration_value, duration_value)
 
-        yield {
+        item = {
             "keyword": keyword,
             "trend_first_time": first_time,
             "trend_last_time": last_time,
             "trend_duration_days": duration_value,
+            "trend_precision": precision,
         }
+        if fields:
+            item.update(fields)
+        yield item
 
     def errback_trend(self, failure):
-        if failure.check(TimeoutError):
-            raise CloseSpider("timeout_backoff")
-        if failure.check(ConnectionRefusedError):
-            raise CloseSpider("conn_refused_backoff")
+        meta = failure.request.meta
+        if failure.check(TimeoutError, ConnectionRefusedError):
+            # Handed back at close like any failed keyword, so a keyword that
+            # always times out still runs into WORK_MAX_ATTEMPTS.
+            if self.work_queue is not None and meta.get("keyword") in self.leased:
+                self.unresolved.append(self.leased.pop(meta["keyword"]))
+            self.trend_cache.flush()
+            raise CloseSpider("timeout_backoff" if failure.check(TimeoutError) else "conn_refused_backoff")
+        if self.tiered and not meta.get("heavy") and meta.get("keyword"):
+            yield from self._handle_tier(meta["keyword"], None)
+            return
+        yield from self._keyword_finished(meta.get("keyword"), resolved=False)
 
     def closed(self, reason: str) -> None:
-        if self.conn is not None:
-            self.conn.commit()
-            self.conn.close()
+        if self.ledger is not None:
+            self.ledger.run_finished(reason)
+            self.ledger.close()
+        if self.work_queue is not None:
+            if self._lease_renew_loop.running:
+                self._lease_renew_loop.stop()
+            self._flush_finished()
+            self._hand_back_unresolved()
+            self.work_queue.release(self.worker_id, self.leased.values())
+            self.work_queue.close()
+        codec = getattr(self, "codec", None)
+        if codec is not None:
+            codec.close()
+            for key, value in codec.stats().items():
+                self.crawler.stats.set_value(key, value)
+        loop = getattr(self, "_trend_flush_loop", None)
+        if loop is not None and loop.running:
+            loop.stop()
+        if self.trend_cache is not None:
+            dropped = self.trend_cache.close()
+            if dropped:
+                self.logger.error(
+                    "trend cache: %d buffered rows dropped, the cache database stayed locked", dropped
+                )
+            for key, value in self.trend_cache.stats().items():
+                self.crawler.stats.set_value(key, value)
+            self.logger.info(
+                "trend cache: %d rows in %d commits, %d/%d lookups hit (%d from other shards)",
+                self.trend_cache.rows_written,
+                self.trend_cache.commits,
+                self.trend_cache.hits,
+                self.trend_cache.lookups,
+                self.trend_cache.cross_hits,
+            )
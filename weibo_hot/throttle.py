@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from scrapy.extensions.throttle import AutoThrottle
+
+from weibo_hot.endpoints import endpoint_slots
+
+
+class EndpointAutoThrottle(AutoThrottle):
+    """AutoThrottle with its own bounds for the list and trend slots.
+
+    A configured slot adapts between its ``delay`` and ``max_delay`` towards
+    ``latency / target_concurrency``, so trend latency never feeds the list
+    slot's delay or the other way round. Slots that are not configured are
+    throttled like stock AutoThrottle.
+    """
+
+    def __init__(self, crawler) -> None:
+        super().__init__(crawler)
+        settings = crawler.settings
+        self.slot_settings = endpoint_slots(settings) if settings.getbool("ENDPOINT_SLOTS_ENABLED", True) else {}
+
+    def _response_downloaded(self, response, request, spider) -> None:
+        key = request.meta.get("download_slot")
+        conf = self.slot_settings.get(key)
+        if conf is None:
+            return super()._response_downloaded(response, request, spider)
+        slot = self.crawler.engine.downloader.slots.get(key)
+        latency = request.meta.get("download_latency")
+        if latency is None or slot is None or request.meta.get("autothrottle_dont_adjust_delay", False):
+            return
+
+        target_delay = latency / float(conf.get("target_concurrency", self.target_concurrency))
+        new_delay = max(target_delay, (slot.delay + target_delay) / 2.0)
+        new_delay = min(max(float(conf.get("delay", self.mindelay)), new_delay), float(conf.get("max_delay", self.maxdelay)))
+        if response.status != 200 and new_delay <= slot.delay:
+            return
+        slot.delay = new_delay
+        self.crawler.stats.max_value(f"throttle/{key}/max_delay", round(new_delay, 3))
@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from weibo_hot.freshness import RefreshPolicy
+
+
+def connect(path: str, timeout: float = 30.0) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=timeout)
+    # WAL lets readers proceed while a batch is being written; NORMAL sync
+    # only fsyncs at checkpoints instead of on every commit.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _topic_hash(topic: str) -> int:
+    return int.from_bytes(hashlib.blake2b(topic.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class SuccessIndex:
+    """Read-only membership index of topics that already have a trend.
+
+    Small sets are kept as a plain ``set``; above ``compact_threshold`` the
+    index is a sorted ``array('Q')`` of 64-bit topic hashes (8 bytes per
+    topic) probed with binary search.
+    """
+
+    def __init__(self, topics: Iterable[str], size_hint: int = 0, compact_threshold: int = 1_000_000) -> None:
+        if size_hint > compact_threshold:
+            self.kind = "sorted-hash"
+            hashes = array("Q", (_topic_hash(t) for t in topics))
+            self._hashes = array("Q", sorted(hashes))
+            self._set = None
+        else:
+            self.kind = "set"
+            self._hashes = None
+            self._set = set(topics)
+
+    def __len__(self) -> int:
+        if self._set is not None:
+            return len(self._set)
+        return len(self._hashes)
+
+    def __contains__(self, topic: str) -> bool:
+        if self._set is not None:
+            return topic in self._set
+        h = _topic_hash(topic)
+        i = bisect_left(self._hashes, h)
+        return i < len(self._hashes) and self._hashes[i] == h
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def ensure_column(conn: sqlite3.Connection, table: str, column: str, decl: str) -> None:
+    """Add ``column`` to a table from an older file.
+
+    Shards may open the same old file at once, so the check is repeated
+    under the write lock and a column another process just added counts.
+    """
+    if column in _columns(conn, table):
+        return
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if column not in _columns(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    except sqlite3.OperationalError as exc:
+        if "duplicate column name" not in str(exc):
+            conn.rollback()
+            raise
+    conn.commit()
+
+
+class TrendCache:
+    """Write-behind cache over the ``trend_cache_minute`` table.
+
+    Upserts are buffered in memory and written in one transaction once
+    ``batch_size`` rows are pending or ``flush()`` is called (spiders call it
+    on a timer and on close). Reads see buffered rows first.
+
+    Several shard processes may share one file: WAL plus the busy timeout
+    serialises their batches, and a batch that still hits a lock stays
+    buffered for the next flush. ``writer`` tags rows with the shard that
+    fetched them so hits on another shard's rows can be counted.
+
+    Full minute series, when kept, go to ``trend_series`` in the same
+    transactions as their summary rows. Day-level liftingDiagram results of
+    the tiered trend mode go to ``trend_cache_day``, so they never pass for
+    minute-level rows.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 200,
+        flush_interval: float = 5.0,
+        writer: str = "",
+        busy_timeout: float = 30.0,
+    ) -> None:
+        self.path = path
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.writer = str(writer or "")
+        self.commits = 0
+        self.rows_written = 0
+        self.lookups = 0
+        self.hits = 0
+        self.cross_hits = 0
+        self._buffer: Dict[str, Tuple] = {}
+        self._series_buffer: Dict[str, Tuple] = {}
+        self._day_buffer: Dict[str, Tuple] = {}
+        self.day_rows_written = 0
+        self.series_written = 0
+        self.series_bytes = 0
+        self.rows_dropped = 0
+        self.conn = connect(path, timeout=busy_timeout)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS trend_cache_minute (
+                topic TEXT PRIMARY KEY,
+                first_date TEXT,
+                last_date TEXT,
+                duration_minutes INTEGER,
+                points INTEGER,
+                updated_at TEXT,
+                writer TEXT
+            )
+            """
+        )
+        # Files from before shards shared the cache have no writer column.
+        ensure_column(self.conn, "trend_cache_minute", "writer", "TEXT")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS trend_series (
+                topic TEXT PRIMARY KEY,
+                points INTEGER,
+                series BLOB,
+                updated_at TEXT,
+                writer TEXT
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS trend_cache_day (
+                topic TEXT PRIMARY KEY,
+                first_date TEXT,
+                last_date TEXT,
+                days INTEGER,
+                points INTEGER,
+                updated_at TEXT,
+                writer TEXT
+            )
+            """
+        )
+        self.conn.commit()
+
+    def get(self, topic: str) -> Optional[Dict[str, object]]:
+        self.lookups += 1
+        row = self._buffer.get(topic)
+        if row is not None:
+            row = row[1:]
+        else:
+            row = self.conn.execute(
+                "SELECT first_date, last_date, duration_minutes, points, updated_at, writer "
+                "FROM trend_cache_minute WHERE topic=?",
+                (topic,),
+            ).fetchone()
+        if not row:
+            return None
+        self.hits += 1
+        # Unsharded runs (and rows from before the writer column) are nobody's shard.
+        if self.writer and row[5] and row[5] != self.writer:
+            self.cross_hits += 1
+        return {
+            "first_date": row[0],
+            "last_date": row[1],
+            "duration_minutes": row[2],
+            "points": row[3],
+            "updated_at": row[4],
+            "writer": row[5],
+        }
+
+    def get_day(self, topic: str) -> Optional[Dict[str, object]]:
+        row = self._day_buffer.get(topic)
+        if row is not None:
+            row = row[1:]
+        else:
+            row = self.conn.execute(
+                "SELECT first_date, last_date, days, points, updated_at, writer FROM trend_cache_day WHERE topic=?",
+                (topic,),
+            ).fetchone()
+        if not row:
+            return None
+        return {
+            "first_date": row[0],
+            "last_date": row[1],
+            "days": row[2],
+            "points": row[3],
+            "updated_at": row[4],
+            "writer": row[5],
+        }
+
+    def has_success(self, topic: str, day_max: int = 0, refresh: Optional[RefreshPolicy] = None) -> bool:
+        """A minute-level trend, or with ``day_max`` a day-level one spanning at most that many days.
+
+        With ``refresh``, a minute-level row that could still change does not count.
+        """
+        cached = self.get(topic)
+        if cached and cached.get("first_date") and cached.get("last_date"):
+            return refresh is None or not refresh.needs_refresh(cached)
+        if day_max <= 0:
+            return False
+        day = self.get_day(topic)
+        return bool(day) and 0 < (day["days"] or 0) <= day_max
+
+    def load_success_index(
+        self,
+        compact_threshold: int = 1_000_000,
+        day_max: int = 0,
+        refresh: Optional[RefreshPolicy] = None,
+    ) -> SuccessIndex:
+        self.flush()
+        where = "first_date IS NOT NULL AND first_date != '' AND last_date IS NOT NULL AND last_date != ''"
+        params: Tuple = ()
+        if refresh is not None:
+            settled, params = refresh.settled_sql()
+            where = f"{where} AND {settled}"
+        query = f"SELECT topic FROM trend_cache_minute WHERE {where}"
+        if day_max > 0:
+            query += " UNION SELECT topic FROM trend_cache_day WHERE days > 0 AND days <= ?"
+            params = params + (day_max,)
+        count = self.conn.execute(f"SELECT COUNT(*) FROM ({query})", params).fetchone()[0]
+        cur = self.conn.execute(query, params)
+        return SuccessIndex((row[0] for row in cur), size_hint=count, compact_threshold=compact_threshold)
+
+    def set(self, topic: str, first_date: str, last_date: str, duration_minutes: int, points: int) -> None:
+        updated_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        self._buffer[topic] = (topic, first_date, last_date, duration_minutes, points, updated_at, self.writer)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def set_series(self, topic: str, series: bytes, points: int) -> None:
+        """Buffer the packed minute series of ``topic`` (see ``weibo_hot.series``)."""
+        updated_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        self._series_buffer[topic] = (topic, points, series, updated_at, self.writer)
+        if len(self._series_buffer) >= self.batch_size:
+            self.flush()
+
+    def set_day(self, topic: str, first_date: str, last_date: str, days: int, points: int) -> None:
+        updated_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        self._day_buffer[topic] = (topic, first_date, last_date, days, points, updated_at, self.writer)
+        if len(self._day_buffer) >= self.batch_size:
+            self.flush()
+
+    def get_series(self, topic: str) -> Optional[bytes]:
+        row = self._series_buffer.get(topic)
+        if row is not None:
+            return row[2]
+        row = self.conn.execute("SELECT series FROM trend_series WHERE topic=?", (topic,)).fetchone()
+        return row[0] if row else None
+
+    def flush(self) -> int:
+        if not self._buffer and not self._series_buffer and not self._day_buffer:
+            return 0
+        rows = list(self._buffer.values())
+        series = list(self._series_buffer.values())
+        days = list(self._day_buffer.values())
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO trend_series (topic, points, series, updated_at, writer) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    series,
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO trend_cache_day "
+                    "(topic, first_date, last_date, days, points, updated_at, writer) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    days,
+                )
+                self.conn.executemany(
+                    """
+                    INSERT INTO trend_cache_minute
+                        (topic, first_date, last_date, duration_minutes, points, updated_at, writer)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(topic) DO UPDATE SET
+                        first_date=excluded.first_date,
+                        last_date=excluded.last_date,
+                        duration_minutes=excluded.duration_minutes,
+                        points=excluded.points,
+                        updated_at=excluded.updated_at,
+                        writer=excluded.writer
+                    """,
+                    rows,
+                )
+        except sqlite3.OperationalError as exc:
+            if "locked" not in str(exc) and "busy" not in str(exc):
+                raise
+            # Another shard held the write lock past the busy timeout; keep
+            # the rows buffered and retry on the next flush.
+            return 0
+        self._buffer.clear()
+        self._series_buffer.clear()
+        self._day_buffer.clear()
+        self.commits += 1
+        self.day_rows_written += len(days)
+        self.rows_written += len(rows)
+        self.series_written += len(series)
+        self.series_bytes += sum(len(row[2]) for row in series)
+        return len(rows)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "trend_cache/lookups": self.lookups,
+            "trend_cache/hits": self.hits,
+            "trend_cache/cross_shard_hits": self.cross_hits,
+            "trend_cache/cross_shard_hit_rate": round(self.cross_hits / self.lookups, 4) if self.lookups else 0.0,
+            "trend_cache/rows_written": self.rows_written,
+            "trend_cache/commits": self.commits,
+            "trend_cache/series_written": self.series_written,
+            "trend_cache/series_bytes": self.series_bytes,
+            "trend_cache/day_rows_written": self.day_rows_written,
+            "trend_cache/rows_dropped": self.rows_dropped,
+        }
+
+    def close(self, attempts: int = 5, final_busy_timeout: float = 300.0) -> int:
+        """Flush and close; returns the number of buffered rows that could not be written."""
+        if self.conn is None:
+            return 0
+        try:
+            for _ in range(attempts):
+                self.flush()
+                if not self.pending_rows():
+                    break
+            if self.pending_rows():
+                # Last chance: wait much longer for the other shards' writes.
+                self.conn.execute(f"PRAGMA busy_timeout={int(final_busy_timeout * 1000)}")
+                self.flush()
+            self.rows_dropped += self.pending_rows()
+        finally:
+            self.conn.close()
+            self.conn = None
+        return self.rows_dropped
+
+    def pending_rows(self) -> int:
+        return len(self._buffer) + len(self._series_buffer) + len(self._day_buffer)
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import Callable, NamedTuple, Optional
+
+from weibo_hot.codec import Buffer
+
+# An unescaped '"key":' can only be an object key, never string content, so
+# these patterns find fields without decoding the surrounding JSON. "code"
+# must be the payload's first key, otherwise the first match could be nested.
+_CODE_RE = re.compile(rb'\s*\{\s*"code"\s*:\s*(-?\d+)')
+_MESSAGE_RE = re.compile(rb'"message"\s*:\s*"((?:[^"\\]|\\.)*)"')
+# value[0] is normally a quoted timestamp; a bare integer is taken as is,
+# like the str(value[0]) of the JSON path.
+_MINUTE_RE = re.compile(rb'"value"\s*:\s*\[\s*(?:"([^"\\]*)"|(-?\d+)\s*[,\]])')
+_DAY_RE = re.compile(rb'"date"\s*:\s*"([^"\\]+)"')
+
+
+class TrendSummary(NamedTuple):
+    code: Optional[int]
+    message: Optional[str]
+    first: Optional[str]
+    last: Optional[str]
+    distinct: int
+    points: int
+
+
+def _minute_of(entry: dict) -> Optional[str]:
+    value = entry.get("value")
+    return str(value[0]) if isinstance(value, list) and value else None
+
+
+def _day_of(entry: dict) -> Optional[str]:
+    t = entry.get("date")
+    return str(t) if t else None
+
+
+def _summarize_json(plaintext: Buffer, field: Callable[[dict], Optional[str]]) -> TrendSummary:
+    """Slow path: decode the payload and read ``field`` of every data entry."""
+    payload = json.loads(bytes(plaintext))
+    if not isinstance(payload, dict):
+        return TrendSummary(None, None, None, None, 0, 0)
+    code = payload.get("code")
+    code = code if isinstance(code, int) else None
+    if code != 1:
+        message = payload.get("message")
+        return TrendSummary(code, str(message) if message is not None else None, None, None, 0, 0)
+    values = [field(d) for d in payload.get("data") or [] if isinstance(d, dict)]
+    values = [t for t in values if t is not None]
+    seen = set(values)
+    if not seen:
+        return TrendSummary(code, None, None, None, 0, 0)
+    return TrendSummary(code, None, min(seen), max(seen), len(seen), len(values))
+
+
+def _scan(plaintext: Buffer, pattern: re.Pattern, field: Callable[[dict], Optional[str]]) -> TrendSummary:
+    m = _CODE_RE.match(plaintext)
+    if m is None:
+        return _summarize_json(plaintext, field)
+    code = int(m.group(1))
+    message = None
+    if code != 1:
+        m = _MESSAGE_RE.search(plaintext)
+        message = json.loads(b'"' + m.group(1) + b'"') if m else None
+        return TrendSummary(code, message, None, None, 0, 0)
+
+    # Series come back in time order, so one pass that only remembers the
+    # previous timestamp is enough. Anything out of order falls back to a
+    # second pass with a set.
+    first = last = prev = None
+    distinct = points = 0
+    ordered = True
+    for m in pattern.finditer(plaintext):
+        t = m.group(m.lastindex)
+        points += 1
+        if prev is None:
+            first = last = t
+            distinct = 1
+        elif t > prev:
+            last = t
+            distinct += 1
+        elif t < prev:
+            ordered = False
+            break
+        prev = t
+    if not ordered:
+        values = [m.group(m.lastindex) for m in pattern.finditer(plaintext)]
+        seen = set(values)
+        first, last, distinct, points = min(seen), max(seen), len(seen), len(values)
+    if not points:
+        # Nothing the patterns recognise (another layout); let the JSON path decide.
+        return _summarize_json(plaintext, field)
+    return TrendSummary(
+        code,
+        message,
+        first.decode("utf-8") if first is not None else None,
+        last.decode("utf-8") if last is not None else None,
+        distinct,
+        points,
+    )
+
+
+def summarize_superinfo(plaintext: Buffer) -> TrendSummary:
+    """First/last minute and distinct minute count of a superInfo payload."""
+    return _scan(plaintext, _MINUTE_RE, _minute_of)
+
+
+def summarize_lifting(plaintext: Buffer) -> TrendSummary:
+    """First/last day and distinct day count of a liftingDiagram payload."""
+    return _scan(plaintext, _DAY_RE, _day_of)
+
+
+def day_level_enough(summary: Optional[TrendSummary], max_days: int) -> bool:
+    """Whether a liftingDiagram summary can stand in for superInfo.
+
+    Only a clean answer spanning at most ``max_days`` days qualifies; errors,
+    empty series and longer topics need the minute-level endpoint.
+    """
+    return summary is not None and summary.code == 1 and bool(summary.first) and 0 < summary.distinct <= max_days
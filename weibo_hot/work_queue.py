@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import time
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from weibo_hot.paging import format_window, iter_windows
+from weibo_hot.trend_cache import connect
+
+
+class WorkQueue:
+    """Lease-based work queue in SQLite, shared by worker processes.
+
+    Items are opaque strings. A worker leases a batch, renews the lease
+    while it works and marks items done; items whose lease expired (the
+    worker died) are handed out again to whoever asks next.
+    """
+
+    def __init__(self, path: str, name: str = "work", lease_seconds: float = 600.0) -> None:
+        self.path = path
+        self.name = name
+        self.lease_seconds = float(lease_seconds)
+        self.conn = connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS work_queue (
+                queue TEXT NOT NULL,
+                item TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (queue, item)
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS work_queue_status ON work_queue (queue, status)")
+        self.conn.commit()
+
+    def add(self, items: Iterable[str]) -> int:
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO work_queue (queue, item) VALUES (?, ?)",
+                ((self.name, item) for item in items),
+            )
+        return self.conn.total_changes - before
+
+    def reset(self) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM work_queue WHERE queue=?", (self.name,))
+
+    def lease(self, owner: str, n: int = 1) -> List[str]:
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute(
+                """
+                SELECT item FROM work_queue
+                WHERE queue=? AND (status='pending' OR (status='leased' AND lease_until < ?))
+                ORDER BY rowid LIMIT ?
+                """,
+                (self.name, now, int(n)),
+            ).fetchall()
+            items = [row[0] for row in rows]
+            self.conn.executemany(
+                """
+                UPDATE work_queue SET status='leased', owner=?, lease_until=?, attempts=attempts+1
+                WHERE queue=? AND item=?
+                """,
+                ((owner, now + self.lease_seconds, self.name, item) for item in items),
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return items
+
+    def renew(self, owner: str, items: Iterable[str]) -> None:
+        until = time.time() + self.lease_seconds
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE work_queue SET lease_until=? WHERE queue=? AND item=? AND owner=? AND status='leased'",
+                ((until, self.name, item, owner) for item in items),
+            )
+
+    def complete(self, owner: str, items: Iterable[str]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE work_queue SET status='done', lease_until=NULL WHERE queue=? AND item=? AND owner=?",
+                ((self.name, item, owner) for item in items),
+            )
+
+    def release(self, owner: str, items: Iterable[str]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                """
+                UPDATE work_queue SET status='pending', owner=NULL, lease_until=NULL
+                WHERE queue=? AND item=? AND owner=? AND status='leased'
+                """,
+                ((self.name, item, owner) for item in items),
+            )
+
+    def attempts(self, items: Iterable[str]) -> Dict[str, int]:
+        """How many times each item has been leased."""
+        result = {}
+        for item in items:
+            row = self.conn.execute(
+                "SELECT attempts FROM work_queue WHERE queue=? AND item=?", (self.name, item)
+            ).fetchone()
+            result[item] = row[0] if row else 0
+        return result
+
+    def counts(self) -> Dict[str, int]:
+        rows = self.conn.execute(
+            "SELECT status, COUNT(*) FROM work_queue WHERE queue=? GROUP BY status", (self.name,)
+        ).fetchall()
+        return {status: n for status, n in rows}
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def fill_window_queue(path: str, start: date, end: date, days: int) -> Tuple[WorkQueue, int]:
+    """Queue ``days``-day windows covering start..end; returns the queue and how many were new."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    queue = WorkQueue(path, name="windows")
+    added = queue.add(format_window(s, e) for s, e in iter_windows(start, end, days))
+    return queue, added